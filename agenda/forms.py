@@ -2,8 +2,23 @@ from django import forms
 from .models import Cita
 from casos.models import Participante
 from django.utils import timezone
+from .utils import DURACION_MAXIMA, FRECUENCIAS, MAXIMO_REPETICIONES, conflictos_bloques, expandir_recurrencia
 
 class CitaForm(forms.ModelForm):
+    # Serie de citas (seguimientos semanales, audiencias periódicas): se expande al validar
+    repetir = forms.ChoiceField(
+        choices=[('', 'No se repite'), ('semanal', 'Cada semana'), ('quincenal', 'Cada dos semanas')],
+        required=False, widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    repetir_hasta = forms.DateField(
+        required=False, label='Hasta el',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'})
+    )
+    repeticiones = forms.IntegerField(
+        required=False, min_value=2, max_value=MAXIMO_REPETICIONES, label='N° de citas',
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'placeholder': 'Ej: 8'})
+    )
+
     class Meta:
         model = Cita
         fields = ['persona_atendida', 'tipo', 'fecha_hora', 'duracion', 'lugar', 'observaciones']
@@ -25,6 +40,7 @@ class CitaForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         self.causa = kwargs.pop('causa', None)
+        self.responsable = kwargs.pop('responsable', None)
         super().__init__(*args, **kwargs)
 
         if self.causa:
@@ -40,4 +56,47 @@ class CitaForm(forms.ModelForm):
             if fecha_ingresada < timezone.now():
                 raise forms.ValidationError("No se pueden agendar citas en el pasado.")
         
-        return fecha_ingresada
\ No newline at end of file
+        return fecha_ingresada
+
+    def clean_duracion(self):
+        duracion = self.cleaned_data.get('duracion')
+        if duracion is not None and not 0 < duracion <= DURACION_MAXIMA:
+            raise forms.ValidationError(f"La duración debe estar entre 1 y {DURACION_MAXIMA} minutos.")
+        return duracion
+
+    def clean(self):
+        cleaned_data = super().clean()
+        fecha_hora = cleaned_data.get('fecha_hora')
+        duracion = cleaned_data.get('duracion')
+        self.ocurrencias = [fecha_hora] if fecha_hora else []
+        if not fecha_hora or not duracion:
+            return cleaned_data
+
+        frecuencia = cleaned_data.get('repetir')
+        if frecuencia in FRECUENCIAS:
+            hasta = cleaned_data.get('repetir_hasta')
+            repeticiones = cleaned_data.get('repeticiones')
+            if not hasta and not repeticiones:
+                raise forms.ValidationError("Indica hasta qué fecha o cuántas veces se repite la cita.")
+            if hasta and hasta < timezone.localtime(fecha_hora).date():
+                raise forms.ValidationError("La fecha de término de la serie es anterior a la primera cita.")
+            self.ocurrencias = expandir_recurrencia(fecha_hora, frecuencia, hasta, repeticiones)
+
+        # Topes de toda la serie en una sola consulta: otra cita del mismo responsable,
+        # o una audiencia en el mismo tribunal
+        tribunal = None
+        if cleaned_data.get('tipo') == 'audiencia' and self.causa and self.causa.tribunal_id:
+            tribunal = self.causa.tribunal_id
+        topes = conflictos_bloques([(f, duracion) for f in self.ocurrencias], responsable=self.responsable,
+                                   tribunal=tribunal, excluir=self.instance.pk)
+        if topes:
+            detalle = ", ".join(
+                f"{c.get_tipo_display()} {timezone.localtime(c.fecha_hora).strftime('%d/%m/%Y %H:%M')} ({c.causa.rol_rit})"
+                for c in list({c.pk: c for citas in topes.values() for c in citas}.values())[:3]
+            )
+            if len(self.ocurrencias) > 1:
+                raise forms.ValidationError(
+                    f"{len(topes)} de las {len(self.ocurrencias)} citas de la serie chocan con otras citas: {detalle}."
+                )
+            raise forms.ValidationError(f"El horario choca con otras citas: {detalle}.")
+        return cleaned_data
@@ -0,0 +1,155 @@
+"""
+Feed iCalendar (.ics) de la agenda de cada usuario.
+
+La URL lleva un token firmado en vez de sesión (los clientes de calendario no
+inician sesión). El token incluye el hash de la contraseña: al cambiarla, los
+feeds anteriores dejan de funcionar.
+
+Sincronización incremental: cada respuesta trae un sync token (X-Sync-Token y la
+propiedad X-CLINICA-SYNC-TOKEN del calendario). Pedir el feed con ?desde=<token>
+devuelve solo las citas modificadas desde entonces. Las citas canceladas se
+informan con STATUS:CANCELLED, así que el cliente las puede retirar por UID.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from .utils import citas_visibles
+
+SAL_FEED = 'agenda.ics.feed'
+
+# Las citas guardadas en transacciones que confirmaron tarde pueden tener un actualizado_en
+# algo anterior al último sync token: se repite este margen (el cliente deduplica por UID)
+MARGEN_SINCRONIZACION = timedelta(minutes=2)
+
+LOTE_ITERACION = 500
+
+
+# --- Token del feed ---
+
+def _firma(usuario):
+    return salted_hmac(SAL_FEED, f"{usuario.pk}:{usuario.password}").hexdigest()[:32]
+
+
+def token_feed(usuario):
+    return f"{usuario.pk}.{_firma(usuario)}"
+
+
+def usuario_del_token(token):
+    """Usuario dueño del token, o None si el token no es válido."""
+    pk, _, firma = token.partition('.')
+    if not pk.isdigit():
+        return None
+    usuario = get_user_model().objects.filter(pk=pk, is_active=True).first()
+    if usuario is None or not constant_time_compare(firma, _firma(usuario)):
+        return None
+    return usuario
+
+
+# --- Sync token ---
+
+def codificar_sync_token(momento):
+    return str(int(momento.timestamp() * 1_000_000)) if momento else '0'
+
+
+def decodificar_sync_token(token):
+    """Momento desde el que hay que informar cambios (None: feed completo)."""
+    try:
+        microsegundos = int(token)
+    except (TypeError, ValueError):
+        return None
+    if microsegundos <= 0:
+        return None
+    return datetime.fromtimestamp(microsegundos / 1_000_000, tz=dt_timezone.utc) - MARGEN_SINCRONIZACION
+
+
+def estado_feed(usuario):
+    """(cantidad de citas, última modificación): cambia con cualquier alta, edición o baja visible."""
+    resumen = citas_visibles(usuario).aggregate(cantidad=Count('id'), ultima=Max('actualizado_en'))
+    return resumen['cantidad'], resumen['ultima']
+
+
+# --- Formato iCalendar (RFC 5545) ---
+
+def _escapar(texto):
+    return (
+        (texto or '')
+        .replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _plegar(linea):
+    """Corta las líneas de más de 75 octetos (continuación con un espacio al inicio)."""
+    datos = linea.encode('utf-8')
+    if len(datos) <= 75:
+        return linea + '\r\n'
+
+    partes = []
+    limite = 75
+    while datos:
+        corte = min(limite, len(datos))
+        # No partir un carácter UTF-8 por la mitad
+        while corte < len(datos) and (datos[corte] & 0xC0) == 0x80:
+            corte -= 1
+        partes.append(datos[:corte].decode('utf-8'))
+        datos = datos[corte:]
+        limite = 74
+    return '\r\n '.join(partes) + '\r\n'
+
+
+def _fecha_utc(momento):
+    return momento.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _evento(cita, url_base):
+    fin = cita.fecha_hora + timedelta(minutes=cita.duracion)
+    descripcion = f"{cita.causa.rol_rit} - {cita.causa.caratula}"
+    if cita.observaciones:
+        descripcion += f"\n\n{cita.observaciones}"
+
+    lineas = [
+        'BEGIN:VEVENT',
+        f'UID:cita-{cita.pk}@clinica-juridica',
+        f'DTSTAMP:{_fecha_utc(cita.actualizado_en)}',
+        f'LAST-MODIFIED:{_fecha_utc(cita.actualizado_en)}',
+        f'DTSTART:{_fecha_utc(cita.fecha_hora)}',
+        f'DTEND:{_fecha_utc(fin)}',
+        f'SUMMARY:{_escapar(f"{cita.get_tipo_display()} - {cita.causa.rol_rit}")}',
+        f'LOCATION:{_escapar(cita.lugar)}',
+        f'DESCRIPTION:{_escapar(descripcion)}',
+        f'STATUS:{"CANCELLED" if cita.estado == "cancelada" else "CONFIRMED"}',
+        f'URL:{url_base}{reverse("casos:detalle", kwargs={"pk": cita.causa_id})}',
+        'END:VEVENT',
+    ]
+    return ''.join(_plegar(linea) for linea in lineas)
+
+
+def generar_feed(usuario, url_base, sync_token, desde=None):
+    """
+    Genera el .ics línea a línea. Las citas se leen con iterator() en lotes, por lo
+    que un historial largo nunca se carga completo en memoria.
+    """
+    citas = citas_visibles(usuario).select_related('causa').order_by('fecha_hora')
+    if desde is not None:
+        citas = citas.filter(actualizado_en__gte=desde)
+
+    yield ''.join(_plegar(linea) for linea in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Clinica Juridica//Agenda//ES',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{_escapar(f"Agenda Clínica Jurídica - {usuario.get_full_name() or usuario.username}")}',
+        f'X-WR-TIMEZONE:{settings.TIME_ZONE}',
+        f'X-CLINICA-SYNC-TOKEN:{sync_token}',
+    ])
+
+    for cita in citas.iterator(chunk_size=LOTE_ITERACION):
+        yield _evento(cita, url_base)
+
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from agenda.recordatorios import enviar_pendientes, programar
+
+
+class Command(BaseCommand):
+    help = 'Programa los recordatorios de citas próximas y vacía la bandeja de salida (Recordatorio)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true',
+                            help='Sigue revisando indefinidamente en lugar de terminar tras una revisión.')
+        parser.add_argument('--intervalo', type=int, default=60,
+                            help='Segundos de espera entre revisiones en modo continuo.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Revisando recordatorios de citas...'))
+
+        while True:
+            programados = programar()
+            enviados, fallidos = enviar_pendientes()
+            if programados or enviados or fallidos:
+                self.stdout.write(f' - {programados} avisos nuevos, {enviados} enviados, {fallidos} con error')
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS('Bandeja de recordatorios vacía.'))
@@ -27,9 +27,55 @@ class Cita(models.Model):
     lugar = models.CharField(max_length=200, default="Oficinas Clínica Jurídica")
     estado = models.CharField(max_length=20, choices=ESTADOS, default='programada')
     observaciones = models.TextField(blank=True)
+    # Para el ETag y la sincronización incremental del feed .ics (agenda/ics.py)
+    actualizado_en = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['fecha_hora']
+        indexes = [
+            # Citas de un día (panel de inicio) y del calendario, filtradas por responsable
+            models.Index(fields=['fecha_hora', 'responsable'], name='cita_fecha_resp_idx'),
+            # Agenda de un responsable por rango de fechas y detección de topes (agenda/utils.py)
+            models.Index(fields=['responsable', 'fecha_hora'], name='cita_resp_fecha_idx'),
+            # Citas modificadas desde el último sync token del feed .ics
+            models.Index(fields=['responsable', 'actualizado_en'], name='cita_resp_actualizado_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.get_tipo_display()} - {self.fecha_hora.strftime('%d/%m/%Y %H:%M')}"
\ No newline at end of file
+        return f"{self.get_tipo_display()} - {self.fecha_hora.strftime('%d/%m/%Y %H:%M')}"
+
+class Recordatorio(models.Model):
+    """
+    Bandeja de salida de recordatorios de citas (ver agenda/recordatorios.py).
+    `clave` identifica el aviso (cita, anticipación y hora de la cita): al ser única,
+    volver a programar tras un reinicio no duplica avisos ya creados o enviados.
+    """
+    ESTADOS = (
+        ('pendiente', 'Pendiente'),
+        ('enviando', 'Enviando'),
+        ('enviado', 'Enviado'),
+        ('error', 'Error'),
+        ('descartado', 'Descartado'),
+    )
+
+    clave = models.CharField(max_length=100, unique=True)
+    cita = models.ForeignKey(Cita, on_delete=models.CASCADE, related_name='recordatorios')
+    destinatario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    asunto = models.CharField(max_length=200)
+    mensaje = models.TextField()
+
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    intentos = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+    tomado_en = models.DateTimeField(null=True, blank=True)
+    enviado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # La bandeja se vacía por orden de llegada
+            models.Index(fields=['estado', 'creado_en'], name='recordatorio_estado_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.asunto} → {self.destinatario} ({self.get_estado_display()})"
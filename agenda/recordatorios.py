@@ -0,0 +1,181 @@
+"""
+Recordatorios de citas próximas con una bandeja de salida local (tabla Recordatorio).
+
+Cada revisión (`manage.py enviar_recordatorios`, una vez o con --continuo) hace dos pasos:
+
+1. programar(): una sola consulta por rango sobre fecha_hora trae las citas que entran
+   en alguna ventana de aviso (RECORDATORIOS_ANTICIPACION) y se insertan sus avisos
+   con bulk_create(ignore_conflicts=True). La clave única del aviso evita duplicarlo
+   aunque el proceso se reinicie o haya dos revisiones a la vez.
+2. enviar_pendientes(): toma los avisos pendientes y los entrega con el backend
+   configurado en RECORDATORIOS_BACKEND (consola, archivo o SMTP). Los avisos de
+   citas canceladas o reagendadas desde que se programaron quedan 'descartado'.
+"""
+import sys
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Cita, Recordatorio
+
+# Un aviso que lleva más que esto "enviando" se considera abandonado (proceso caído)
+TIEMPO_MAXIMO_ENVIANDO = timedelta(minutes=10)
+
+
+# --- Backends de entrega ---
+
+class BackendRecordatorios:
+    """Entrega un recordatorio; si falla debe lanzar una excepción (se reintenta más tarde)."""
+
+    def enviar(self, recordatorio):
+        raise NotImplementedError
+
+
+class BackendConsola(BackendRecordatorios):
+    def __init__(self, salida=None):
+        self.salida = salida or sys.stdout
+
+    def enviar(self, recordatorio):
+        self.salida.write(f"Para: {recordatorio.destinatario.email}\nAsunto: {recordatorio.asunto}\n\n{recordatorio.mensaje}\n{'-' * 40}\n")
+
+
+class BackendArchivo(BackendRecordatorios):
+    """Agrega cada aviso a RECORDATORIOS_ARCHIVO (útil en desarrollo y pruebas)."""
+
+    def enviar(self, recordatorio):
+        with open(settings.RECORDATORIOS_ARCHIVO, 'a', encoding='utf-8') as f:
+            BackendConsola(f).enviar(recordatorio)
+
+
+class BackendSMTP(BackendRecordatorios):
+    """Correo con la configuración EMAIL_* de Django."""
+
+    def enviar(self, recordatorio):
+        if not recordatorio.destinatario.email:
+            raise ValueError("El destinatario no tiene correo registrado.")
+        send_mail(recordatorio.asunto, recordatorio.mensaje, settings.DEFAULT_FROM_EMAIL,
+                  [recordatorio.destinatario.email], fail_silently=False)
+
+
+def obtener_backend():
+    return import_string(settings.RECORDATORIOS_BACKEND)()
+
+
+# --- Programación ---
+
+def _texto(cita, minutos):
+    cuando = timezone.localtime(cita.fecha_hora).strftime('%d/%m/%Y %H:%M')
+    anticipacion = f"{minutos // 60} h" if minutos % 60 == 0 else f"{minutos} min"
+    asunto = f"Recordatorio: {cita.get_tipo_display()} {cuando} ({cita.causa.rol_rit})"
+    mensaje = (
+        f"Tienes {cita.get_tipo_display().lower()} en menos de {anticipacion}.\n\n"
+        f"Fecha: {cuando}\n"
+        f"Lugar: {cita.lugar}\n"
+        f"Causa: {cita.causa.rol_rit} - {cita.causa.caratula}\n"
+    )
+    if cita.observaciones:
+        mensaje += f"\n{cita.observaciones}\n"
+    return asunto, mensaje
+
+
+def programar(ahora=None):
+    """Crea los avisos de las citas que entraron en su ventana. Devuelve cuántos avisos nuevos hubo."""
+    ahora = ahora or timezone.now()
+    anticipaciones = sorted(settings.RECORDATORIOS_ANTICIPACION)
+    if not anticipaciones:
+        return 0
+
+    citas = (
+        Cita.objects
+        .filter(fecha_hora__gt=ahora, fecha_hora__lte=ahora + timedelta(minutes=anticipaciones[-1]), estado='programada')
+        .select_related('causa')
+    )
+
+    avisos = []
+    for cita in citas.iterator():
+        faltan = cita.fecha_hora - ahora
+        # Solo la ventana más cercana: si el aviso de 24 h no alcanzó a salir, basta con el de 1 h
+        minutos = next(m for m in anticipaciones if faltan <= timedelta(minutes=m))
+        asunto, mensaje = _texto(cita, minutos)
+        avisos.append(Recordatorio(
+            # La hora de la cita forma parte de la clave: si se reagenda, se vuelve a avisar
+            clave=f"cita-{cita.pk}-{minutos}-{int(cita.fecha_hora.timestamp())}",
+            cita=cita,
+            destinatario_id=cita.responsable_id,
+            asunto=asunto,
+            mensaje=mensaje,
+        ))
+
+    # Las claves ya creadas en revisiones anteriores se descartan con una sola consulta;
+    # ignore_conflicts cubre además a otra revisión que inserte los mismos avisos a la vez
+    existentes = set(Recordatorio.objects.filter(clave__in=[a.clave for a in avisos]).values_list('clave', flat=True))
+    nuevos = [a for a in avisos if a.clave not in existentes]
+    Recordatorio.objects.bulk_create(nuevos, ignore_conflicts=True)
+    return len(nuevos)
+
+
+# --- Envío ---
+
+def _tomar(lote, excluir):
+    """Marca como 'enviando' hasta `lote` avisos y devuelve sus ids."""
+    ahora = timezone.now()
+    candidatos = (
+        Recordatorio.objects
+        .filter(Q(estado='pendiente') | Q(estado='enviando', tomado_en__lt=ahora - TIEMPO_MAXIMO_ENVIANDO))
+        .exclude(pk__in=excluir)
+        .order_by('creado_en')
+        .values('pk', 'estado', 'intentos')[:lote]
+    )
+
+    tomados = []
+    for candidato in candidatos:
+        # Actualización condicional: si otro proceso lo tomó primero, se omite
+        if Recordatorio.objects.filter(**candidato).update(estado='enviando', tomado_en=ahora, intentos=F('intentos') + 1):
+            tomados.append(candidato['pk'])
+    return tomados
+
+
+def _vigente(recordatorio):
+    """False si la cita se canceló o se reagendó después de programar el aviso (la hora va al final de la clave)."""
+    cita = recordatorio.cita
+    return cita.estado == 'programada' and recordatorio.clave.rsplit('-', 1)[-1] == str(int(cita.fecha_hora.timestamp()))
+
+
+def enviar_pendientes(backend=None, lote=100):
+    """Vacía la bandeja de salida. Devuelve (enviados, fallidos)."""
+    backend = backend or obtener_backend()
+    enviados = fallidos = 0
+    # Los que fallan vuelven a 'pendiente' y se reintentan en la próxima revisión, no en esta
+    con_error = []
+
+    while True:
+        ids = _tomar(lote, con_error)
+        if not ids:
+            return enviados, fallidos
+
+        entregados = []
+        descartados = []
+        for recordatorio in Recordatorio.objects.filter(pk__in=ids).select_related('destinatario', 'cita'):
+            if not _vigente(recordatorio):
+                descartados.append(recordatorio.pk)
+                continue
+            try:
+                backend.enviar(recordatorio)
+            except Exception as e:
+                fallidos += 1
+                con_error.append(recordatorio.pk)
+                agotado = recordatorio.intentos >= settings.RECORDATORIOS_MAXIMO_INTENTOS
+                Recordatorio.objects.filter(pk=recordatorio.pk).update(
+                    estado='error' if agotado else 'pendiente', error=str(e)
+                )
+            else:
+                entregados.append(recordatorio.pk)
+
+        Recordatorio.objects.filter(pk__in=entregados).update(estado='enviado', enviado_en=timezone.now(), error='')
+        # Si la cita se reagendó, programar() ya crea el aviso con la nueva hora
+        Recordatorio.objects.filter(pk__in=descartados).update(estado='descartado')
+        enviados += len(entregados)
@@ -1,3 +1,183 @@
-from django.test import TestCase
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from casos.models import Causa, Tribunal
+from personas.models import Persona, Usuario
+from .forms import CitaForm
+from .ics import token_feed
+from .models import Cita, Recordatorio
+from .recordatorios import BackendRecordatorios, enviar_pendientes, programar
+from .utils import conflictos
 
 # Create your tests here.
+
+class ConflictosCitaTests(TestCase):
+    """Los topes de horario se detectan por responsable y por tribunal, respetando la duración."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cls.tribunal = Tribunal.objects.create(nombre='1° Juzgado Civil de Santiago')
+        cliente = Persona.objects.create(rut='22.222.222-2', nombres='Juan', apellidos='Pérez')
+        cls.causa = Causa.objects.create(
+            rol_rit='C-100-2025', caratula='Pérez con González', cliente=cliente,
+            responsable=cls.estudiante, tribunal=cls.tribunal
+        )
+        cls.manana = timezone.localtime(timezone.now()).replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        # 10:00 a 11:30
+        cls.cita = Cita.objects.create(causa=cls.causa, responsable=cls.estudiante, fecha_hora=cls.manana, duracion=90)
+
+    def test_solo_chocan_los_bloques_que_se_cruzan(self):
+        self.assertEqual(conflictos(self.manana + timedelta(minutes=60), 30, responsable=self.estudiante), [self.cita])
+        self.assertEqual(conflictos(self.manana - timedelta(minutes=30), 31, responsable=self.estudiante), [self.cita])
+        self.assertEqual(conflictos(self.manana + timedelta(minutes=90), 60, responsable=self.estudiante), [])
+        self.assertEqual(conflictos(self.manana - timedelta(minutes=60), 60, responsable=self.estudiante), [])
+
+        self.cita.estado = 'cancelada'
+        self.cita.save()
+        self.assertEqual(conflictos(self.manana, 30, responsable=self.estudiante), [])
+
+    def test_formulario_rechaza_topes_de_responsable_y_tribunal(self):
+        datos = {'tipo': 'reunion_cliente', 'fecha_hora': self.manana + timedelta(minutes=30),
+                 'duracion': 60, 'lugar': 'Sala 1'}
+        form = CitaForm(datos, causa=self.causa, responsable=self.estudiante)
+        self.assertFalse(form.is_valid())
+
+        otro = Usuario.objects.create_user(
+            username='otro', password='clave-segura-123', rut='87654321-4', email='otro@clinica.cl', rol='estudiante'
+        )
+        Cita.objects.filter(pk=self.cita.pk).update(tipo='audiencia')
+        self.assertTrue(CitaForm(datos, causa=self.causa, responsable=otro).is_valid())
+        self.assertFalse(CitaForm(dict(datos, tipo='audiencia'), causa=self.causa, responsable=otro).is_valid())
+
+    def test_serie_semanal_se_crea_en_bloque_o_se_rechaza_entera(self):
+        self.client.force_login(self.estudiante)
+        url = reverse('agenda:agendar_caso', kwargs={'caso_id': self.causa.pk})
+        datos = {'tipo': 'reunion_cliente', 'fecha_hora': (self.manana + timedelta(days=8)).strftime('%Y-%m-%dT%H:%M'),
+                 'duracion': 60, 'lugar': 'Sala 1', 'repetir': 'semanal', 'repeticiones': 4}
+
+        response = self.client.post(url, datos)
+        self.assertRedirects(response, reverse('casos:detalle', kwargs={'pk': self.causa.pk}), fetch_redirect_response=False)
+        serie = list(Cita.objects.exclude(pk=self.cita.pk).values_list('fecha_hora', flat=True))
+        self.assertEqual(len(serie), 4)
+        self.assertEqual({timezone.localtime(f).strftime('%a %H:%M') for f in serie}, {timezone.localtime(serie[0]).strftime('%a %H:%M')})
+
+        # La segunda ocurrencia choca con la serie anterior: no se crea ninguna
+        datos.update(fecha_hora=(self.manana + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+                     repetir_hasta=(self.manana + timedelta(days=30)).date(), repeticiones='')
+        response = self.client.post(url, datos)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Cita.objects.count(), 5)
+
+    def test_eventos_de_la_semana_en_json(self):
+        self.client.force_login(self.estudiante)
+        Cita.objects.create(causa=self.causa, responsable=self.estudiante, fecha_hora=self.manana + timedelta(days=40))
+
+        response = self.client.get(reverse('agenda:eventos'), {'vista': 'semana', 'fecha': self.manana.date().isoformat()})
+        datos = response.json()
+        self.assertEqual([c['id'] for c in datos['citas']], [self.cita.id])
+        self.assertEqual(datos['citas'][0]['fin'], timezone.localtime(self.manana + timedelta(minutes=90)).isoformat())
+
+
+class FeedIcsTests(TestCase):
+    """El feed .ics se protege con el token, responde 304 sin cambios y entrega solo los cambios con ?desde."""
+
+    def test_sincronizacion_incremental(self):
+        estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cliente = Persona.objects.create(rut='22.222.222-2', nombres='Juan', apellidos='Pérez')
+        causa = Causa.objects.create(rol_rit='C-100-2025', caratula='Pérez con González', cliente=cliente, responsable=estudiante)
+        inicio = timezone.now() + timedelta(days=1)
+        antigua = Cita.objects.create(causa=causa, responsable=estudiante, fecha_hora=inicio, lugar='Sala 1, piso 2')
+        url = reverse('agenda:feed_ics', kwargs={'token': token_feed(estudiante)})
+
+        self.assertEqual(self.client.get(url.replace(f'{estudiante.pk}.', f'{estudiante.pk}.0')).status_code, 404)
+
+        completo = self.client.get(url)
+        contenido = b''.join(completo.streaming_content).decode()
+        self.assertIn(f'UID:cita-{antigua.pk}@clinica-juridica', contenido)
+        self.assertIn('LOCATION:Sala 1\\, piso 2', contenido)
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': completo['ETag']}).status_code, 304)
+
+        # Cambios posteriores al sync token (fuera del margen de repetición)
+        Cita.objects.filter(pk=antigua.pk).update(actualizado_en=timezone.now() - timedelta(hours=1))
+        sync_token = self.client.get(url)['X-Sync-Token']
+        nueva = Cita.objects.create(causa=causa, responsable=estudiante, fecha_hora=inicio + timedelta(hours=3))
+
+        cambios = b''.join(self.client.get(url, {'desde': sync_token}).streaming_content).decode()
+        self.assertIn(f'UID:cita-{nueva.pk}@', cambios)
+        self.assertNotIn(f'UID:cita-{antigua.pk}@', cambios)
+
+
+class BackendMemoria(BackendRecordatorios):
+    def __init__(self, fallar=False):
+        self.enviados = []
+        self.fallar = fallar
+
+    def enviar(self, recordatorio):
+        if self.fallar:
+            raise ConnectionError('SMTP caído')
+        self.enviados.append(recordatorio.clave)
+
+
+@override_settings(RECORDATORIOS_ANTICIPACION=[1440, 60], RECORDATORIOS_MAXIMO_INTENTOS=2)
+class RecordatoriosTests(TestCase):
+    """Los avisos se crean una sola vez por ventana y la bandeja se reintenta hasta agotar intentos."""
+
+    def test_programar_y_enviar_sin_duplicados(self):
+        estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cliente = Persona.objects.create(rut='22.222.222-2', nombres='Juan', apellidos='Pérez')
+        causa = Causa.objects.create(rol_rit='C-100-2025', caratula='Pérez con González', cliente=cliente)
+        ahora = timezone.now()
+        Cita.objects.create(causa=causa, responsable=estudiante, fecha_hora=ahora + timedelta(hours=5))
+        Cita.objects.create(causa=causa, responsable=estudiante, fecha_hora=ahora + timedelta(minutes=30))
+        Cita.objects.create(causa=causa, responsable=estudiante, fecha_hora=ahora + timedelta(days=3))
+        Cita.objects.create(causa=causa, responsable=estudiante, fecha_hora=ahora + timedelta(hours=2), estado='cancelada')
+
+        self.assertEqual(programar(ahora), 2)
+        self.assertEqual(programar(ahora), 0)  # Reinicio: no se duplican
+
+        caido = BackendMemoria(fallar=True)
+        self.assertEqual(enviar_pendientes(caido), (0, 2))
+        self.assertEqual(Recordatorio.objects.filter(estado='pendiente').count(), 2)
+
+        backend = BackendMemoria()
+        self.assertEqual(enviar_pendientes(backend), (2, 0))
+        self.assertEqual(enviar_pendientes(backend), (0, 0))
+        self.assertEqual(len(backend.enviados), 2)
+        self.assertEqual(sorted(c.split('-')[2] for c in backend.enviados), ['1440', '60'])
+
+    def test_no_avisa_citas_canceladas_o_reagendadas(self):
+        estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cliente = Persona.objects.create(rut='22.222.222-2', nombres='Juan', apellidos='Pérez')
+        causa = Causa.objects.create(rol_rit='C-100-2025', caratula='Pérez con González', cliente=cliente)
+        ahora = timezone.now()
+        cancelada = Cita.objects.create(causa=causa, responsable=estudiante, fecha_hora=ahora + timedelta(hours=5))
+        reagendada = Cita.objects.create(causa=causa, responsable=estudiante, fecha_hora=ahora + timedelta(hours=6))
+        self.assertEqual(programar(ahora), 2)
+
+        Cita.objects.filter(pk=cancelada.pk).update(estado='cancelada')
+        Cita.objects.filter(pk=reagendada.pk).update(fecha_hora=ahora + timedelta(hours=7))
+
+        backend = BackendMemoria()
+        self.assertEqual(enviar_pendientes(backend), (0, 0))
+        self.assertEqual(Recordatorio.objects.filter(estado='descartado').count(), 2)
+
+        # El aviso con la nueva hora sí sale
+        self.assertEqual(programar(ahora), 1)
+        self.assertEqual(enviar_pendientes(backend), (1, 0))
+        self.assertEqual(backend.enviados, [Recordatorio.objects.get(estado='enviado').clave])
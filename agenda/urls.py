@@ -6,5 +6,7 @@ app_name = 'agenda'
 
 urlpatterns = [
     path('', views.calendario, name='calendario'),         # /agenda/
+    path('eventos/', views.calendario_eventos, name='eventos'),         # /agenda/eventos/?vista=semana&fecha=2025-03-10
+    path('ics/<str:token>/agenda.ics', views.feed_ics, name='feed_ics'),     # feed para Google Calendar / Outlook
     path('caso/<int:caso_id>/nueva/', views.AgendarCitaView.as_view(), name='agendar_caso'),    # /agenda/caso/1/nueva/
 ]
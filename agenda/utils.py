@@ -0,0 +1,135 @@
+"""
+Consultas de la agenda: ventanas del calendario y detección de topes de horario.
+
+Todas las búsquedas son por rango sobre fecha_hora (índices cita_resp_fecha_idx y
+cita_fecha_resp_idx). Para los topes no se recorre la agenda completa: como ninguna
+cita dura más de DURACION_MAXIMA, las únicas que pueden cruzarse con un bloque son
+las que empiezan entre (inicio - DURACION_MAXIMA) y el fin del bloque.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from casos.models import Causa
+from .models import Cita
+
+# Minutos; CitaForm no acepta citas más largas (de esto depende la cota de conflictos())
+DURACION_MAXIMA = 12 * 60
+
+VISTAS = ('semana', 'mes')
+
+# Citas recurrentes (CitaForm): días entre ocurrencias y máximo de una serie
+FRECUENCIAS = {'semanal': 7, 'quincenal': 14}
+MAXIMO_REPETICIONES = 52
+
+# Estados que ya no ocupan el horario
+ESTADOS_LIBRES = ('cancelada',)
+
+
+def ventana_calendario(vista, fecha):
+    """
+    (inicio, fin, anterior, siguiente) de la semana (lunes a domingo) o del mes que
+    contiene `fecha`. inicio/fin son datetimes locales (fin excluido); anterior y
+    siguiente son fechas dentro de la ventana previa y la próxima.
+    """
+    if vista == 'semana':
+        primer_dia = fecha - timedelta(days=fecha.weekday())
+        dia_fin = primer_dia + timedelta(days=7)
+        anterior = primer_dia - timedelta(days=7)
+    else:
+        primer_dia = fecha.replace(day=1)
+        dia_fin = (primer_dia + timedelta(days=32)).replace(day=1)
+        anterior = (primer_dia - timedelta(days=1)).replace(day=1)
+
+    inicio = timezone.make_aware(datetime.combine(primer_dia, time.min))
+    fin = timezone.make_aware(datetime.combine(dia_fin, time.min))
+    return inicio, fin, anterior, dia_fin
+
+
+def citas_visibles(usuario):
+    """El estudiante ve sus citas y las de sus causas; el resto del equipo ve todas."""
+    citas = Cita.objects.all()
+    if usuario.rol == 'estudiante':
+        # Subconsulta en vez de join + distinct: cada rama se resuelve con su índice
+        citas = citas.filter(
+            Q(responsable=usuario) |
+            Q(causa__in=Causa.objects.filter(responsable=usuario).values('id'))
+        )
+    return citas
+
+
+def citas_en_rango(usuario, inicio, fin):
+    return (
+        citas_visibles(usuario)
+        .filter(fecha_hora__gte=inicio, fecha_hora__lt=fin)
+        .select_related('causa', 'responsable', 'persona_atendida')
+        .order_by('fecha_hora')
+    )
+
+
+def conflictos_bloques(bloques, responsable=None, tribunal=None, excluir=None):
+    """
+    Topes de varios bloques [(inicio, duracion minutos), ...] con una sola consulta
+    sobre el rango que los cubre a todos. Devuelve {inicio: [citas que se cruzan]}
+    solo para los bloques con algún tope.
+    """
+    if not bloques or (responsable is None and tribunal is None):
+        return {}
+
+    intervalos = [(inicio, inicio + timedelta(minutes=duracion)) for inicio, duracion in bloques]
+    filtro = Q()
+    if responsable is not None:
+        filtro |= Q(responsable=responsable)
+    if tribunal is not None:
+        filtro |= Q(tipo='audiencia', causa__tribunal=tribunal)
+
+    candidatas = (
+        Cita.objects
+        .filter(
+            filtro,
+            fecha_hora__gt=min(i for i, _ in intervalos) - timedelta(minutes=DURACION_MAXIMA),
+            fecha_hora__lt=max(f for _, f in intervalos),
+        )
+        .exclude(estado__in=ESTADOS_LIBRES)
+        .select_related('causa')
+        .order_by('fecha_hora')
+    )
+    if excluir is not None:
+        candidatas = candidatas.exclude(pk=excluir)
+    candidatas = [(c, c.fecha_hora + timedelta(minutes=c.duracion)) for c in candidatas]
+
+    # El rango ya acota las candidatas; aquí se cruza cada bloque con las que lo tocan
+    topes = {}
+    for inicio, fin in intervalos:
+        cruzadas = [c for c, fin_cita in candidatas if c.fecha_hora < fin and fin_cita > inicio]
+        if cruzadas:
+            topes[inicio] = cruzadas
+    return topes
+
+
+def conflictos(inicio, duracion, responsable=None, tribunal=None, excluir=None):
+    """
+    Citas vigentes que se cruzan con el bloque [inicio, inicio + duracion minutos):
+    las del `responsable` y/o las audiencias del `tribunal`.
+    """
+    return conflictos_bloques([(inicio, duracion)], responsable, tribunal, excluir).get(inicio, [])
+
+
+def expandir_recurrencia(inicio, frecuencia, hasta=None, repeticiones=None):
+    """
+    Fechas de una serie semanal o quincenal que parte en `inicio`, hasta la fecha
+    `hasta` (incluida) o por `repeticiones` ocurrencias, con tope MAXIMO_REPETICIONES.
+    La hora se mantiene en hora local aunque entre medio cambie el horario de verano.
+    """
+    paso = timedelta(days=FRECUENCIAS[frecuencia])
+    local = timezone.localtime(inicio).replace(tzinfo=None)
+    limite = repeticiones or MAXIMO_REPETICIONES
+
+    fechas = []
+    while len(fechas) < min(limite, MAXIMO_REPETICIONES):
+        if hasta and local.date() > hasta:
+            break
+        fechas.append(timezone.make_aware(local))
+        local += paso
+    return fechas
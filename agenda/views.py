@@ -5,32 +5,106 @@ from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.db import transaction
+from datetime import date, timedelta
 
 from .models import Cita
 from .forms import CitaForm
-from casos.models import Causa, Bitacora
+from .utils import VISTAS, citas_en_rango, ventana_calendario
+from .ics import codificar_sync_token, decodificar_sync_token, estado_feed, generar_feed, token_feed, usuario_del_token
+from casos.models import Causa
+from casos import bitacora, indicadores
+
+def _ventana_pedida(request):
+    """Vista (semana/mes) y fecha de referencia de la petición; por defecto el mes actual."""
+    vista = request.GET.get('vista')
+    if vista not in VISTAS:
+        vista = 'mes'
+    try:
+        fecha = date.fromisoformat(request.GET.get('fecha', ''))
+    except ValueError:
+        fecha = timezone.localdate()
+    return vista, fecha
 
 # Vista para el Calendario General
 @login_required
 def calendario(request):
-    ahora = timezone.localtime(timezone.now())
-    inicio_dia = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    citas = Cita.objects.filter(fecha_hora__gte=inicio_dia).order_by('fecha_hora')
-    
-    if request.user.rol == 'estudiante':
-        from django.db.models import Q
-        citas = citas.filter(
-            Q(responsable=request.user) | 
-            Q(causa__responsable=request.user)
-        ).distinct()
-    
+    vista, fecha = _ventana_pedida(request)
+    inicio, fin, anterior, siguiente = ventana_calendario(vista, fecha)
+
     context = {
-        'citas': citas,
-        'fecha_actual': ahora
+        'citas': citas_en_rango(request.user, inicio, fin),
+        'fecha_actual': timezone.localtime(timezone.now()),
+        'vista': vista,
+        'inicio': inicio,
+        'fin': fin - timedelta(days=1),
+        'anterior': anterior.isoformat(),
+        'siguiente': siguiente.isoformat(),
+        'url_feed': request.build_absolute_uri(reverse('agenda:feed_ics', kwargs={'token': token_feed(request.user)})),
     }
     return render(request, 'agenda/calendario.html', context)
 
+@login_required
+def calendario_eventos(request):
+    """Citas de una semana o un mes en JSON (?vista=semana|mes&fecha=AAAA-MM-DD)."""
+    vista, fecha = _ventana_pedida(request)
+    inicio, fin, anterior, siguiente = ventana_calendario(vista, fecha)
+
+    citas = [{
+        'id': cita.id,
+        'tipo': cita.tipo,
+        'tipo_display': cita.get_tipo_display(),
+        'estado': cita.estado,
+        'inicio': timezone.localtime(cita.fecha_hora).isoformat(),
+        'fin': timezone.localtime(cita.fecha_hora + timedelta(minutes=cita.duracion)).isoformat(),
+        'lugar': cita.lugar,
+        'causa': {'id': cita.causa_id, 'rol_rit': cita.causa.rol_rit, 'caratula': cita.causa.caratula},
+        'persona_atendida': str(cita.persona_atendida) if cita.persona_atendida else None,
+        'responsable': cita.responsable.get_full_name() or cita.responsable.username,
+        'url': reverse('casos:detalle', kwargs={'pk': cita.causa_id}),
+    } for cita in citas_en_rango(request.user, inicio, fin)]
+
+    return JsonResponse({
+        'vista': vista,
+        'inicio': inicio.isoformat(),
+        'fin': fin.isoformat(),
+        'anterior': anterior.isoformat(),
+        'siguiente': siguiente.isoformat(),
+        'citas': citas,
+    })
+
+def feed_ics(request, token):
+    """Agenda del usuario en formato iCalendar; ?desde=<sync token> trae solo los cambios."""
+    usuario = usuario_del_token(token)
+    if usuario is None:
+        raise Http404("Feed no encontrado.")
+
+    cantidad, ultima = estado_feed(usuario)
+    # El próximo ?desde: todo lo que se modifique después de esta respuesta
+    sync_token = codificar_sync_token(timezone.now())
+    desde = request.GET.get('desde', '')
+
+    # Clientes que consultan cada pocos minutos reciben 304 mientras nada cambie
+    etag = quote_etag(f"{cantidad}-{codificar_sync_token(ultima)}-{desde}")
+    no_modificado = get_conditional_response(request, etag=etag)
+    if no_modificado is not None:
+        no_modificado['X-Sync-Token'] = sync_token
+        return no_modificado
+
+    url_base = request.build_absolute_uri('/').rstrip('/')
+    response = StreamingHttpResponse(
+        generar_feed(usuario, url_base, sync_token, decodificar_sync_token(desde)),
+        content_type='text/calendar; charset=utf-8',
+    )
+    response['Content-Disposition'] = 'inline; filename="agenda.ics"'
+    response['ETag'] = etag
+    response['X-Sync-Token'] = sync_token
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 class AgendarCitaView(LoginRequiredMixin, CreateView):
     model = Cita
     form_class = CitaForm
@@ -45,6 +119,7 @@ class AgendarCitaView(LoginRequiredMixin, CreateView):
         # Pasamos la causa al formulario para filtrar el select de personas
         kwargs = super().get_form_kwargs()
         kwargs['causa'] = self.causa
+        kwargs['responsable'] = self.request.user # Para revisar topes de horario
         return kwargs
 
     def get_context_data(self, **kwargs):
@@ -57,10 +132,14 @@ class AgendarCitaView(LoginRequiredMixin, CreateView):
         cita = form.save(commit=False)
         cita.causa = self.causa
         cita.responsable = self.request.user # El usuario logueado es responsable
+
+        if len(form.ocurrencias) > 1:
+            return self.agendar_serie(form, cita)
+
         cita.save()
 
         # 2. Registrar en Bitácora (Trazabilidad)
-        Bitacora.objects.create(
+        bitacora.registrar(
             causa=self.causa,
             usuario=self.request.user,
             accion='agenda', # Asegúrate que 'agenda' esté en las choices de Bitacora
@@ -70,6 +149,34 @@ class AgendarCitaView(LoginRequiredMixin, CreateView):
         messages.success(self.request, "Cita agendada correctamente.")
         return super().form_valid(form)
 
+    def agendar_serie(self, form, cita):
+        """Cita recurrente: todas las ocurrencias en un solo INSERT y una sola entrada de bitácora."""
+        citas = [
+            Cita(
+                causa=cita.causa, responsable=cita.responsable, persona_atendida=cita.persona_atendida,
+                fecha_hora=fecha_hora, duracion=cita.duracion, tipo=cita.tipo, lugar=cita.lugar,
+                observaciones=cita.observaciones,
+            )
+            for fecha_hora in form.ocurrencias
+        ]
+
+        with transaction.atomic():
+            Cita.objects.bulk_create(citas)
+            # bulk_create no emite post_save: se invalida a mano lo que dependía de esas señales
+            indicadores.tocar_version(indicadores.VERSION_CITAS)
+            indicadores.tocar_version_causa(self.causa.pk)
+
+            primera, ultima = (timezone.localtime(citas[i].fecha_hora).strftime('%d/%m/%Y %H:%M') for i in (0, -1))
+            bitacora.registrar(
+                causa=self.causa,
+                usuario=self.request.user,
+                accion='agenda',
+                detalle=f"Se agendaron {len(citas)} citas de {cita.get_tipo_display()} ({form.cleaned_data['repetir']}) entre el {primera} y el {ultima}"
+            )
+
+        messages.success(self.request, f"Se agendaron {len(citas)} citas.")
+        return redirect(self.get_success_url())
+
     def get_success_url(self):
         # Volver al detalle del caso
         return reverse('casos:detalle', kwargs={'pk': self.causa.pk})
\ No newline at end of file
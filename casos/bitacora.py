@@ -0,0 +1,127 @@
+"""
+Escritura agrupada de la Bitácora.
+
+En lugar de un INSERT por cada movimiento, `registrar()` deja la entrada en un buffer
+y se guardan todas juntas con un solo bulk_create:
+
+- En una petición, BitacoraMiddleware abre el buffer y lo vacía al terminar.
+- Fuera de una petición (comandos, hilos de fondo) se puede usar `with agrupar():`.
+  Con `agrupar(lote=N)` el buffer se vacía cada N entradas: es el modo de alto volumen
+  (solo inserción) que usa la auditoría de integridad.
+- Sin buffer activo, la entrada se guarda sola al confirmar la transacción.
+
+Las entradas registradas dentro de un transaction.atomic() solo entran al buffer si esa
+transacción se confirma. Como bulk_create no emite señales, `guardar()` actualiza a mano
+el índice de búsqueda y la versión de los fragmentos cacheados de cada causa.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+
+from asgiref.local import Local
+from django.db import transaction
+
+from .models import Bitacora
+
+_estado = Local()
+
+
+class _Buffer:
+    def __init__(self, lote=None):
+        self.entradas = []
+        self.lote = lote
+
+    def agregar(self, entrada):
+        self.entradas.append(entrada)
+        if self.lote and len(self.entradas) >= self.lote:
+            self.vaciar()
+
+    def vaciar(self):
+        entradas, self.entradas = self.entradas, []
+        guardar(entradas)
+
+
+def _buffer_activo():
+    pila = getattr(_estado, 'pila', None)
+    return pila[-1] if pila else None
+
+
+def _recuperar_ids(entradas):
+    """
+    MySQL no devuelve los ids de un bulk_create: se releen las filas recién insertadas
+    (misma causa, fecha con microsegundos, acción y detalle) para indexarlas con su id.
+    """
+    pendientes = defaultdict(list)
+    for entrada in entradas:
+        pendientes[(entrada.causa_id, entrada.fecha, entrada.accion, entrada.detalle)].append(entrada)
+
+    filas = (
+        Bitacora.objects
+        .filter(causa_id__in={e.causa_id for e in entradas}, fecha__in={e.fecha for e in entradas})
+        .order_by('pk')
+        .values_list('pk', 'causa_id', 'fecha', 'accion', 'detalle')
+    )
+    for pk, *clave in filas:
+        iguales = pendientes.get(tuple(clave))
+        if iguales:
+            iguales.pop(0).pk = pk
+
+
+def guardar(entradas):
+    """Inserta las entradas con un solo bulk_create y mantiene lo que dependía de post_save."""
+    if not entradas:
+        return []
+
+    from .busqueda import indexar_bitacoras
+    from .indicadores import tocar_version_causa
+
+    with transaction.atomic():
+        creadas = Bitacora.objects.bulk_create(entradas)
+        if any(e.pk is None for e in creadas):
+            _recuperar_ids(creadas)
+        indexar_bitacoras(creadas)
+        tocar_version_causa(*{e.causa_id for e in creadas})
+    return creadas
+
+
+def registrar(causa, usuario, accion, detalle):
+    """Registra un movimiento en la Bitácora de la causa (se inserta junto con el resto del buffer)."""
+    entrada = Bitacora(
+        causa_id=getattr(causa, 'pk', causa),
+        usuario=usuario,
+        accion=accion,
+        detalle=detalle,
+    )
+
+    buffer = _buffer_activo()
+    if buffer is None:
+        transaction.on_commit(lambda: guardar([entrada]))
+    else:
+        # Fuera de un atomic() on_commit se ejecuta de inmediato
+        transaction.on_commit(lambda: buffer.agregar(entrada))
+    return entrada
+
+
+@contextmanager
+def agrupar(lote=None):
+    """Agrupa los registros hechos dentro del bloque y los guarda al salir (o cada `lote` entradas)."""
+    buffer = _Buffer(lote)
+    pila = getattr(_estado, 'pila', None)
+    if pila is None:
+        pila = _estado.pila = []
+    pila.append(buffer)
+    try:
+        yield buffer
+    finally:
+        pila.pop()
+        buffer.vaciar()
+
+
+class BitacoraMiddleware:
+    """Abre un buffer de Bitácora por petición y lo guarda con un solo INSERT al final."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with agrupar():
+            return self.get_response(request)
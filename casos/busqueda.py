@@ -0,0 +1,154 @@
+"""
+Búsqueda de texto sobre causas, registros, bitácora y documentos.
+
+Usa un índice invertido propio (TerminoBusqueda) que se actualiza al guardar cada
+objeto (ver casos/signals.py). Las consultas buscan por prefijo de término sobre
+un índice B-tree, en lugar de recorrer las tablas completas con icontains.
+"""
+import re
+import unicodedata
+from collections import Counter
+from functools import reduce
+from operator import add, or_
+
+from django.core.paginator import Paginator
+from django.db.models import Case, F, Max, Q, Sum, Value, When
+
+from .models import Causa, TerminoBusqueda
+
+LARGO_MAXIMO_TERMINO = 40
+
+# Peso de cada origen en la relevancia: calzar en la carátula/RIT vale más que en la bitácora
+PESOS = {
+    'causa': 5,
+    'documento': 3,
+    'registro': 2,
+    'bitacora': 1,
+}
+
+PALABRAS_VACIAS = {
+    'al', 'con', 'de', 'del', 'el', 'en', 'es', 'la', 'las', 'lo', 'los', 'no',
+    'para', 'por', 'que', 'se', 'su', 'un', 'una', 'y',
+}
+
+
+def tokenizar(texto):
+    """Devuelve un Counter con los términos normalizados (minúsculas, sin tildes) del texto."""
+    texto = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode('ascii').lower()
+    terminos = Counter()
+    for palabra in re.findall(r'[a-z0-9]+', texto):
+        if palabra in PALABRAS_VACIAS:
+            continue
+        if len(palabra) < 2 and not palabra.isdigit():
+            continue
+        terminos[palabra[:LARGO_MAXIMO_TERMINO]] += 1
+    return terminos
+
+
+# --- Mantención del índice ---
+
+def indexar(origen, objeto_id, causa_id, *textos):
+    """(Re)indexa un objeto: borra sus términos anteriores e inserta los actuales en un solo bulk_create."""
+    TerminoBusqueda.objects.filter(origen=origen, objeto_id=objeto_id).delete()
+
+    terminos = tokenizar(' '.join(t for t in textos if t))
+    TerminoBusqueda.objects.bulk_create([
+        TerminoBusqueda(termino=termino, causa_id=causa_id, origen=origen, objeto_id=objeto_id, frecuencia=frecuencia)
+        for termino, frecuencia in terminos.items()
+    ])
+
+
+def desindexar(origen, objeto_id):
+    TerminoBusqueda.objects.filter(origen=origen, objeto_id=objeto_id).delete()
+
+
+def indexar_causa(causa):
+    indexar('causa', causa.pk, causa.pk, causa.rol_rit, causa.caratula, causa.descripcion)
+
+
+def indexar_registro(registro):
+    indexar('registro', registro.pk, registro.causa_id, registro.contenido)
+
+
+def indexar_documento(documento):
+    indexar('documento', documento.pk, documento.causa_id, documento.nombre)
+
+
+def indexar_bitacoras(bitacoras):
+    """
+    Indexa entradas de bitácora nuevas. La bitácora es de solo inserción, así que no se
+    borra nada antes; sirve también para filas creadas con bulk_create (sin señales).
+    """
+    TerminoBusqueda.objects.bulk_create([
+        TerminoBusqueda(termino=termino, causa_id=b.causa_id, origen='bitacora', objeto_id=b.pk, frecuencia=frecuencia)
+        for b in bitacoras
+        for termino, frecuencia in tokenizar(b.detalle).items()
+    ])
+
+
+# --- Consultas ---
+
+def _agrupar(coincidencias, campo, terminos):
+    """
+    Agrupa las coincidencias por `campo` exigiendo que calcen todos los términos
+    de la consulta y ordena por relevancia (frecuencia ponderada por origen).
+    """
+    cubiertos = reduce(add, [
+        Max(Case(When(termino__startswith=t, then=Value(1)), default=Value(0)))
+        for t in terminos
+    ])
+    peso = Case(*[When(origen=o, then=Value(p)) for o, p in PESOS.items()], default=Value(1))
+
+    return (
+        coincidencias
+        .values(campo)
+        .annotate(cubiertos=cubiertos, relevancia=Sum(F('frecuencia') * peso))
+        .filter(cubiertos=len(terminos))
+        .order_by('-relevancia', f'-{campo}')
+    )
+
+
+def _coincidencias(terminos, usuario):
+    qs = TerminoBusqueda.objects.filter(reduce(or_, [Q(termino__startswith=t) for t in terminos]))
+
+    # Mismas reglas que el resto del sistema: el estudiante solo ve sus causas
+    if usuario.rol == 'estudiante':
+        qs = qs.filter(causa__responsable=usuario)
+    return qs
+
+
+def ids_causas_coincidentes(query, usuario):
+    """Subconsulta con los ids de las causas que calzan con la búsqueda (para filtrar otros listados)."""
+    terminos = list(tokenizar(query))
+    if not terminos:
+        return Causa.objects.none().values('id')
+    return _agrupar(_coincidencias(terminos, usuario), 'causa_id', terminos).order_by().values('causa_id')
+
+
+def buscar_causas(query, usuario, pagina=1, por_pagina=20):
+    """Página (django Paginator) de causas ordenadas por relevancia."""
+    terminos = list(tokenizar(query))
+    if not terminos:
+        return Paginator([], por_pagina).get_page(1)
+
+    grupos = _agrupar(_coincidencias(terminos, usuario), 'causa_id', terminos)
+    page = Paginator(grupos, por_pagina).get_page(pagina)
+
+    ids = [g['causa_id'] for g in page.object_list]
+    causas = Causa.objects.select_related('cliente', 'responsable').in_bulk(ids)
+    page.object_list = [causas[pk] for pk in ids if pk in causas]
+    return page
+
+
+def buscar_documentos(query, usuario, limite=20):
+    """Documentos cuyo nombre calza con la búsqueda, ordenados por relevancia."""
+    from documentos.models import Documento
+
+    terminos = list(tokenizar(query))
+    if not terminos:
+        return []
+
+    grupos = _agrupar(_coincidencias(terminos, usuario).filter(origen='documento'), 'objeto_id', terminos)[:limite]
+    ids = [g['objeto_id'] for g in grupos]
+    documentos = Documento.objects.select_related('causa').in_bulk(ids)
+    return [documentos[pk] for pk in ids if pk in documentos]
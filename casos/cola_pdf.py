@@ -0,0 +1,116 @@
+"""
+Cola local para generar el PDF del expediente en segundo plano.
+
+Los trabajos viven en la tabla TrabajoPDF (sin broker externo). Se procesan en un
+hilo del propio servidor cuando PDF_COLA_EN_PROCESO está activo, o con el comando
+`manage.py procesar_pdfs` en un proceso aparte.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import RegistroCaso, TrabajoPDF
+from .utils import generar_pdf_expediente
+
+# Un trabajo que lleva más que esto "procesando" se considera abandonado (proceso caído)
+TIEMPO_MAXIMO_PROCESANDO = timedelta(minutes=10)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def encolar_pdf_expediente(registro):
+    """
+    Solicita (re)generar el PDF del registro. Si ya hay un trabajo pendiente
+    o en curso para el mismo registro, la solicitud se fusiona con él.
+    """
+    trabajo, _ = TrabajoPDF.objects.get_or_create(registro=registro)
+    TrabajoPDF.objects.filter(pk=trabajo.pk).update(revision=F('revision') + 1, error='')
+    # Si está procesando no lo tocamos: al terminar verá que cambió la revisión y quedará pendiente
+    TrabajoPDF.objects.filter(pk=trabajo.pk, estado__in=['listo', 'error']).update(
+        estado='pendiente', solicitado_en=timezone.now()
+    )
+
+    if getattr(settings, 'PDF_COLA_EN_PROCESO', True):
+        transaction.on_commit(_despachar)
+
+
+def _despachar():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'PDF_COLA_WORKERS', 1),
+                thread_name_prefix='cola_pdf',
+            )
+    _executor.submit(_procesar_en_hilo)
+
+
+def _procesar_en_hilo():
+    close_old_connections()
+    try:
+        procesar_pendientes()
+    except Exception as e:
+        print(f"Error procesando cola de PDFs: {e}")
+    finally:
+        connections.close_all()
+
+
+def _tomar_siguiente():
+    """Marca como 'procesando' el trabajo pendiente más antiguo y lo devuelve (o None)."""
+    while True:
+        ahora = timezone.now()
+        candidato = (
+            TrabajoPDF.objects
+            .filter(Q(estado='pendiente') | Q(estado='procesando', iniciado_en__lt=ahora - TIEMPO_MAXIMO_PROCESANDO))
+            .order_by('solicitado_en')
+            .values('pk', 'estado', 'revision', 'iniciado_en')
+            .first()
+        )
+        if candidato is None:
+            return None
+
+        # Actualización condicional: si otro worker lo tomó primero, probamos con el siguiente.
+        # iniciado_en va en el filtro porque un trabajo abandonado sigue 'procesando' al rescatarlo
+        tomado = TrabajoPDF.objects.filter(**candidato).update(estado='procesando', iniciado_en=ahora)
+        if tomado:
+            return candidato['pk'], candidato['revision']
+
+
+def procesar_trabajo(trabajo_id, revision):
+    registro = (
+        RegistroCaso.objects
+        .select_related('causa', 'causa__materia', 'actualizado_por')
+        .get(trabajo_pdf__pk=trabajo_id)
+    )
+
+    if generar_pdf_expediente(registro):
+        campos = {'estado': 'listo', 'error': ''}
+    else:
+        campos = {'estado': 'error', 'error': 'No se pudo generar el PDF del expediente.'}
+
+    terminado = TrabajoPDF.objects.filter(pk=trabajo_id, revision=revision).update(
+        terminado_en=timezone.now(), **campos
+    )
+    if not terminado:
+        # Hubo ediciones mientras se generaba: queda pendiente para un nuevo renderizado
+        TrabajoPDF.objects.filter(pk=trabajo_id).update(estado='pendiente')
+
+
+def procesar_pendientes():
+    """Procesa trabajos hasta vaciar la cola. Devuelve cuántos se procesaron."""
+    procesados = 0
+    while True:
+        siguiente = _tomar_siguiente()
+        if siguiente is None:
+            return procesados
+        try:
+            procesar_trabajo(*siguiente)
+        except RegistroCaso.DoesNotExist:
+            pass
+        procesados += 1
@@ -0,0 +1,179 @@
+"""
+Historial del registro de la causa guardado como diferencias.
+
+Cada edición del registro agrega una versión (el texto anterior a la edición). Para no
+guardar el texto completo cada vez, la versión se guarda como la diferencia por líneas
+respecto de la versión previa, comprimida con zlib; cada REGISTRO_HISTORIAL_COMPLETO_CADA
+versiones (o cuando la diferencia no ahorra espacio) se guarda el texto completo.
+
+Reconstruir una versión cuesta dos consultas: el último texto completo anterior a ella y
+las diferencias entre ambos, que se aplican en orden.
+
+Formato de la diferencia (JSON): lista de operaciones, donde [i, j] copia las líneas
+i..j-1 de la versión previa y un string se inserta tal cual.
+
+Para mostrar, `diff_versiones` compara dos versiones cualesquiera (por línea y por palabra).
+"""
+import json
+import re
+import zlib
+from difflib import SequenceMatcher
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import RegistroCaso, RegistroCasoHistorial
+
+
+def codificar_delta(base, nuevo):
+    """Diferencia comprimida para obtener `nuevo` a partir de `base`."""
+    lineas_base = base.splitlines(keepends=True)
+    lineas_nuevo = nuevo.splitlines(keepends=True)
+
+    operaciones = []
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, lineas_base, lineas_nuevo, autojunk=False).get_opcodes():
+        if op == 'equal':
+            operaciones.append([i1, i2])
+        elif op in ('replace', 'insert'):
+            operaciones.append(''.join(lineas_nuevo[j1:j2]))
+        # 'delete': las líneas simplemente no se copian
+
+    return zlib.compress(json.dumps(operaciones, ensure_ascii=False).encode('utf-8'))
+
+
+def aplicar_delta(base, delta):
+    lineas_base = base.splitlines(keepends=True)
+    partes = []
+    for op in json.loads(zlib.decompress(bytes(delta)).decode('utf-8')):
+        if isinstance(op, str):
+            partes.append(op)
+        else:
+            partes.extend(lineas_base[op[0]:op[1]])
+    return ''.join(partes)
+
+
+def reconstruir(version):
+    """Texto completo de una versión del historial."""
+    if version.tipo == 'completo':
+        return version.contenido
+
+    base = (
+        RegistroCasoHistorial.objects
+        .filter(causa_id=version.causa_id, tipo='completo', numero__lt=version.numero)
+        .order_by('-numero', '-id')
+        .values('numero', 'contenido')
+        .first()
+    )
+    texto = base['contenido'] if base else ''
+    desde = base['numero'] if base else 0
+
+    deltas = (
+        RegistroCasoHistorial.objects
+        .filter(causa_id=version.causa_id, numero__gt=desde, numero__lte=version.numero)
+        .order_by('numero')
+        .values_list('delta', flat=True)
+    )
+    for delta in deltas:
+        texto = aplicar_delta(texto, delta)
+    return texto
+
+
+def guardar_version(causa, contenido, usuario):
+    """Agrega `contenido` (el texto antes de la edición) como nueva versión del historial."""
+    completo_cada = getattr(settings, 'REGISTRO_HISTORIAL_COMPLETO_CADA', 20)
+
+    with transaction.atomic():
+        # Bloquea el registro: dos ediciones simultáneas no pueden tomar el mismo número de versión
+        RegistroCaso.objects.select_for_update().filter(causa=causa).exists()
+
+        anterior = (
+            RegistroCasoHistorial.objects
+            .filter(causa=causa)
+            .defer('contenido', 'delta')
+            .order_by('-numero', '-id')
+            .first()
+        )
+        numero = anterior.numero + 1 if anterior else 1
+
+        version = RegistroCasoHistorial(
+            causa=causa, numero=numero, creado_por=usuario, tamano=len(contenido)
+        )
+
+        if anterior is not None and (numero - 1) % completo_cada != 0:
+            delta = codificar_delta(reconstruir(anterior), contenido)
+            # Si la diferencia no es más chica que el texto comprimido, conviene guardar el texto
+            if len(delta) < len(zlib.compress(contenido.encode('utf-8'))):
+                version.tipo = 'delta'
+                version.delta = delta
+
+        if version.tipo == 'completo':
+            version.contenido = contenido
+
+        version.save()
+    return version
+
+
+# --- Comparación de versiones ---
+
+def _diff_palabras(linea_a, linea_b):
+    """Segmentos [tipo, texto] de una línea modificada, marcando las palabras que cambiaron."""
+    palabras_a = re.split(r'(\s+)', linea_a)
+    palabras_b = re.split(r'(\s+)', linea_b)
+    segmentos = []
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, palabras_a, palabras_b, autojunk=False).get_opcodes():
+        if op == 'equal':
+            segmentos.append(['igual', ''.join(palabras_a[i1:i2])])
+            continue
+        if i2 > i1:
+            segmentos.append(['eliminada', ''.join(palabras_a[i1:i2])])
+        if j2 > j1:
+            segmentos.append(['agregada', ''.join(palabras_b[j1:j2])])
+    return segmentos
+
+
+def calcular_diff(texto_a, texto_b, contexto=3):
+    """
+    Diferencias por línea entre dos textos, agrupadas en bloques con `contexto` líneas
+    sin cambios alrededor. Las líneas reemplazadas se emparejan y se comparan por palabra.
+    Devuelve solo listas/dicts/strings (se puede guardar en caché tal cual).
+    """
+    lineas_a = texto_a.splitlines()
+    lineas_b = texto_b.splitlines()
+    bloques = []
+
+    matcher = SequenceMatcher(None, lineas_a, lineas_b, autojunk=False)
+    for grupo in matcher.get_grouped_opcodes(contexto):
+        lineas = []
+        for op, i1, i2, j1, j2 in grupo:
+            if op == 'equal':
+                for k in range(i2 - i1):
+                    lineas.append({'tipo': 'igual', 'a': i1 + k + 1, 'b': j1 + k + 1, 'texto': lineas_a[i1 + k]})
+                continue
+
+            pares = min(i2 - i1, j2 - j1) if op == 'replace' else 0
+            for k in range(pares):
+                lineas.append({
+                    'tipo': 'modificada', 'a': i1 + k + 1, 'b': j1 + k + 1,
+                    'segmentos': _diff_palabras(lineas_a[i1 + k], lineas_b[j1 + k]),
+                })
+            for k in range(i1 + pares, i2):
+                lineas.append({'tipo': 'eliminada', 'a': k + 1, 'b': None, 'texto': lineas_a[k]})
+            for k in range(j1 + pares, j2):
+                lineas.append({'tipo': 'agregada', 'a': None, 'b': k + 1, 'texto': lineas_b[k]})
+
+        bloques.append({'inicio_a': grupo[0][1] + 1, 'inicio_b': grupo[0][3] + 1, 'lineas': lineas})
+    return bloques
+
+
+def diff_versiones(version_a, version_b):
+    """
+    Diferencias entre dos versiones del historial. Las versiones no cambian una vez
+    guardadas, así que el resultado se calcula una sola vez por par y queda en caché.
+    """
+    clave = f'registro_diff:{version_a.pk}:{version_b.pk}'
+    bloques = cache.get(clave)
+    if bloques is None:
+        bloques = calcular_diff(reconstruir(version_a), reconstruir(version_b))
+        cache.set(clave, bloques, getattr(settings, 'FRAGMENTOS_CACHE_SEGUNDOS', 60 * 60 * 24))
+    return bloques
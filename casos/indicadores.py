@@ -0,0 +1,129 @@
+"""
+Indicadores precalculados del panel de inicio.
+
+En vez de contar causas en cada visita al inicio, los contadores viven en la tabla
+IndicadorPanel y se ajustan con señales (casos/signals.py) al guardar o borrar una
+Causa. Las citas y documentos no se cuentan: solo se lleva una "versión" que cambia
+con cada guardado y forma parte de la llave de los fragmentos cacheados de home.html.
+Cada usuario tiene además su propia versión, que cambia cuando gana o pierde una causa.
+
+Como un queryset.update() no emite señales, el comando `reconciliar_indicadores`
+recalcula todo desde cero; conviene programarlo periódicamente (cron).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import Causa, IndicadorPanel
+
+GLOBAL = 'global'
+
+CASOS_ACTIVOS = 'casos_activos'
+VERSION_CITAS = 'version_citas'
+VERSION_DOCUMENTOS = 'version_documentos'
+VERSION_USUARIO = 'version_usuario'
+
+ESTADOS_INACTIVOS = ['archivada']
+
+
+def ambito_usuario(usuario_id):
+    return f'usuario:{usuario_id}'
+
+
+def es_activa(estado):
+    return estado is not None and estado not in ESTADOS_INACTIVOS
+
+
+def sumar(ambito, clave, delta):
+    """Suma `delta` al contador (si aún no existe, lo creará la lectura o la reconciliación)."""
+    return IndicadorPanel.objects.filter(ambito=ambito, clave=clave).update(
+        valor=F('valor') + delta, actualizado_en=timezone.now()
+    )
+
+
+def fijar(ambito, clave, valor):
+    IndicadorPanel.objects.update_or_create(ambito=ambito, clave=clave, defaults={'valor': valor})
+
+
+def tocar_version(clave, ambito=GLOBAL):
+    """Incrementa una versión (invalida los fragmentos cacheados que la usan)."""
+    if sumar(ambito, clave, 1):
+        return
+    try:
+        with transaction.atomic():
+            IndicadorPanel.objects.create(ambito=ambito, clave=clave, valor=1)
+    except IntegrityError:
+        # Otra petición la creó al mismo tiempo
+        sumar(ambito, clave, 1)
+
+
+def tocar_version_usuario(*usuario_ids):
+    """Invalida los fragmentos del panel de inicio propios de cada usuario indicado."""
+    for usuario_id in {pk for pk in usuario_ids if pk}:
+        tocar_version(VERSION_USUARIO, ambito_usuario(usuario_id))
+
+
+def tocar_version_causa(*causa_ids):
+    """Invalida los fragmentos cacheados del detalle de las causas indicadas."""
+    causa_ids = [pk for pk in causa_ids if pk]
+    if causa_ids:
+        Causa.objects.filter(pk__in=causa_ids).update(version_fragmentos=F('version_fragmentos') + 1)
+
+
+def contar_casos_activos(usuario_id=None):
+    qs = Causa.objects.exclude(estado__in=ESTADOS_INACTIVOS)
+    if usuario_id is not None:
+        qs = qs.filter(responsable_id=usuario_id)
+    return qs.count()
+
+
+def leer_panel(usuario):
+    """
+    Devuelve los indicadores que usa home.html en una sola consulta:
+    {'casos_activos': n, 'version_citas': v, 'version_documentos': v, 'version_usuario': v}.
+    """
+    ambito_propio = ambito_usuario(usuario.pk)
+    filas = IndicadorPanel.objects.filter(ambito__in=[GLOBAL, ambito_propio]).values_list('ambito', 'clave', 'valor')
+    valores = {(ambito, clave): valor for ambito, clave, valor in filas}
+
+    # Si es estudiante, solo contamos SUS casos activos
+    if usuario.rol == 'estudiante':
+        ambito_casos, usuario_id = ambito_propio, usuario.pk
+    else:
+        ambito_casos, usuario_id = GLOBAL, None
+
+    casos_activos = valores.get((ambito_casos, CASOS_ACTIVOS))
+    if casos_activos is None:
+        # Primera lectura de este contador: se calcula una vez y desde ahí lo mantienen las señales
+        casos_activos = contar_casos_activos(usuario_id)
+        fijar(ambito_casos, CASOS_ACTIVOS, casos_activos)
+
+    return {
+        'casos_activos': casos_activos,
+        'version_citas': valores.get((GLOBAL, VERSION_CITAS), 0),
+        'version_documentos': valores.get((GLOBAL, VERSION_DOCUMENTOS), 0),
+        'version_usuario': valores.get((ambito_propio, VERSION_USUARIO), 0),
+    }
+
+
+def recalcular_indicadores():
+    """Recalcula todos los contadores desde las tablas originales. Devuelve cuántos se escribieron."""
+    por_responsable = dict(
+        Causa.objects.exclude(estado__in=ESTADOS_INACTIVOS)
+        .values('responsable_id')
+        .annotate(total=Count('id'))
+        .values_list('responsable_id', 'total')
+    )
+
+    with transaction.atomic():
+        fijar(GLOBAL, CASOS_ACTIVOS, contar_casos_activos())
+
+        # Usuarios que ya no tienen causas activas quedan en 0
+        existentes = IndicadorPanel.objects.filter(ambito__startswith='usuario:', clave=CASOS_ACTIVOS)
+        existentes.exclude(ambito__in=[ambito_usuario(pk) for pk in por_responsable]).update(valor=0)
+
+        for usuario_id, total in por_responsable.items():
+            if usuario_id is not None:
+                fijar(ambito_usuario(usuario_id), CASOS_ACTIVOS, total)
+
+    return len(por_responsable) + 1
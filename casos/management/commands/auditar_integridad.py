@@ -0,0 +1,142 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from casos import bitacora
+from documentos.models import Documento
+from documentos.integridad import hashear_archivo, TAMANO_BUFFER_HASH
+
+CAMPOS_ACTUALIZADOS = [
+    'hash_fallido', 'estado_integridad', 'verificado_hash', 'verificado_tamano',
+    'verificado_mtime_ns', 'fecha_verificacion', 'huella_tamano', 'huella_mtime_ns', 'huella_inode',
+]
+
+
+def _hashear(args):
+    # Se ejecuta en un proceso hijo: solo recibe datos simples y no toca la base de datos
+    doc_id, ruta, tamano_buffer = args
+    try:
+        hash_actual, huella = hashear_archivo(ruta, tamano_buffer)
+        return doc_id, hash_actual, huella, None
+    except FileNotFoundError:
+        return doc_id, None, None, 'perdido'
+    except OSError as e:
+        return doc_id, None, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Audita la integridad (SHA-256) de todos los documentos de todas las causas. Se puede reanudar si se interrumpe.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                            help='Procesos que calculan hashes en paralelo.')
+        parser.add_argument('--lote', type=int, default=500,
+                            help='Documentos por lote (cada lote se guarda y marca el avance).')
+        parser.add_argument('--buffer-mb', type=int, default=TAMANO_BUFFER_HASH // (1024 * 1024),
+                            help='Tamaño del buffer de lectura en MB.')
+        parser.add_argument('--checkpoint', default=os.path.join(settings.MEDIA_ROOT, '.auditoria_integridad.json'),
+                            help='Archivo donde se guarda el avance de la auditoría.')
+        parser.add_argument('--reiniciar', action='store_true',
+                            help='Ignora el avance guardado y comienza desde el primer documento.')
+
+    def handle(self, *args, **options):
+        ruta_checkpoint = options['checkpoint']
+        tamano_buffer = options['buffer_mb'] * 1024 * 1024
+
+        avance = {'ultimo_id': 0, 'procesados': 0, 'alertas': 0, 'iniciado': timezone.now().isoformat()}
+        if not options['reiniciar'] and os.path.exists(ruta_checkpoint):
+            with open(ruta_checkpoint) as f:
+                avance = json.load(f)
+            self.stdout.write(self.style.WARNING(
+                f"Reanudando auditoría desde el documento ID {avance['ultimo_id']} "
+                f"({avance['procesados']} ya procesados)."
+            ))
+        else:
+            self.stdout.write(self.style.WARNING('Iniciando auditoría de integridad...'))
+
+        # Igual que la verificación en línea: sin archivo asociado no hay nada que hashear (y .path fallaría)
+        qs = Documento.objects.exclude(hash_archivo__isnull=True).exclude(hash_archivo='').exclude(archivo='').order_by('id')
+
+        # Modo de alto volumen: las alertas se insertan en bloques de `lote` filas
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor, bitacora.agrupar(lote=options['lote']) as alertas_pendientes:
+            while True:
+                lote = list(qs.filter(id__gt=avance['ultimo_id'])[:options['lote']])
+                if not lote:
+                    break
+
+                tareas = [(doc.id, doc.archivo.path, tamano_buffer) for doc in lote]
+                resultados = {
+                    doc_id: (hash_actual, huella, error)
+                    for doc_id, hash_actual, huella, error in executor.map(_hashear, tareas, chunksize=8)
+                }
+
+                alertas = self.procesar_lote(lote, resultados)
+
+                # Las alertas del lote se guardan antes de marcar el avance
+                alertas_pendientes.vaciar()
+
+                avance['ultimo_id'] = lote[-1].id
+                avance['procesados'] += len(lote)
+                avance['alertas'] += alertas
+                self.guardar_avance(ruta_checkpoint, avance)
+
+                self.stdout.write(f" - {avance['procesados']} documentos auditados (último ID {avance['ultimo_id']}, {avance['alertas']} alertas)")
+
+        if os.path.exists(ruta_checkpoint):
+            os.remove(ruta_checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"¡Auditoría finalizada! {avance['procesados']} documentos revisados, {avance['alertas']} alertas nuevas."
+        ))
+
+    def procesar_lote(self, lote, resultados):
+        """Aplica los resultados de un lote con un bulk_update y un bulk_create de alertas."""
+        ahora = timezone.now()
+        alertas = []
+
+        for doc in lote:
+            hash_actual, huella, error = resultados[doc.id]
+            doc.fecha_verificacion = ahora
+            doc.verificado_hash = hash_actual
+            doc.verificado_tamano, doc.verificado_mtime_ns = (huella[0], huella[1]) if huella else (None, None)
+
+            if error == 'perdido':
+                doc.estado_integridad = 'perdido'
+
+            elif hash_actual == doc.hash_archivo:
+                doc.estado_integridad = 'integro'
+                doc.hash_fallido = None
+                doc.huella_tamano, doc.huella_mtime_ns, doc.huella_inode = huella
+
+            else:
+                doc.estado_integridad = 'modificado'
+                # Misma lógica anti-spam que la verificación en línea: solo alertamos hashes nuevos
+                if hash_actual != doc.hash_fallido:
+                    alertas.append(doc)
+                    doc.hash_fallido = hash_actual
+
+        with transaction.atomic():
+            Documento.objects.bulk_update(lote, CAMPOS_ACTUALIZADOS)
+            # Solo entran al buffer de la Bitácora si el bulk_update se confirma
+            for doc in alertas:
+                bitacora.registrar(
+                    causa=doc.causa_id,
+                    usuario=None,
+                    accion='nota',
+                    detalle=f"ALERTA SEGURIDAD CRÍTICA: Hash inconsistente en documento ID {doc.id}. (Detectado en auditoría masiva)"
+                )
+
+        return len(alertas)
+
+    def guardar_avance(self, ruta, avance):
+        # Escritura atómica: si el proceso muere a mitad, el checkpoint anterior sigue válido
+        os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+        temporal = f"{ruta}.tmp"
+        with open(temporal, 'w') as f:
+            json.dump(avance, f)
+        os.replace(temporal, ruta)
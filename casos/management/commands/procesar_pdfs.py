@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from casos.cola_pdf import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Procesa la cola de PDFs de expedientes pendientes (TrabajoPDF)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true',
+                            help='Sigue revisando la cola indefinidamente en lugar de terminar al vaciarla.')
+        parser.add_argument('--intervalo', type=int, default=5,
+                            help='Segundos de espera entre revisiones en modo continuo.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.WARNING('Procesando cola de PDFs de expedientes...'))
+
+        while True:
+            procesados = procesar_pendientes()
+            if procesados:
+                self.stdout.write(self.style.SUCCESS(f' - {procesados} PDF(s) generados'))
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS('Cola de PDFs vacía.'))
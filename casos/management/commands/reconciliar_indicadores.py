@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from casos.indicadores import recalcular_indicadores
+
+
+class Command(BaseCommand):
+    help = ('Recalcula desde cero los indicadores del panel de inicio. '
+            'Pensado para ejecutarse periódicamente (cron) y corregir cambios hechos sin señales.')
+
+    def handle(self, *args, **options):
+        escritos = recalcular_indicadores()
+        self.stdout.write(self.style.SUCCESS(f'¡Indicadores reconciliados! {escritos} contadores actualizados.'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from casos import busqueda
+from casos.models import Causa, RegistroCaso, Bitacora, TerminoBusqueda
+from documentos.models import Documento
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye desde cero el índice de búsqueda (causas, registros, bitácora y documentos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Filas procesadas por lote.')
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+        self.stdout.write(self.style.WARNING('Reconstruyendo índice de búsqueda...'))
+
+        with transaction.atomic():
+            TerminoBusqueda.objects.all().delete()
+
+            for causa in Causa.objects.only('id', 'rol_rit', 'caratula', 'descripcion').iterator(chunk_size=lote):
+                busqueda.indexar_causa(causa)
+            self.stdout.write(' - Causas indexadas')
+
+            for registro in RegistroCaso.objects.only('id', 'causa_id', 'contenido').iterator(chunk_size=lote):
+                busqueda.indexar_registro(registro)
+            self.stdout.write(' - Registros indexados')
+
+            for documento in Documento.objects.only('id', 'causa_id', 'nombre').iterator(chunk_size=lote):
+                busqueda.indexar_documento(documento)
+            self.stdout.write(' - Documentos indexados')
+
+            pendientes = []
+            for bitacora in Bitacora.objects.only('id', 'causa_id', 'detalle').iterator(chunk_size=lote):
+                pendientes.append(bitacora)
+                if len(pendientes) >= lote:
+                    busqueda.indexar_bitacoras(pendientes)
+                    pendientes = []
+            busqueda.indexar_bitacoras(pendientes)
+            self.stdout.write(' - Bitácora indexada')
+
+        self.stdout.write(self.style.SUCCESS(f'¡Índice reconstruido! {TerminoBusqueda.objects.count()} términos.'))
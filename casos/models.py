@@ -35,10 +35,54 @@ class Causa(models.Model):
     
     estado = models.CharField(max_length=20, choices=ESTADOS, default='en_estudio')
     descripcion = models.TextField(blank=True)
+    # Se incrementa cada vez que cambia algo que muestra detalle_caso.html (ver casos/signals.py);
+    # forma parte de la llave de los fragmentos cacheados, así que no dependen de un TTL
+    version_fragmentos = models.PositiveIntegerField(default=0, editable=False)
+    # Último orden_expediente asignado a un documento de la causa (ver siguiente_orden_documento)
+    ultimo_orden_documento = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Paginación por cursor del listado de causas (CausaListView)
+            models.Index(fields=['fecha_ingreso', 'id'], name='causa_ingreso_id_idx'),
+            # Listado y contadores de un estudiante: sus causas por estado, más recientes primero
+            models.Index(fields=['responsable', 'estado', 'fecha_ingreso'], name='causa_resp_estado_idx'),
+        ]
 
     def __str__(self):
         return f"{self.rol_rit} - {self.caratula}"
 
+    # Contadores que solo se modifican con update(F()): un save() con la instancia ya
+    # cargada no debe devolverlos a un valor anterior
+    CAMPOS_CONTADORES = ('version_fragmentos', 'ultimo_orden_documento')
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CAMPOS_CONTADORES
+            ]
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def siguiente_orden_documento(cls, causa_id):
+        """
+        Reserva el siguiente número de documento de la causa. Debe llamarse dentro de
+        transaction.atomic(): la fila de la causa queda bloqueada hasta que la transacción
+        termina, así dos subidas simultáneas nunca reciben el mismo número.
+        """
+        ultimo = cls.objects.select_for_update().values_list('ultimo_orden_documento', flat=True).get(pk=causa_id)
+
+        if ultimo == 0:
+            # Causa con documentos anteriores al contador: se parte desde el mayor número existente
+            from documentos.models import Documento
+            ultimo = Documento.objects.filter(causa_id=causa_id).aggregate(
+                ultimo=models.Max('orden_expediente')
+            )['ultimo'] or 0
+
+        cls.objects.filter(pk=causa_id).update(ultimo_orden_documento=ultimo + 1)
+        return ultimo + 1
+
 class Participante(models.Model):
     ROLES_CAUSA = (
         ('demandante', 'Demandante / Víctima'),
@@ -77,6 +121,10 @@ class Bitacora(models.Model):
 
     class Meta:
         ordering = ['-fecha']
+        indexes = [
+            # Paginación por cursor del historial de cada causa (casos:historial_movimientos)
+            models.Index(fields=['causa', 'fecha', 'id'], name='bitacora_causa_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_accion_display()} - {self.causa} ({self.fecha})"
@@ -88,6 +136,8 @@ class RegistroCaso(models.Model):
     contenido = models.TextField(blank=True,default='')
     
     archivo = models.FileField(upload_to='expedientes/', blank=True, null=True, verbose_name="Expediente PDF")
+    # Digest de los datos con que se generó `archivo` (ver casos.utils.digest_expediente)
+    pdf_digest = models.CharField(max_length=64, blank=True, editable=False)
 
     actualizado_por = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.SET_NULL, null=True,blank=True)
     actualizado_en = models.DateTimeField(auto_now=True)
@@ -95,15 +145,106 @@ class RegistroCaso(models.Model):
     def __str__(self):
         return f"Registro de {self.causa.rol_rit}"
 
+class TrabajoPDF(models.Model):
+    """
+    Cola local (en base de datos) para generar el PDF del expediente fuera de la petición.
+    Hay un único trabajo por registro: las ediciones repetidas solo incrementan `revision`
+    y se resuelven con un solo renderizado (ver casos/cola_pdf.py).
+    """
+    ESTADOS = (
+        ('pendiente', 'Pendiente'),
+        ('procesando', 'En Preparación'),
+        ('listo', 'Listo'),
+        ('error', 'Error'),
+    )
+
+    registro = models.OneToOneField(RegistroCaso, on_delete=models.CASCADE, related_name='trabajo_pdf')
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    revision = models.PositiveIntegerField(default=0)
+    solicitado_en = models.DateTimeField(auto_now_add=True)
+    iniciado_en = models.DateTimeField(null=True, blank=True)
+    terminado_en = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"PDF de {self.registro.causa.rol_rit} ({self.get_estado_display()})"
+
+    @property
+    def en_preparacion(self):
+        return self.estado in ['pendiente', 'procesando']
+
 class RegistroCasoHistorial(models.Model):
+    """
+    Versión anterior del registro de una causa. Cada cierto número de versiones se guarda
+    el texto completo; las demás guardan solo la diferencia comprimida con la versión
+    previa (ver casos/historial.py para reconstruirlas).
+    """
+    TIPOS = (
+        ('completo', 'Texto Completo'),
+        ('delta', 'Diferencia'),
+    )
+
     causa = models.ForeignKey('Causa', on_delete=models.CASCADE,related_name='registro_historial')
-    contenido = models.TextField() # snapshot del texto antes del cambip
+    contenido = models.TextField(blank=True) # snapshot del texto antes del cambio (solo en versiones 'completo')
+    numero = models.PositiveIntegerField(default=0, editable=False)
+    tipo = models.CharField(max_length=10, choices=TIPOS, default='completo', editable=False)
+    delta = models.BinaryField(null=True, blank=True, editable=False) # zlib(JSON) respecto de la versión anterior
+    tamano = models.PositiveIntegerField(default=0, editable=False) # largo del texto completo de esta versión
     creado_por = models.ForeignKey(settings.AUTH_USER_MODEL,on_delete=models.SET_NULL, null=True,blank=True)
     creado_en = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ['-creado_en']
+        indexes = [
+            # Versiones del registro de una causa, de la más reciente a la más antigua
+            models.Index(fields=['causa', 'creado_en'], name='historial_causa_creado_idx'),
+            # Reconstrucción: último texto completo y diferencias siguientes de una causa
+            models.Index(fields=['causa', 'numero'], name='historial_causa_numero_idx'),
+        ]
 
     def __str__(self):
         return f"Historial de Registro de {self.causa.rol_rit} - {self.creado_en}"
-    
+
+class TerminoBusqueda(models.Model):
+    """
+    Índice invertido local para la búsqueda de texto (ver casos/busqueda.py).
+    Una fila por término distinto de cada objeto indexado, asociada a su causa.
+    """
+    ORIGENES = (
+        ('causa', 'Causa'),
+        ('registro', 'Registro del Caso'),
+        ('bitacora', 'Bitácora'),
+        ('documento', 'Documento'),
+    )
+
+    termino = models.CharField(max_length=40)
+    causa = models.ForeignKey(Causa, on_delete=models.CASCADE, related_name='+')
+    origen = models.CharField(max_length=20, choices=ORIGENES)
+    objeto_id = models.PositiveBigIntegerField(null=True)
+    frecuencia = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['termino', 'causa'], name='busqueda_termino_idx'),
+            models.Index(fields=['origen', 'objeto_id'], name='busqueda_objeto_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.termino} ({self.get_origen_display()} {self.objeto_id})"
+
+class IndicadorPanel(models.Model):
+    """
+    Contadores precalculados del panel de inicio (ver casos/indicadores.py).
+    `ambito` es 'global' o 'usuario:<id>'; las señales los mantienen al día y el
+    comando `reconciliar_indicadores` los recalcula desde cero.
+    """
+    ambito = models.CharField(max_length=30)
+    clave = models.CharField(max_length=40)
+    valor = models.BigIntegerField(default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('ambito', 'clave')
+
+    def __str__(self):
+        return f"{self.ambito} · {self.clave} = {self.valor}"
@@ -0,0 +1,123 @@
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from agenda.models import Cita
+from documentos.models import Documento
+from . import busqueda, indicadores
+from personas.models import Persona
+from .models import Causa, RegistroCaso, Bitacora, Participante
+
+
+def _cambio_algun_campo(update_fields, campos):
+    # save(update_fields=[...]) que no toca los campos indexados no requiere reindexar
+    return update_fields is None or bool(set(update_fields) & set(campos))
+
+
+# --- Índice de búsqueda (casos/busqueda.py) ---
+
+@receiver(post_save, sender=Causa)
+def indexar_causa(sender, instance, update_fields=None, **kwargs):
+    if _cambio_algun_campo(update_fields, ['rol_rit', 'caratula', 'descripcion']):
+        busqueda.indexar_causa(instance)
+
+
+@receiver(post_save, sender=RegistroCaso)
+def indexar_registro(sender, instance, update_fields=None, **kwargs):
+    if _cambio_algun_campo(update_fields, ['contenido']):
+        busqueda.indexar_registro(instance)
+
+
+@receiver(post_save, sender=Bitacora)
+def indexar_bitacora(sender, instance, created, **kwargs):
+    if created:
+        busqueda.indexar_bitacoras([instance])
+
+
+@receiver(post_save, sender=Documento)
+def indexar_documento(sender, instance, update_fields=None, **kwargs):
+    if _cambio_algun_campo(update_fields, ['nombre']):
+        busqueda.indexar_documento(instance)
+
+
+@receiver(post_delete, sender=Documento)
+def desindexar_documento(sender, instance, **kwargs):
+    busqueda.desindexar('documento', instance.pk)
+
+
+# --- Indicadores del panel de inicio (casos/indicadores.py) ---
+
+def _estado_kpi(instance):
+    # Se lee de __dict__ para no disparar consultas con campos diferidos (.only/.defer)
+    return instance.__dict__.get('estado'), instance.__dict__.get('responsable_id')
+
+
+@receiver(post_init, sender=Causa)
+def recordar_estado_kpi(sender, instance, **kwargs):
+    instance._estado_kpi = _estado_kpi(instance) if instance.pk else (None, None)
+
+
+def _mover_caso_activo(responsable_id, delta):
+    indicadores.sumar(indicadores.GLOBAL, indicadores.CASOS_ACTIVOS, delta)
+    if responsable_id:
+        indicadores.sumar(indicadores.ambito_usuario(responsable_id), indicadores.CASOS_ACTIVOS, delta)
+
+
+@receiver(post_save, sender=Causa)
+def actualizar_casos_activos(sender, instance, created, **kwargs):
+    estado_antes, responsable_antes = (None, None) if created else instance._estado_kpi
+    estado_ahora, responsable_ahora = _estado_kpi(instance)
+
+    if not created and estado_antes is None:
+        # La instancia se cargó sin el estado: no sabemos qué cambió, se recuentan los ámbitos afectados
+        indicadores.fijar(indicadores.GLOBAL, indicadores.CASOS_ACTIVOS, indicadores.contar_casos_activos())
+        if responsable_ahora:
+            indicadores.fijar(indicadores.ambito_usuario(responsable_ahora), indicadores.CASOS_ACTIVOS,
+                              indicadores.contar_casos_activos(responsable_ahora))
+    else:
+        activa_antes = indicadores.es_activa(estado_antes)
+        activa_ahora = indicadores.es_activa(estado_ahora)
+        if (activa_antes, responsable_antes) != (activa_ahora, responsable_ahora):
+            if activa_antes:
+                _mover_caso_activo(responsable_antes, -1)
+            if activa_ahora:
+                _mover_caso_activo(responsable_ahora, 1)
+
+    if not created and responsable_antes != responsable_ahora:
+        # Los documentos del panel del estudiante dependen de qué causas tiene a cargo
+        indicadores.tocar_version_usuario(responsable_antes, responsable_ahora)
+
+    instance._estado_kpi = (estado_ahora, responsable_ahora)
+
+
+@receiver(post_delete, sender=Causa)
+def descontar_caso_activo(sender, instance, **kwargs):
+    estado, responsable_id = instance._estado_kpi
+    if indicadores.es_activa(estado):
+        _mover_caso_activo(responsable_id, -1)
+
+
+@receiver([post_save, post_delete], sender=Cita)
+def invalidar_panel_citas(sender, **kwargs):
+    indicadores.tocar_version(indicadores.VERSION_CITAS)
+
+
+@receiver([post_save, post_delete], sender=Documento)
+def invalidar_panel_documentos(sender, **kwargs):
+    indicadores.tocar_version(indicadores.VERSION_DOCUMENTOS)
+
+
+# --- Fragmentos cacheados del detalle de la causa (detalle_caso.html) ---
+
+@receiver([post_save, post_delete], sender=Bitacora)
+@receiver([post_save, post_delete], sender=Participante)
+@receiver([post_save, post_delete], sender=Documento)
+@receiver([post_save, post_delete], sender=Cita)
+def invalidar_fragmentos_causa(sender, instance, **kwargs):
+    indicadores.tocar_version_causa(instance.causa_id)
+
+
+@receiver(post_save, sender=Persona)
+def invalidar_fragmentos_persona(sender, instance, created, **kwargs):
+    # El nombre del interviniente se muestra en la tabla cacheada de participantes
+    if not created:
+        indicadores.tocar_version_causa(*instance.participante_set.values_list('causa_id', flat=True).distinct())
@@ -1,3 +1,561 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models.query import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from agenda.models import Cita
+from documentos.models import Documento
+from personas.models import Persona, Usuario
+from . import bitacora, cola_pdf, utils
+from .views import MOVIMIENTOS_POR_PAGINA, CausaListView, pagina_historial
+from .management.commands.auditar_integridad import Command as AuditarIntegridad
+from .busqueda import buscar_causas, buscar_documentos
+from .historial import guardar_version, reconstruir
+from .models import Causa, Participante, Bitacora, RegistroCaso, RegistroCasoHistorial, TerminoBusqueda, TrabajoPDF
 
 # Create your tests here.
+
+@override_settings(INTEGRIDAD_VERIFICACION_SINCRONA=True, PDF_COLA_EN_PROCESO=False)
+class DetalleCausaConsultasTests(TestCase):
+    """El detalle del caso debe cargarse con la misma cantidad de consultas sin importar su tamaño."""
+
+    # sesión + usuario + causa (con joins) + documentos + participantes, historial y citas
+    # (estos tres solo cuando su fragmento no está en caché)
+    PRESUPUESTO_CONSULTAS = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.director = Usuario.objects.create_user(
+            username='director', password='clave-segura-123', rut='11111111-1',
+            email='director@clinica.cl', rol='director', first_name='Ana', last_name='Director'
+        )
+        cls.cliente = Persona.objects.create(rut='22.222.222-2', nombres='Juan', apellidos='Pérez')
+        cls.causa = Causa.objects.create(
+            rol_rit='C-100-2025', caratula='Pérez con González', cliente=cls.cliente, responsable=cls.director
+        )
+        RegistroCaso.objects.create(causa=cls.causa, contenido='Apertura', actualizado_por=cls.director)
+
+    def setUp(self):
+        # Los ids y versiones se repiten entre tests: un fragmento cacheado por otro test ocultaría consultas
+        cache.clear()
+        self.client.force_login(self.director)
+        self.url = reverse('casos:detalle', kwargs={'pk': self.causa.pk})
+
+    def poblar(self, cantidad):
+        inicio = Persona.objects.count()
+        for i in range(cantidad):
+            persona = Persona.objects.create(rut=f'{inicio + i}-K', nombres=f'Testigo {i}', apellidos='Prueba')
+            Participante.objects.create(causa=self.causa, persona=persona, rol='testigo')
+            Bitacora.objects.create(causa=self.causa, usuario=self.director, accion='nota', detalle=f'Nota {i}')
+            # Archivo ya verificado como inexistente: la verificación de integridad no agrega consultas
+            Documento.objects.create(
+                causa=self.causa, subido_por=self.director, nombre=f'Escrito {i}',
+                archivo=f'documentos/2025/01/escrito_{i}.pdf', hash_archivo='0' * 64,
+                estado_integridad='perdido', fecha_verificacion=timezone.now()
+            )
+            Cita.objects.create(
+                causa=self.causa, responsable=self.director,
+                fecha_hora=timezone.now() + timedelta(days=i + 1)
+            )
+
+    def contar_consultas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+
+    def test_presupuesto_de_consultas_constante(self):
+        self.poblar(1)
+        con_pocos = self.contar_consultas()
+
+        self.poblar(15)
+        con_muchos = self.contar_consultas()
+
+        self.assertEqual(con_pocos, con_muchos)
+        self.assertLessEqual(con_muchos, self.PRESUPUESTO_CONSULTAS)
+
+    def test_fragmentos_cacheados_se_invalidan_al_cambiar_la_causa(self):
+        self.poblar(2)
+        sin_cache = self.contar_consultas()
+        self.assertLess(self.contar_consultas(), sin_cache)
+
+        Bitacora.objects.create(causa=self.causa, usuario=self.director, accion='nota', detalle='Movimiento nuevo')
+        self.assertContains(self.client.get(self.url), 'Movimiento nuevo')
+
+
+class IndicesConsultasFrecuentesTests(TestCase):
+    """Las consultas más usadas deben resolverse con un índice, nunca recorriendo la tabla completa."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='33333333-3',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cliente = Persona.objects.create(rut='44.444.444-4', nombres='María', apellidos='Soto')
+        for i in range(30):
+            causa = Causa.objects.create(
+                rol_rit=f'C-{i}-2025', caratula=f'Soto con Empresa {i}', cliente=cliente,
+                responsable=cls.estudiante if i % 3 == 0 else None
+            )
+            Bitacora.objects.create(causa=causa, usuario=cls.estudiante, accion='nota', detalle='Nota')
+            RegistroCasoHistorial.objects.create(causa=causa, contenido='Versión anterior')
+            Cita.objects.create(causa=causa, responsable=cls.estudiante, fecha_hora=timezone.now() + timedelta(hours=i))
+        cls.causa = causa
+
+    def consultas_frecuentes(self):
+        ahora = timezone.now()
+        return {
+            'causas del estudiante por estado': Causa.objects.filter(
+                responsable=self.estudiante, estado='en_tramite'
+            ).order_by('-fecha_ingreso'),
+            'citas del día del responsable': Cita.objects.filter(
+                fecha_hora__range=(ahora, ahora + timedelta(days=1)), responsable=self.estudiante
+            ),
+            'agenda del responsable por rango': Cita.objects.filter(
+                responsable=self.estudiante, fecha_hora__gte=ahora, fecha_hora__lt=ahora + timedelta(days=7)
+            ).order_by('fecha_hora'),
+            'documentos de la causa por fecha': Documento.objects.filter(causa=self.causa).order_by('-fecha_subida'),
+            'historial de la causa': Bitacora.objects.filter(causa=self.causa).order_by('-fecha', '-id'),
+            'versiones del registro': RegistroCasoHistorial.objects.filter(causa=self.causa).order_by('-creado_en'),
+        }
+
+    def escaneo_completo(self, queryset):
+        """Devuelve la tabla que el plan recorre completa (o None si todo usa índices)."""
+        vendor = connection.vendor
+        if vendor == 'mysql':
+            plan = json.loads(queryset.explain(format='JSON'))
+            tablas = re.findall(r'"table_name": "(\w+)",\s*"access_type": "ALL"', json.dumps(plan, indent=1))
+            return tablas[0] if tablas else None
+        if vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # Con tablas de prueba tan pequeñas el planificador preferiría Seq Scan igual
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            encontrado = re.search(r'Seq Scan on (\w+)', queryset.explain())
+            return encontrado.group(1) if encontrado else None
+        if vendor == 'sqlite':
+            encontrado = re.search(r'\bSCAN (\w+)(?! USING)', queryset.explain())
+            return encontrado.group(1) if encontrado else None
+        self.skipTest(f'EXPLAIN no soportado para {vendor}')
+
+    def test_consultas_frecuentes_usan_indices(self):
+        for nombre, queryset in self.consultas_frecuentes().items():
+            with self.subTest(consulta=nombre):
+                tabla = self.escaneo_completo(queryset)
+                self.assertIsNone(tabla, f"'{nombre}' recorre la tabla completa {tabla}:\n{queryset.explain()}")
+
+
+@override_settings(REGISTRO_HISTORIAL_COMPLETO_CADA=5)
+class HistorialRegistroDeltaTests(TestCase):
+    """Las versiones guardadas como diferencias deben reconstruirse exactamente."""
+
+    def test_todas_las_versiones_se_reconstruyen(self):
+        cliente = Persona.objects.create(rut='55.555.555-5', nombres='Luis', apellidos='Rojas')
+        causa = Causa.objects.create(rol_rit='C-500-2025', caratula='Rojas con Fisco', cliente=cliente)
+        RegistroCaso.objects.create(causa=causa, contenido='')
+
+        lineas = [f'Línea {i} del registro.' for i in range(200)]
+        textos = []
+        for i in range(12):
+            lineas[i * 7] = f'Línea {i * 7} corregida en la edición {i}.'
+            if i % 4 == 0:
+                lineas.insert(i, f'Nueva línea en la edición {i}.')
+            textos.append('\n'.join(lineas))
+            guardar_version(causa, textos[-1], None)
+
+        versiones = list(RegistroCasoHistorial.objects.filter(causa=causa).order_by('numero'))
+        self.assertEqual([v.tipo for v in versiones[:6]], ['completo', 'delta', 'delta', 'delta', 'delta', 'completo'])
+        for version, texto in zip(versiones, textos):
+            self.assertEqual(reconstruir(version), texto)
+
+
+class PermisosHistorialRegistroTests(TestCase):
+    """Las versiones del registro siguen las mismas reglas que el listado del historial."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cls.secretaria = Usuario.objects.create_user(
+            username='secretaria', password='clave-segura-123', rut='11111111-1',
+            email='secretaria@clinica.cl', rol='secretaria'
+        )
+        cliente = Persona.objects.create(rut='66.666.666-6', nombres='Eva', apellidos='Soto')
+        cls.causa = Causa.objects.create(rol_rit='C-600-2025', caratula='Soto con Banco', cliente=cliente,
+                                         responsable=cls.estudiante)
+        RegistroCaso.objects.create(causa=cls.causa, contenido='')
+        guardar_version(cls.causa, 'Primera versión.', cls.estudiante)
+        guardar_version(cls.causa, 'Segunda versión.', cls.estudiante)
+        cls.versiones = list(RegistroCasoHistorial.objects.filter(causa=cls.causa).order_by('numero'))
+
+    def test_version_solo_para_responsable_y_staff_juridico(self):
+        url = reverse('casos:version_registro', kwargs={'pk': self.causa.pk, 'version_id': self.versiones[0].pk})
+
+        self.client.force_login(self.estudiante)
+        self.assertContains(self.client.get(url), 'Primera versión.')
+
+        self.client.force_login(self.secretaria)
+        self.assertRedirects(self.client.get(url), reverse('casos:detalle', kwargs={'pk': self.causa.pk}),
+                             fetch_redirect_response=False)
+
+    def test_historial_no_muestra_tamano_de_versiones_antiguas(self):
+        # Versión guardada antes de que existiera el campo tamano
+        RegistroCasoHistorial.objects.create(causa=self.causa, contenido='Texto antiguo')
+        self.client.force_login(self.estudiante)
+        response = self.client.get(reverse('casos:historial_registro', kwargs={'pk': self.causa.pk}))
+        self.assertContains(response, f'{len("Primera versión.")} caracteres')
+        self.assertNotContains(response, '· 0 caracteres')
+
+    def test_comparacion_solo_para_responsable_y_staff_juridico(self):
+        url = reverse('casos:comparar_registro', kwargs={'pk': self.causa.pk})
+        parametros = {'a': self.versiones[0].pk, 'b': self.versiones[1].pk}
+
+        self.client.force_login(self.estudiante)
+        self.assertEqual(self.client.get(url, parametros).status_code, 200)
+
+        self.client.force_login(self.secretaria)
+        self.assertRedirects(self.client.get(url, parametros), reverse('casos:detalle', kwargs={'pk': self.causa.pk}),
+                             fetch_redirect_response=False)
+
+
+class ColaPdfTests(TestCase):
+    """Un trabajo abandonado lo rescata un solo worker aunque dos lo vean a la vez."""
+
+    def test_trabajo_abandonado_se_toma_una_vez(self):
+        cliente = Persona.objects.create(rut='77.777.777-7', nombres='Raúl', apellidos='Paz')
+        causa = Causa.objects.create(rol_rit='C-700-2025', caratula='Paz con Paz', cliente=cliente)
+        registro = RegistroCaso.objects.create(causa=causa, contenido='')
+        trabajo = TrabajoPDF.objects.create(
+            registro=registro, estado='procesando', revision=1,
+            iniciado_en=timezone.now() - cola_pdf.TIEMPO_MAXIMO_PROCESANDO - timedelta(minutes=1),
+        )
+
+        first = QuerySet.first
+        tomas = []
+
+        def otro_worker_entre_medio(qs):
+            candidato = first(qs)
+            if not tomas:
+                # El otro worker lee y toma el mismo trabajo antes de que este actualice
+                tomas.append(None)
+                tomas.append(cola_pdf._tomar_siguiente())
+            return candidato
+
+        with mock.patch.object(QuerySet, 'first', autospec=True, side_effect=otro_worker_entre_medio):
+            tomas.append(cola_pdf._tomar_siguiente())
+
+        self.assertEqual(tomas[1:], [(trabajo.pk, 1), None])
+
+
+class BitacoraAgrupadaTests(TestCase):
+    """Las entradas del buffer se insertan juntas y quedan indexadas con su id."""
+
+    def test_indexa_con_ids_aunque_la_base_no_los_devuelva(self):
+        cliente = Persona.objects.create(rut='88.888.888-8', nombres='Sara', apellidos='Mena')
+        causa = Causa.objects.create(rol_rit='C-800-2025', caratula='Mena con Mena', cliente=cliente)
+        entradas = [Bitacora(causa=causa, accion='nota', detalle='Peritaje caligráfico') for _ in range(2)]
+
+        # Como en MySQL: bulk_create no asigna los ids de las filas insertadas
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert',
+                               new_callable=mock.PropertyMock, return_value=False):
+            bitacora.guardar(entradas)
+
+        ids = set(Bitacora.objects.filter(causa=causa, accion='nota').values_list('pk', flat=True))
+        self.assertEqual({e.pk for e in entradas}, ids)
+        indexados = TerminoBusqueda.objects.filter(origen='bitacora', termino='peritaje')
+        self.assertEqual(set(indexados.values_list('objeto_id', flat=True)), ids)
+
+    def test_inserta_por_lotes_y_descarta_lo_revertido(self):
+        cliente = Persona.objects.create(rut='16.161.616-1', nombres='Elena', apellidos='Mora')
+        causa = Causa.objects.create(rol_rit='C-1600-2025', caratula='Mora con Mora', cliente=cliente)
+
+        with CaptureQueriesContext(connection) as consultas:
+            with bitacora.agrupar(lote=2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    for i in range(5):
+                        bitacora.registrar(causa, None, 'nota', f'Movimiento {i}')
+                    try:
+                        with transaction.atomic():
+                            bitacora.registrar(causa, None, 'nota', 'Revertido')
+                            raise ValueError
+                    except ValueError:
+                        pass
+
+        inserts = [c for c in consultas.captured_queries if c['sql'].startswith(f'INSERT INTO {connection.ops.quote_name(Bitacora._meta.db_table)}')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(list(Bitacora.objects.filter(causa=causa).order_by('id').values_list('detalle', flat=True)),
+                         [f'Movimiento {i}' for i in range(5)])
+
+
+class PanelInicioCacheTests(TestCase):
+    """El panel cacheado del estudiante cambia cuando se le asigna o se le quita una causa."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reasignar_causa_invalida_ambos_paneles(self):
+        antes = Usuario.objects.create_user(
+            username='antes', password='clave-segura-123', rut='12345678-5',
+            email='antes@clinica.cl', rol='estudiante'
+        )
+        despues = Usuario.objects.create_user(
+            username='despues', password='clave-segura-123', rut='87654321-4',
+            email='despues@clinica.cl', rol='estudiante'
+        )
+        cliente = Persona.objects.create(rut='99.999.999-9', nombres='Inés', apellidos='Lagos')
+        causa = Causa.objects.create(rol_rit='C-900-2025', caratula='Lagos con Lagos', cliente=cliente,
+                                     responsable=antes)
+        Documento.objects.create(causa=causa, nombre='Informe pericial')
+
+        self.client.force_login(antes)
+        self.assertContains(self.client.get(reverse('home')), 'Informe pericial')
+        self.client.force_login(despues)
+        self.assertNotContains(self.client.get(reverse('home')), 'Informe pericial')
+
+        causa = Causa.objects.get(pk=causa.pk)
+        causa.responsable = despues
+        causa.save()
+
+        self.assertContains(self.client.get(reverse('home')), 'Informe pericial')
+        self.client.force_login(antes)
+        self.assertNotContains(self.client.get(reverse('home')), 'Informe pericial')
+
+
+class AuditoriaIntegridadTests(TestCase):
+    """La auditoría masiva guarda su avance por lote y, si se interrumpe, retoma desde ahí."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+        super().setUpClass()
+
+    def test_reanuda_desde_el_checkpoint(self):
+        cliente = Persona.objects.create(rut='10.101.010-1', nombres='Olga', apellidos='Vera')
+        causa = Causa.objects.create(rol_rit='C-1000-2025', caratula='Vera con Vera', cliente=cliente)
+        docs = [
+            Documento.objects.create(causa=causa, nombre=f'Escrito {i}',
+                                     archivo=SimpleUploadedFile(f'escrito{i}.pdf', f'contenido {i}'.encode()))
+            for i in range(3)
+        ]
+        with open(docs[1].archivo.path, 'ab') as f:
+            f.write(b' alterado')
+        checkpoint = os.path.join(self.media, 'avance.json')
+        opciones = {'checkpoint': checkpoint, 'lote': 1, 'workers': 1, 'stdout': io.StringIO()}
+
+        procesar_lote = AuditarIntegridad.procesar_lote
+        lotes = []
+
+        def cortar_en_el_segundo_lote(comando, lote, resultados):
+            lotes.append(lote)
+            if len(lotes) == 2:
+                raise KeyboardInterrupt
+            return procesar_lote(comando, lote, resultados)
+
+        with mock.patch.object(AuditarIntegridad, 'procesar_lote', autospec=True, side_effect=cortar_en_el_segundo_lote):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('auditar_integridad', **opciones)
+
+        with open(checkpoint) as f:
+            self.assertEqual(json.load(f)['ultimo_id'], docs[0].pk)
+
+        with mock.patch.object(AuditarIntegridad, 'procesar_lote', autospec=True, side_effect=procesar_lote) as reanudado:
+            call_command('auditar_integridad', **opciones)
+        self.assertEqual([llamada.args[1][0].pk for llamada in reanudado.call_args_list], [docs[1].pk, docs[2].pk])
+        self.assertFalse(os.path.exists(checkpoint))
+
+        estados = dict(Documento.objects.values_list('pk', 'estado_integridad'))
+        self.assertEqual([estados[d.pk] for d in docs], ['integro', 'modificado', 'integro'])
+
+    def test_omite_documentos_sin_archivo(self):
+        cliente = Persona.objects.create(rut='17.171.717-1', nombres='Iván', apellidos='Lara')
+        causa = Causa.objects.create(rol_rit='C-1700-2025', caratula='Lara con Lara', cliente=cliente)
+        sin_archivo = Documento.objects.create(causa=causa, nombre='Sin archivo', hash_archivo='0' * 64)
+        con_archivo = Documento.objects.create(causa=causa, nombre='Escrito',
+                                               archivo=SimpleUploadedFile('escrito.pdf', b'contenido'))
+
+        call_command('auditar_integridad', checkpoint=os.path.join(self.media, 'avance.json'),
+                     workers=1, stdout=io.StringIO())
+
+        estados = dict(Documento.objects.values_list('pk', 'estado_integridad'))
+        self.assertEqual((estados[sin_archivo.pk], estados[con_archivo.pk]), ('pendiente', 'integro'))
+
+
+class ExpedientePdfCacheTests(TestCase):
+    """El PDF guardado se reutiliza mientras no cambie el digest de sus datos (que también es el ETag)."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media, EXPEDIENTE_PIE_DINAMICO=False))
+        super().setUpClass()
+
+    def test_reutiliza_el_pdf_hasta_que_cambia_el_registro(self):
+        director = Usuario.objects.create_user(
+            username='director', password='clave-segura-123', rut='11111111-1',
+            email='director@clinica.cl', rol='director'
+        )
+        cliente = Persona.objects.create(rut='12.121.212-1', nombres='Tomás', apellidos='Fuentes')
+        causa = Causa.objects.create(rol_rit='C-1200-2025', caratula='Fuentes con Fuentes', cliente=cliente)
+        registro = RegistroCaso.objects.create(causa=causa, contenido='Primera versión del registro.')
+        url = reverse('casos:generar_pdf', kwargs={'pk': causa.pk})
+        self.client.force_login(director)
+
+        with mock.patch.object(utils, 'renderizar_pdf_expediente', wraps=utils.renderizar_pdf_expediente) as renderizar:
+            primera = self.client.get(url)
+            self.assertEqual(primera.status_code, 200)
+            self.assertTrue(b''.join(primera.streaming_content).startswith(b'%PDF'))
+
+            self.assertEqual(self.client.get(url, headers={'If-None-Match': primera['ETag']}).status_code, 304)
+            segunda = self.client.get(url)
+            self.assertEqual(segunda['ETag'], primera['ETag'])
+            self.assertEqual(renderizar.call_count, 1)
+
+            registro.contenido = 'Segunda versión del registro.'
+            registro.save()
+            tercera = self.client.get(url, headers={'If-None-Match': primera['ETag']})
+            self.assertEqual(tercera.status_code, 200)
+            self.assertNotEqual(tercera['ETag'], primera['ETag'])
+            self.assertEqual(renderizar.call_count, 2)
+
+    def test_recursos_locales_en_memoria_y_remotos_omitidos(self):
+        ruta = os.path.join(self.media, 'firma.png')
+        with open(ruta, 'wb') as f:
+            f.write(b'primera')
+        uri = '/media/firma.png'
+
+        self.assertEqual(utils.resolver_recurso_pdf(uri, None), 'data:image/png;base64,cHJpbWVyYQ==')
+        with mock.patch('builtins.open', side_effect=AssertionError('no debía releer el recurso')):
+            self.assertEqual(utils.resolver_recurso_pdf(uri, None), 'data:image/png;base64,cHJpbWVyYQ==')
+
+        # Si el archivo cambia (otro mtime) se vuelve a leer
+        with open(ruta, 'wb') as f:
+            f.write(b'segunda')
+        os.utime(ruta, ns=(0, os.stat(ruta).st_mtime_ns + 1))
+        self.assertEqual(utils.resolver_recurso_pdf(uri, None), 'data:image/png;base64,c2VndW5kYQ==')
+
+        self.assertTrue(utils.resolver_recurso_pdf(f'/static/{utils.LOGO_ESTATICO}', None).startswith('data:image/svg+xml;base64,'))
+        self.assertEqual(utils.resolver_recurso_pdf('https://cdn.ejemplo.cl/logo.png', None), utils._RECURSO_VACIO)
+
+
+class ListaCausasCursorTests(TestCase):
+    """Recorrer la lista por cursor entrega cada causa una sola vez, también con fechas repetidas."""
+
+    def test_recorrido_completo_sin_repetidos(self):
+        director = Usuario.objects.create_user(
+            username='director', password='clave-segura-123', rut='11111111-1',
+            email='director@clinica.cl', rol='director'
+        )
+        cliente = Persona.objects.create(rut='13.131.313-1', nombres='Rosa', apellidos='Díaz')
+        hoy = timezone.localdate()
+        for i in range(7):
+            causa = Causa.objects.create(rol_rit=f'C-13{i}-2025', caratula=f'Díaz con Díaz {i}', cliente=cliente)
+            # Varias causas por día: el id desempata dentro de la misma fecha
+            Causa.objects.filter(pk=causa.pk).update(fecha_ingreso=hoy - timedelta(days=i // 3))
+
+        esperado = list(Causa.objects.order_by('-fecha_ingreso', '-id').values_list('pk', flat=True))
+        self.client.force_login(director)
+
+        vistos, cursor = [], None
+        with mock.patch.object(CausaListView, 'paginar_de', 3):
+            while True:
+                response = self.client.get(reverse('casos:lista'), {'despues': cursor} if cursor else {})
+                vistos += [c.pk for c in response.context['casos']]
+                cursor = response.context['cursor_siguiente']
+                if cursor is None:
+                    break
+
+            self.assertEqual(vistos, esperado)
+            invalido = self.client.get(reverse('casos:lista'), {'despues': 'no-es-un-cursor'})
+            self.assertEqual([c.pk for c in invalido.context['casos']], esperado[:3])
+
+
+class BusquedaIndiceTests(TestCase):
+    """La búsqueda por índice: prefijos sin tildes, todos los términos, relevancia y permisos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.director = Usuario.objects.create_user(
+            username='director', password='clave-segura-123', rut='11111111-1',
+            email='director@clinica.cl', rol='director'
+        )
+        cls.estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cliente = Persona.objects.create(rut='14.141.414-1', nombres='Paula', apellidos='Núñez')
+        cls.en_caratula = Causa.objects.create(rol_rit='C-1401-2025', caratula='Núñez con Constructora Andina',
+                                               cliente=cliente)
+        cls.en_registro = Causa.objects.create(rol_rit='C-1402-2025', caratula='Soto con Soto', cliente=cliente,
+                                               responsable=cls.estudiante)
+        RegistroCaso.objects.create(causa=cls.en_registro, contenido='Demanda contra la constructora por filtraciones.')
+        Documento.objects.create(causa=cls.en_registro, nombre='Informe pericial de filtraciones')
+
+    def ids(self, query, usuario):
+        return [c.pk for c in buscar_causas(query, usuario)]
+
+    def test_prefijos_relevancia_y_permisos(self):
+        # Sin tildes ni mayúsculas, por prefijo; la carátula pesa más que el registro
+        self.assertEqual(self.ids('CONSTRUC', self.director), [self.en_caratula.pk, self.en_registro.pk])
+        self.assertEqual(self.ids('nunez constructora', self.director), [self.en_caratula.pk])
+        self.assertEqual(self.ids('constructora inexistente', self.director), [])
+
+        self.assertEqual(self.ids('constructora', self.estudiante), [self.en_registro.pk])
+        self.assertEqual([d.nombre for d in buscar_documentos('informe', self.estudiante)], ['Informe pericial de filtraciones'])
+
+    def test_reindexa_al_editar(self):
+        self.en_caratula.caratula = 'Núñez con Inmobiliaria'
+        self.en_caratula.save()
+        self.assertEqual(self.ids('inmobiliaria', self.director), [self.en_caratula.pk])
+        self.assertEqual(self.ids('andina', self.director), [])
+
+
+class HistorialMovimientosTests(TestCase):
+    """El botón "Cargar más" del historial trae la página siguiente por cursor, solo a quien puede ver la causa."""
+
+    def test_pagina_siguiente_y_permisos(self):
+        estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        otro = Usuario.objects.create_user(
+            username='otro', password='clave-segura-123', rut='87654321-4',
+            email='otro@clinica.cl', rol='estudiante'
+        )
+        cliente = Persona.objects.create(rut='15.151.515-1', nombres='Hugo', apellidos='Reyes')
+        causa = Causa.objects.create(rol_rit='C-1500-2025', caratula='Reyes con Reyes', cliente=cliente,
+                                     responsable=estudiante)
+        for i in range(MOVIMIENTOS_POR_PAGINA + 5):
+            Bitacora.objects.create(causa=causa, usuario=estudiante, accion='nota', detalle=f'Movimiento {i:02d}')
+
+        primera = pagina_historial(causa)
+        self.assertEqual(primera['movimientos'][0].detalle, f'Movimiento {MOVIMIENTOS_POR_PAGINA + 4:02d}')
+        url = reverse('casos:historial_movimientos', kwargs={'pk': causa.pk})
+        parametros = {'despues': primera['cursor_siguiente']}
+
+        self.client.force_login(estudiante)
+        response = self.client.get(url, parametros)
+        self.assertEqual([m.detalle for m in response.context['pagina']['movimientos']],
+                         [f'Movimiento {i:02d}' for i in range(4, -1, -1)])
+        self.assertNotContains(response, 'Cargar movimientos anteriores')
+
+        self.client.force_login(otro)
+        self.assertEqual(self.client.get(url, parametros).status_code, 403)
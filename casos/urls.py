@@ -11,7 +11,12 @@ urlpatterns = [
     path('<int:pk>/estado/<str:accion>/', views.CambiarEstadoCasoView.as_view(), name='cambiar_estado'),
     path('<int:pk>/editar/', views.CausaUpdateView.as_view(), name='editar'),
     path('buscar_casos/', views.buscar_casos, name='buscar_casos'),
+    path('<int:pk>/historial/', views.HistorialMovimientosView.as_view(), name='historial_movimientos'),
     path('<int:pk>/registro/', views.RegistroCasoEditView.as_view(), name='editar_registro'),
     path('<int:pk>/registro/historial/', views.RegistroCasoHistorialView.as_view(), name='historial_registro'),
+    path('<int:pk>/registro/historial/comparar/', views.RegistroCasoDiffView.as_view(), name='comparar_registro'),
+    path('<int:pk>/registro/historial/<int:version_id>/', views.RegistroCasoVersionView.as_view(), name='version_registro'),
     path('<int:pk>/expediente-pdf/', views.GenerarExpedientePDF.as_view(), name='generar_pdf'),
+    path('<int:pk>/expediente-pdf/archivo/', views.DescargarExpedientePDFView.as_view(), name='descargar_pdf'),
+    path('<int:pk>/expediente-pdf/estado/', views.EstadoExpedientePDFView.as_view(), name='estado_pdf'),
 ]
\ No newline at end of file
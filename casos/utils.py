@@ -1,35 +1,141 @@
 import os
+import base64
+import hashlib
+import json
+import mimetypes
+import threading
+from functools import lru_cache
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import ValidationError
+from django.db.models import Q
 from django.template.loader import get_template
+from django.templatetags.static import static
 from django.utils import timezone
 from django.core.files.base import ContentFile
 from xhtml2pdf import pisa
 from io import BytesIO
 
+PLANTILLA_EXPEDIENTE = 'casos/pdf_expediente.html'
+LOGO_ESTATICO = 'svg/USShorizontal-tagline-ilumina-dark.svg'
+
+# Recursos ya leídos para xhtml2pdf: {ruta: (mtime_ns, data_uri)}
+_recursos_pdf = {}
+_recursos_lock = threading.Lock()
+# Imagen vacía (gif 1x1 transparente) para URLs que no son locales: el PDF nunca sale a la red
+_RECURSO_VACIO = 'data:image/gif;base64,R0lGODlhAQABAAAAACH5BAEKAAEALAAAAAABAAEAAAICTAEAOw=='
+
+
+@lru_cache(maxsize=1)
+def version_plantilla_expediente():
+    # Si cambia el HTML de la plantilla, cambia el digest y los PDFs guardados dejan de servir
+    return hashlib.sha256(get_template(PLANTILLA_EXPEDIENTE).template.source.encode()).hexdigest()
+
+
+def _ruta_local(uri):
+    """Traduce una URL de static/ o media/ a la ruta del archivo en disco (o None)."""
+    if uri.startswith(settings.MEDIA_URL):
+        ruta = os.path.join(settings.MEDIA_ROOT, uri[len(settings.MEDIA_URL):])
+        return ruta if os.path.isfile(ruta) else None
+
+    if uri.startswith(settings.STATIC_URL):
+        relativa = uri[len(settings.STATIC_URL):]
+        ruta = finders.find(relativa)
+        if not ruta and settings.STATIC_ROOT:
+            ruta = os.path.join(settings.STATIC_ROOT, relativa)
+        return ruta if ruta and os.path.isfile(ruta) else None
+
+    return None
+
+
+def resolver_recurso_pdf(uri, rel):
+    """
+    link_callback de xhtml2pdf: resuelve imágenes/estilos desde el disco en vez de
+    descargarlos y deja su contenido en memoria (como data URI) para los siguientes
+    renderizados. Se vuelve a leer solo si el archivo cambia.
+    """
+    if uri.startswith('data:'):
+        return uri
+
+    ruta = _ruta_local(uri)
+    if ruta is None:
+        if uri.startswith(('http://', 'https://', '//')):
+            print(f"Recurso remoto omitido en PDF: {uri}")
+            return _RECURSO_VACIO
+        return None
+
+    mtime = os.stat(ruta).st_mtime_ns
+    with _recursos_lock:
+        cacheado = _recursos_pdf.get(ruta)
+    if cacheado and cacheado[0] == mtime:
+        return cacheado[1]
+
+    with open(ruta, 'rb') as f:
+        contenido = base64.b64encode(f.read()).decode('ascii')
+    tipo = mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+    data_uri = f"data:{tipo};base64,{contenido}"
+
+    with _recursos_lock:
+        _recursos_pdf[ruta] = (mtime, data_uri)
+    return data_uri
+
+
+def digest_expediente(registro):
+    """
+    Digest de todo lo que se usa para renderizar el PDF (salvo el pie de impresión).
+    Si coincide con RegistroCaso.pdf_digest, el PDF guardado sigue vigente.
+    """
+    causa = registro.causa
+    entradas = [
+        version_plantilla_expediente(),
+        LOGO_ESTATICO,
+        causa.rol_rit,
+        causa.caratula,
+        str(causa.materia) if causa.materia_id else '',
+        registro.contenido or '',
+    ]
+    return hashlib.sha256(json.dumps(entradas).encode()).hexdigest()
+
+
+def renderizar_pdf_expediente(registro, usuario_impresion):
+    """Genera el PDF en memoria y devuelve sus bytes (o None si xhtml2pdf falla)."""
+    # 1. Preparar Contexto
+    context = {
+        'caso': registro.causa,
+        'registro': registro,
+        'fecha_impresion': timezone.now(),
+        'usuario_impresion': usuario_impresion,
+        'logo_url': static(LOGO_ESTATICO)
+    }
+
+    # 2. Renderizar Template
+    template = get_template(PLANTILLA_EXPEDIENTE)
+    html = template.render(context)
+
+    # 3. Generar PDF en memoria
+    buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(html, dest=buffer, link_callback=resolver_recurso_pdf)
+
+    if pisa_status.err:
+        return None
+    return buffer.getvalue()
+
+
 def generar_pdf_expediente(registro):
     try:
-        # 1. Preparar Contexto
-        context = {
-            'caso': registro.causa,
-            'registro': registro,
-            'fecha_impresion': timezone.now(),
-            'usuario_impresion': registro.actualizado_por, # O el responsable
-            'logo_url': 'https://cdn.uss.cl/content/uploads/2025/10/22175624/USShorizontal-tagline-ilumina-dark.svg'
-        }
-
-        # 2. Renderizar Template
-        template = get_template('casos/pdf_expediente.html')
-        html = template.render(context)
-
-        # 3. Generar PDF en memoria
-        buffer = BytesIO()
-        pisa_status = pisa.CreatePDF(html, dest=buffer)
-
-        if pisa_status.err:
+        digest = digest_expediente(registro)
+
+        # Si nada cambió desde el último PDF guardado no hace falta volver a renderizar
+        if registro.archivo and registro.pdf_digest == digest and os.path.isfile(registro.archivo.path):
+            return True
+
+        pdf = renderizar_pdf_expediente(registro, registro.actualizado_por) # O el responsable
+        if pdf is None:
             return False
 
         # 4. Guardar el archivo en el modelo
         filename = f"Expediente_{registro.causa.rol_rit}.pdf"
-        
+
         if registro.archivo:
             try:
                 # Verificamos si el archivo físico existe en el disco y lo borramos
@@ -40,10 +146,44 @@ def generar_pdf_expediente(registro):
                 print(f"No se pudo borrar el archivo anterior: {e}")
 
         # B) Guardamos el nuevo (Como ya borramos el viejo, Django usará el nombre limpio)
-        registro.archivo.save(filename, ContentFile(buffer.getvalue()), save=True)
-        
+        # Solo actualizamos la columna del archivo: el PDF se genera en segundo plano
+        # y un save() completo podría pisar una edición del contenido hecha mientras tanto.
+        registro.archivo.save(filename, ContentFile(pdf), save=False)
+        registro.pdf_digest = digest
+        type(registro).objects.filter(pk=registro.pk).update(archivo=registro.archivo.name, pdf_digest=digest)
+
         return True
 
     except Exception as e:
         print(f"Error generando PDF: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+def paginar_por_cursor(queryset, cursor, campo, tamano):
+    """
+    Paginación por llave (keyset) en orden descendente sobre (campo, id).
+    En vez de OFFSET se filtra "después del último elemento visto", por lo que
+    las páginas profundas cuestan lo mismo que la primera si hay índice sobre (campo, id).
+
+    `cursor` es el valor devuelto por la página anterior ("<valor>_<id>") o None.
+    Devuelve (elementos, cursor_siguiente); cursor_siguiente es None en la última página.
+    """
+    if cursor:
+        try:
+            valor, pk = cursor.rsplit('_', 1)
+            valor = queryset.model._meta.get_field(campo).to_python(valor)
+            pk = int(pk)
+        except (ValueError, ValidationError):
+            valor = None # Cursor inválido: se muestra la primera página
+        if valor is not None:
+            queryset = queryset.filter(Q(**{f'{campo}__lt': valor}) | Q(**{campo: valor, 'id__lt': pk}))
+
+    elementos = list(queryset.order_by(f'-{campo}', '-id')[:tamano + 1])
+
+    cursor_siguiente = None
+    if len(elementos) > tamano:
+        elementos = elementos[:tamano]
+        ultimo = elementos[-1]
+        cursor_siguiente = f"{getattr(ultimo, campo).isoformat()}_{ultimo.pk}"
+
+    return elementos, cursor_siguiente
@@ -1,38 +1,48 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView, CreateView, DetailView, UpdateView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 
-from .models import Causa, Participante, Bitacora, RegistroCaso, RegistroCasoHistorial
+from .models import Causa, Participante, RegistroCaso, RegistroCasoHistorial, TrabajoPDF
 from .forms import CausaForm, ParticipanteForm, RegistroCasoForm
 
-# sirve para hacer consultas complejas
-from django.db.models import Q
+# sirve para precargar relaciones en pocas consultas
+from django.db.models import Prefetch
 # sirve par decoradores de vistas basadas en clases
 from django.contrib.auth.decorators import login_required
 
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from agenda.models import Cita
 from documentos.models import Documento
+from documentos.integridad import programar_verificacion
+from documentos.descargas import puede_descargar, servir_archivo
 
 from personas.mixins import SoloDirectorMixin, SoloStaffMixin
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views import View
 
-from django.template.loader import get_template
-from xhtml2pdf import pisa
-from django.http import HttpResponse
-from .utils import generar_pdf_expediente
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, FileResponse
+from django.utils.cache import get_conditional_response
+from . import bitacora
+from .cola_pdf import encolar_pdf_expediente
+from .utils import digest_expediente, generar_pdf_expediente, renderizar_pdf_expediente, paginar_por_cursor
+from .indicadores import leer_panel
+from .historial import guardar_version, reconstruir, diff_versiones
+from .busqueda import buscar_causas, buscar_documentos, ids_causas_coincidentes
+from django.core.paginator import Paginator
 
 class CausaListView(LoginRequiredMixin, ListView):
     model = Causa
     template_name = 'casos/lista_casos.html'
     context_object_name = 'casos'
-    ordering = ['-fecha_ingreso']
+    paginar_de = 25
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # select_related evita 3 consultas extra por fila (cliente, materia y responsable)
+        queryset = Causa.objects.select_related('cliente', 'materia', 'responsable')
         usuario = self.request.user
 
         if usuario.rol == 'estudiante':
@@ -40,7 +50,7 @@ class CausaListView(LoginRequiredMixin, ListView):
         
         q = self.request.GET.get('q')
         if q:
-            queryset = queryset.filter(caratula__icontains=q) | queryset.filter(rol_rit__icontains=q)
+            queryset = queryset.filter(id__in=ids_causas_coincidentes(q, usuario))
         
         estado = self.request.GET.get('estado')
         if estado:
@@ -49,8 +59,20 @@ class CausaListView(LoginRequiredMixin, ListView):
         return queryset
 
     def get_context_data(self, **kwargs):
+        # Paginación por cursor sobre (fecha_ingreso, id): las páginas profundas no usan OFFSET
+        casos, cursor_siguiente = paginar_por_cursor(
+            self.object_list, self.request.GET.get('despues'), 'fecha_ingreso', self.paginar_de
+        )
+        kwargs['object_list'] = casos
         context = super().get_context_data(**kwargs)
         context['estados_posibles'] = Causa.ESTADOS 
+        context['cursor_siguiente'] = cursor_siguiente
+        context['es_primera_pagina'] = not self.request.GET.get('despues')
+
+        # Filtros actuales para conservarlos al cambiar de página
+        filtros = self.request.GET.copy()
+        filtros.pop('despues', None)
+        context['filtros_query'] = filtros.urlencode()
         return context
 
 class CausaCreateView(SoloDirectorMixin, LoginRequiredMixin, CreateView):
@@ -71,10 +93,10 @@ class CausaCreateView(SoloDirectorMixin, LoginRequiredMixin, CreateView):
             actualizado_por=self.request.user
         )
 
-        # Generar el PDF del expediente
-        generar_pdf_expediente(registro)
+        # El PDF del expediente se genera en segundo plano
+        encolar_pdf_expediente(registro)
         
-        Bitacora.objects.create(
+        bitacora.registrar(
             causa=self.object,
             usuario=self.request.user,
             accion='creacion',
@@ -98,7 +120,7 @@ class CausaUpdateView(SoloDirectorMixin, LoginRequiredMixin, UpdateView):
         # Detectar si cambió el responsable para anotarlo en la bitácora
         if 'responsable' in form.changed_data:
             nuevo_resp = form.instance.responsable
-            Bitacora.objects.create(
+            bitacora.registrar(
                 causa=self.object,
                 usuario=self.request.user,
                 accion='actualizacion',
@@ -111,10 +133,30 @@ class CausaUpdateView(SoloDirectorMixin, LoginRequiredMixin, UpdateView):
     def get_success_url(self):
         return reverse_lazy('casos:detalle', kwargs={'pk': self.object.pk})
 
+MOVIMIENTOS_POR_PAGINA = 20
+
+def pagina_historial(causa, cursor=None):
+    """Una página del historial (Bitacora) de la causa, de la más reciente a la más antigua."""
+    movimientos, cursor_siguiente = paginar_por_cursor(
+        causa.historial.select_related('usuario'), cursor, 'fecha', MOVIMIENTOS_POR_PAGINA
+    )
+    return {'causa': causa, 'movimientos': movimientos, 'cursor_siguiente': cursor_siguiente}
+
 class CausaDetailView(LoginRequiredMixin, DetailView):
     model = Causa
     template_name = 'casos/detalle_caso.html'
     context_object_name = 'caso'
+
+    def get_queryset(self):
+        # Todo lo que usa detalle_caso.html se carga en un número fijo de consultas,
+        # sin importar cuántos participantes, movimientos, documentos o citas tenga la causa.
+        # Los documentos se cargan siempre (alertas de integridad); el resto se consulta
+        # solo si su fragmento no está en caché (ver get_context_data)
+        return Causa.objects.select_related(
+            'cliente', 'responsable', 'tribunal', 'materia', 'registro', 'registro__trabajo_pdf'
+        ).prefetch_related(
+            Prefetch('documentos', queryset=Documento.objects.order_by('orden_expediente')),
+        )
     
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
@@ -130,53 +172,47 @@ class CausaDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        context['documentos'] = self.object.documentos.all().order_by('orden_expediente')
-        context['citas'] = self.object.citas.all().order_by('fecha_hora')
+        # Ya vienen ordenados desde el Prefetch de get_queryset
+        context['documentos'] = self.object.documentos.all()
+
+        # Querysets perezosos: solo se ejecutan al renderizar un fragmento que no está en caché
+        context['participantes'] = self.object.participantes.select_related('persona')
+        context['historial'] = SimpleLazyObject(lambda: pagina_historial(self.object))
+        context['citas'] = self.object.citas.order_by('fecha_hora')
+        context['fragmentos_segundos'] = settings.FRAGMENTOS_CACHE_SEGUNDOS
         
-        # VALIDACIÓN DE INTEGRIDAD INTELIGENTE
+        # VALIDACIÓN DE INTEGRIDAD
+        # Solo se vuelven a hashear (en segundo plano) los archivos cuya huella cambió
+        # o cuyo intervalo de re-verificación venció. La vista lee el último resultado guardado.
+        programar_verificacion(context['documentos'], self.request.user)
+
         alertas_integridad = []
         
         for doc in context['documentos']:
-            # Desempaquetamos la tupla (Estado, Hash Actual)
-            es_valido, hash_actual = doc.verificar_integridad()
-            
-            if es_valido is False: # Hash no coincide (Modificado)
-                
-                # 1. Siempre mostramos la alerta visual en pantalla
+            if doc.estado_integridad == 'modificado':
                 alertas_integridad.append({
                     'tipo': 'modificado',
                     'mensaje': f"El documento '{doc.nombre}' (Documento N° {doc.orden_expediente}) ha sido modificado externamente.",
                     'documento': doc
                 })
-                
-                # 2. Lógica Anti-Spam de Bitácora
-                # Solo registramos si es una modificación NUEVA (hash distinto al último error)
-                if hash_actual != doc.hash_fallido:
-                    Bitacora.objects.create(
-                        causa=self.object,
-                        usuario=self.request.user,
-                        accion='nota', # O 'seguridad'
-                        detalle=f"ALERTA SEGURIDAD CRÍTICA: Hash inconsistente en documento ID {doc.id}. (Nuevo hash detectado)"
-                    )
-                    
-                    # Actualizamos la "memoria" del error
-                    doc.hash_fallido = hash_actual
-                    doc.save(update_fields=['hash_fallido'])
-
-            elif es_valido is None: # Archivo borrado físicamente
+
+            elif doc.estado_integridad == 'perdido':
                 alertas_integridad.append({
                     'tipo': 'perdido',
                     'mensaje': f"ERROR CRÍTICO: El archivo físico del documento '{doc.nombre}' no se encuentra en el servidor.",
                     'documento': doc
                 })
-            
-            elif es_valido is True:
-                # Autocuración: Si el archivo se arregló (volvió a ser el original), limpiamos la bandera de error
-                if doc.hash_fallido:
-                    doc.hash_fallido = None
-                    doc.save(update_fields=['hash_fallido'])
+
+        context['verificacion_pendiente'] = any(
+            doc.hash_archivo and doc.estado_integridad == 'pendiente' for doc in context['documentos']
+        )
 
         context['alertas_integridad'] = alertas_integridad
+
+        # Estado de la cola del PDF del expediente (casos/cola_pdf.py)
+        registro = getattr(self.object, 'registro', None)
+        trabajo_pdf = getattr(registro, 'trabajo_pdf', None) if registro else None
+        context['pdf_en_preparacion'] = bool(trabajo_pdf and trabajo_pdf.en_preparacion)
         return context
 
 # -------- Participantes
@@ -209,20 +245,20 @@ def home(request):
         usuario = request.user
         
         # --- 1. KPIs ---
-        qs_casos = Causa.objects.exclude(estado='archivada')
-        
-        # Si es estudiante, solo contamos SUS casos activos
-        if usuario.rol == 'estudiante':
-            qs_casos = qs_casos.filter(responsable=usuario)
-            
-        context['total_casos_activos'] = qs_casos.count()
+        # Contadores precalculados (casos/indicadores.py): una consulta en vez de contar las causas.
+        # Las versiones de citas/documentos forman parte de la llave de los fragmentos cacheados
+        panel = leer_panel(usuario)
+        context['panel'] = panel
+        context['total_casos_activos'] = panel['casos_activos']
         
         # --- 2. Citas para HOY ---
+        # Los querysets son perezosos: solo se ejecutan si el fragmento no está en caché
         ahora = timezone.localtime(timezone.now())
         inicio_hoy = ahora.replace(hour=0, minute=0, second=0, microsecond=0)
         fin_hoy = ahora.replace(hour=23, minute=59, second=59, microsecond=999999)
+        context['hoy'] = inicio_hoy.date().isoformat()
         
-        qs_citas = Cita.objects.filter(fecha_hora__range=(inicio_hoy, fin_hoy))
+        qs_citas = Cita.objects.filter(fecha_hora__range=(inicio_hoy, fin_hoy)).select_related('causa')
         
         # Si es estudiante, solo ve SUS citas
         if usuario.rol == 'estudiante':
@@ -291,7 +327,7 @@ class CambiarEstadoCasoView(LoginRequiredMixin, View):
             caso.save()
 
             # 2. Registro en Bitácora
-            Bitacora.objects.create(
+            bitacora.registrar(
                 causa=caso,
                 usuario=usuario,
                 accion='actualizacion',
@@ -305,30 +341,29 @@ class CambiarEstadoCasoView(LoginRequiredMixin, View):
 @login_required
 def buscar_casos(request):
     # Obtener el término de búsqueda desde los parámetros GET
-    query = request.GET.get('query' or '').strip()
+    query = request.GET.get('query', '').strip()
 
     # si no se escribe nada, devuelve campo vacio 
-    causas = Causa.objects.none()
-    documentos = Documento.objects.none()
+    causas = Paginator([], 20).get_page(1)
+    documentos = []
 
     if query:
-        #1. buscar en causas por RIT o carátula
-        causas = Causa.objects.filter(
-            Q(rol_rit__icontains=query) | Q(caratula__icontains=query)
-        )
+        #1. buscar en causas por RIT, carátula, registro y bitácora (índice de búsqueda).
+        #   El estudiante solo ve sus causas (se filtra dentro de buscar_causas)
+        causas = buscar_causas(query, request.user, pagina=request.GET.get('pagina'))
 
-        #2. rol estudiante
-        if request.user.rol == 'estudiante':
-            causas = causas.filter(responsable= request.user)
+        #2. documentos por nombre
+        documentos = buscar_documentos(query, request.user)
 
-        #3. si el usuario es estudiante, solo ve sus causas
+        #3. si tiene numeros, asume que busca el ID de un documento
         if query.isdigit():
-            # si tiene numeros, asume que busca  el ID de un documento
-            documentos = Documento.objects.filter(id=int(query)).select_related('causa')
+            por_id = Documento.objects.filter(id=int(query)).select_related('causa')
 
             # estudiante solo ve documentos de sus causas
             if request.user.rol == 'estudiante':
-                documentos = Documento.filter(causa__responsable = request.user)
+                por_id = por_id.filter(causa__responsable=request.user)
+
+            documentos = list(por_id) + [d for d in documentos if d.id != int(query)]
     
     return render(request, 'casos/buscar_casos.html',{
         'query':query,
@@ -393,19 +428,15 @@ class RegistroCasoEditView(LoginRequiredMixin, View):
 
            # Solo guardar historial si hubo cambios
            if nuevo_contenido != (contenido_anterior or "").strip():
-                # Guardar snapshot en historial
-                RegistroCasoHistorial.objects.create(
-                     causa=causa,
-                     contenido=contenido_anterior,
-                     creado_por=request.user
-                )
+                # Guardar versión anterior en historial (como diferencia, ver casos/historial.py)
+                guardar_version(causa, contenido_anterior, request.user)
 
                 # Actualizar el registro principal
                 nuevo_registro.actualizado_por = request.user
                 nuevo_registro.save()
-                generar_pdf_expediente(nuevo_registro)
+                encolar_pdf_expediente(nuevo_registro)
 
-                Bitacora.objects.create(
+                bitacora.registrar(
                     causa=causa,
                     usuario=request.user,
                     accion='nota',
@@ -420,25 +451,95 @@ class RegistroCasoEditView(LoginRequiredMixin, View):
             'form':form,
         })
     
+def puede_ver_historial_registro(usuario, causa):
+    """Director y supervisor siempre; el estudiante solo si es el responsable del caso."""
+    if usuario.rol in ['director', 'supervisor']:
+        return True
+    return usuario.rol == 'estudiante' and causa.responsable_id == usuario.pk
+
+
 class RegistroCasoHistorialView(LoginRequiredMixin, ListView):
+    versiones_por_pagina = 20
+
     def get(self, request, pk):
         causa = get_object_or_404(Causa, pk=pk)
 
-        # Solo director, supervisor pueden ver historial
-        if request.user.rol in ['director', 'supervisor']:
-            pass
-        # Estudiante responsable del caso
-        elif request.user.rol == 'estudiante' and causa.responsable == request.user:
-            pass
-        else:
+        if not puede_ver_historial_registro(request.user, causa):
             messages.error(request, "No tienes permisos para ver el historial del registro de este caso")
             return redirect('casos:detalle', pk=causa.pk)    
 
-        historial = causa.registro_historial.all()
+        # Solo los datos de cada versión: el texto se reconstruye al abrir una versión
+        historial = (
+            causa.registro_historial
+            .defer('contenido', 'delta')
+            .select_related('creado_por')
+            .order_by('-numero', '-id')
+        )
+        pagina = Paginator(historial, self.versiones_por_pagina).get_page(request.GET.get('pagina'))
 
         return render(request, 'casos/registro_caso_historial.html',{
             'causa':causa,
-            'historial':historial,
+            'historial':pagina,
+        })
+
+
+class RegistroCasoDiffView(LoginRequiredMixin, View):
+    """
+    Compara dos versiones del historial del registro (?a=<id>&b=<id>).
+    Los bloques de diferencias se muestran por páginas; con ?parcial=1 se devuelve
+    solo la página pedida (la pide "Cargar más" en la misma vista).
+    """
+    bloques_por_pagina = 20
+
+    def get(self, request, pk):
+        causa = get_object_or_404(Causa, pk=pk)
+
+        if not puede_ver_historial_registro(request.user, causa):
+            messages.error(request, "No tienes permisos para ver el historial del registro de este caso")
+            return redirect('casos:detalle', pk=causa.pk)
+
+        versiones = causa.registro_historial.select_related('creado_por')
+        try:
+            version_a = versiones.get(pk=int(request.GET.get('a', '')))
+            version_b = versiones.get(pk=int(request.GET.get('b', '')))
+        except (ValueError, RegistroCasoHistorial.DoesNotExist):
+            messages.error(request, "Selecciona dos versiones del historial para compararlas.")
+            return redirect('casos:historial_registro', pk=causa.pk)
+
+        # Siempre de la versión más antigua a la más reciente
+        if (version_a.numero, version_a.pk) > (version_b.numero, version_b.pk):
+            version_a, version_b = version_b, version_a
+
+        bloques = diff_versiones(version_a, version_b)
+        pagina = Paginator(bloques, self.bloques_por_pagina).get_page(request.GET.get('pagina'))
+
+        context = {
+            'causa': causa,
+            'version_a': version_a,
+            'version_b': version_b,
+            'pagina': pagina,
+        }
+        if request.GET.get('parcial'):
+            return render(request, 'casos/registro_caso_diff_bloques.html', context)
+        return render(request, 'casos/registro_caso_diff.html', context)
+
+
+class RegistroCasoVersionView(LoginRequiredMixin, View):
+    """Texto completo de una versión del historial del registro."""
+    def get(self, request, pk, version_id):
+        causa = get_object_or_404(Causa, pk=pk)
+
+        if not puede_ver_historial_registro(request.user, causa):
+            messages.error(request, "No tienes permisos para ver el historial del registro de este caso")
+            return redirect('casos:detalle', pk=causa.pk)
+
+        version = get_object_or_404(
+            RegistroCasoHistorial.objects.select_related('creado_por'), pk=version_id, causa=causa
+        )
+        return render(request, 'casos/registro_caso_version.html', {
+            'causa': causa,
+            'version': version,
+            'contenido': reconstruir(version),
         })
     
 
@@ -447,41 +548,81 @@ class GenerarExpedientePDF(LoginRequiredMixin, View):
         causa = get_object_or_404(Causa, pk=pk)
         
         # Validación de Permisos
-        permitido = False
-        if request.user.rol in ['director', 'supervisor']:
-            permitido = True
-        elif request.user.rol == 'estudiante' and causa.responsable == request.user:
-            permitido = True
-            
-        if not permitido:
+        if not puede_descargar(request.user, causa):
             messages.error(request, "No tienes permiso para descargar este expediente.")
             return redirect('casos:detalle', pk=pk)
 
-        registro, _ = RegistroCaso.objects.get_or_create(causa=causa)
+        registro, _ = RegistroCaso.objects.select_related('causa__materia', 'actualizado_por').get_or_create(causa=causa)
+        filename = f"Expediente_{causa.rol_rit}.pdf"
 
-        # Contexto
-        context = {
-            'caso': causa,
-            'registro': registro,
-            'fecha_impresion': timezone.now(),
-            'usuario_impresion': request.user,
-            'logo_url': 'https://cdn.uss.cl/content/uploads/2025/10/22175624/USShorizontal-tagline-ilumina-dark.svg'
-        }
+        # Pie de impresión dinámico: cada descarga lleva fecha y usuario actuales, no se puede cachear
+        if settings.EXPEDIENTE_PIE_DINAMICO:
+            pdf = renderizar_pdf_expediente(registro, request.user)
+            if pdf is None:
+                return HttpResponse('Hubo un error al generar el PDF')
+            response = HttpResponse(pdf, content_type='application/pdf')
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
 
-        # Renderizado
-        template_path = 'casos/pdf_expediente.html'
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="Expediente_{causa.rol_rit}.pdf"'
+        # Caché por contenido: el PDF guardado sirve mientras el digest de sus datos no cambie
+        digest = digest_expediente(registro)
+        etag = f'"{digest}"'
 
-        template = get_template(template_path)
-        html = template.render(context)
+        no_modificado = get_conditional_response(request, etag=etag)
+        if no_modificado is not None:
+            return no_modificado
+
+        if not generar_pdf_expediente(registro):
+            return HttpResponse('Hubo un error al generar el PDF')
+
+        response = FileResponse(registro.archivo.open('rb'), as_attachment=True,
+                                filename=filename, content_type='application/pdf')
+        response['ETag'] = etag
+        return response
 
-        # Creación del PDF
-        pisa_status = pisa.CreatePDF(
-           html, dest=response
-        )
 
-        if pisa_status.err:
-           return HttpResponse('Hubo un error al generar el PDF <pre>' + html + '</pre>')
-           
-        return response
\ No newline at end of file
+class DescargarExpedientePDFView(LoginRequiredMixin, View):
+    """PDF oficial ya generado del expediente (el que muestra "Ver PDF Oficial")."""
+    def get(self, request, pk):
+        registro = get_object_or_404(RegistroCaso.objects.select_related('causa'), causa_id=pk)
+
+        if not puede_descargar(request.user, registro.causa):
+            messages.error(request, "No tienes permiso para descargar este expediente.")
+            return redirect('casos:detalle', pk=pk)
+
+        if not registro.archivo:
+            raise Http404("El expediente todavía no tiene PDF generado.")
+
+        return servir_archivo(request, registro.archivo, f"Expediente_{registro.causa.rol_rit}.pdf",
+                              content_type='application/pdf')
+
+
+class HistorialMovimientosView(LoginRequiredMixin, View):
+    """Páginas siguientes del historial de movimientos (las pide detalle_caso.html con "Cargar más")."""
+    def get(self, request, pk):
+        causa = get_object_or_404(Causa, pk=pk)
+
+        if request.user.rol == 'estudiante' and causa.responsable != request.user:
+            return HttpResponse("No tienes permisos para ver este caso.", status=403)
+
+        pagina = pagina_historial(causa, request.GET.get('despues'))
+        return render(request, 'casos/historial_movimientos.html', {'pagina': pagina})
+
+
+class EstadoExpedientePDFView(LoginRequiredMixin, View):
+    """Estado del trabajo de generación del PDF (lo consulta el detalle del caso mientras se prepara)."""
+    def get(self, request, pk):
+        causa = get_object_or_404(Causa, pk=pk)
+
+        if request.user.rol == 'estudiante' and causa.responsable != request.user:
+            return JsonResponse({'error': 'No tienes permisos para ver este caso.'}, status=403)
+
+        trabajo = TrabajoPDF.objects.filter(registro__causa=causa).select_related('registro').first()
+        if trabajo is None:
+            return JsonResponse({'estado': None, 'en_preparacion': False, 'url': None})
+
+        return JsonResponse({
+            'estado': trabajo.estado,
+            'en_preparacion': trabajo.en_preparacion,
+            'url': reverse('casos:descargar_pdf', kwargs={'pk': causa.pk}) if trabajo.registro.archivo else None,
+        })
@@ -59,6 +59,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Guarda los movimientos de Bitácora de cada petición con un solo INSERT (casos/bitacora.py)
+    'casos.bitacora.BitacoraMiddleware',
 ]
 
 ROOT_URLCONF = 'clinica_juridica.urls'
@@ -154,4 +156,88 @@ LOGOUT_REDIRECT_URL = 'login'
 MEDIA_URL = '/media/'
 
 # Ruta física en tu disco duro donde se guardarán
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Upload handlers que calculan el SHA-256 de los documentos mientras se suben
+# (evita volver a leer el archivo en Documento.save)
+FILE_UPLOAD_HANDLERS = [
+    'documentos.uploadhandlers.HashMemoryFileUploadHandler',
+    'documentos.uploadhandlers.HashTemporaryFileUploadHandler',
+]
+
+# Verificación de integridad de documentos en segundo plano (documentos/integridad.py)
+# Cantidad de hilos que re-calculan hashes y cada cuántos segundos se re-verifica
+# un archivo aunque su huella (tamaño / mtime) no haya cambiado.
+INTEGRIDAD_WORKERS = int(environ.get('INTEGRIDAD_WORKERS', '2'))
+INTEGRIDAD_INTERVALO_REVERIFICACION = int(environ.get('INTEGRIDAD_INTERVALO_REVERIFICACION', str(60 * 60 * 24)))
+# Si es True la verificación se hace dentro de la petición (útil en pruebas)
+INTEGRIDAD_VERIFICACION_SINCRONA = environ.get('INTEGRIDAD_VERIFICACION_SINCRONA', 'False') == 'True'
+
+# Cola de generación del PDF del expediente (casos/cola_pdf.py)
+# Con PDF_COLA_EN_PROCESO=True los PDFs se generan en un hilo del propio servidor;
+# con False hay que correr `python manage.py procesar_pdfs --continuo` en un proceso aparte.
+PDF_COLA_EN_PROCESO = environ.get('PDF_COLA_EN_PROCESO', 'True') == 'True'
+PDF_COLA_WORKERS = int(environ.get('PDF_COLA_WORKERS', '1'))
+
+# PDF del expediente: si el pie ("Generado por ...") debe reflejar a quien descarga,
+# cada descarga se vuelve a renderizar. Si es False se sirve el PDF guardado mientras
+# sus datos no cambien (casos.utils.digest_expediente).
+EXPEDIENTE_PIE_DINAMICO = environ.get('EXPEDIENTE_PIE_DINAMICO', 'False') == 'True'
+
+# Caché de fragmentos de plantillas (panel de inicio y detalle de la causa).
+# Las llaves incluyen un contador de versión guardado en la base de datos (Causa.version_fragmentos,
+# casos/indicadores.py), por lo que un fragmento nunca queda desactualizado aunque cada proceso
+# tenga su propia caché en memoria. Con CACHE_BACKEND=filebased se comparte entre procesos.
+if environ.get('CACHE_BACKEND', 'locmem') == 'filebased':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': environ.get('CACHE_LOCATION', os.path.join(BASE_DIR, '.cache')),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'clinica-juridica',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Vida máxima de un fragmento cacheado. No se usa para invalidar (de eso se encargan las
+# versiones), solo para liberar espacio de causas que ya nadie abre.
+FRAGMENTOS_CACHE_SEGUNDOS = int(environ.get('FRAGMENTOS_CACHE_SEGUNDOS', str(60 * 60 * 24)))
+
+# Historial del registro de la causa (casos/historial.py): cada cuántas versiones se guarda
+# el texto completo; las intermedias se guardan como diferencias comprimidas.
+REGISTRO_HISTORIAL_COMPLETO_CADA = int(environ.get('REGISTRO_HISTORIAL_COMPLETO_CADA', '20'))
+
+# Subidas por partes de archivos grandes (documentos/cargas.py)
+# Tamaño de cada fragmento que envía el navegador, máximo aceptado por fragmento y por archivo.
+CARGA_FRAGMENTO_TAMANO = int(environ.get('CARGA_FRAGMENTO_TAMANO', str(8 * 1024 * 1024)))
+CARGA_FRAGMENTO_MAXIMO = int(environ.get('CARGA_FRAGMENTO_MAXIMO', str(32 * 1024 * 1024)))
+CARGA_TAMANO_MAXIMO = int(environ.get('CARGA_TAMANO_MAXIMO', str(4 * 1024 ** 3)))
+
+# Descarga de archivos protegidos (documentos/descargas.py). MEDIA_ROOT no se publica:
+# cada descarga revisa permisos y luego el servidor web entrega el archivo.
+# DESCARGAS_SERVIDOR: '' (Django lo envía), 'nginx' (X-Accel-Redirect) o 'apache' (X-Sendfile).
+# Con nginx, DESCARGAS_PREFIJO_INTERNO es un location `internal` cuyo alias es MEDIA_ROOT.
+DESCARGAS_SERVIDOR = environ.get('DESCARGAS_SERVIDOR', '')
+DESCARGAS_PREFIJO_INTERNO = environ.get('DESCARGAS_PREFIJO_INTERNO', '/media-protegida/')
+
+# Recordatorios de citas (agenda/recordatorios.py, `manage.py enviar_recordatorios --continuo`)
+# Minutos de anticipación de cada aviso, backend de entrega y reintentos antes de marcar error.
+# Backends: agenda.recordatorios.BackendConsola, BackendArchivo (RECORDATORIOS_ARCHIVO) o BackendSMTP.
+RECORDATORIOS_ANTICIPACION = [int(m) for m in environ.get('RECORDATORIOS_ANTICIPACION', '1440,60').split(',') if m.strip()]
+RECORDATORIOS_BACKEND = environ.get('RECORDATORIOS_BACKEND', 'agenda.recordatorios.BackendConsola')
+RECORDATORIOS_ARCHIVO = environ.get('RECORDATORIOS_ARCHIVO', os.path.join(BASE_DIR, 'recordatorios.log'))
+RECORDATORIOS_MAXIMO_INTENTOS = int(environ.get('RECORDATORIOS_MAXIMO_INTENTOS', '5'))
+
+# Correo saliente (BackendSMTP)
+EMAIL_HOST = environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(environ.get('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = environ.get('EMAIL_USE_TLS', 'False') == 'True'
+DEFAULT_FROM_EMAIL = environ.get('DEFAULT_FROM_EMAIL', 'no-responder@clinica-juridica.cl')
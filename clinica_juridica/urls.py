@@ -3,8 +3,6 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import TemplateView
 from django.contrib.auth import views as auth_views
-from django.conf import settings
-from django.conf.urls.static import static
 from casos import views as casos_views
 from personas.forms import PasswordChangeFormBootstrap
 
@@ -48,5 +46,4 @@ urlpatterns = [
     path('documentos/', include(('documentos.urls', 'documentos'), namespace='documentos')),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# MEDIA_ROOT no se publica: los archivos se descargan con permisos (documentos/descargas.py)
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Subidas por partes (reanudables) de archivos grandes.
+
+Protocolo (ver documentos/views.py):
+  1. POST   subir/<caso>/cargas/            -> crea la CargaFragmentada y el archivo vacío
+  2. PUT    cargas/<token>/?offset=N        -> escribe un fragmento (cuerpo crudo) en el offset N
+     GET    cargas/<token>/                 -> estado, para reanudar desde `recibido`
+  3. POST   cargas/<token>/finalizar/       -> crea el Documento con el archivo ya escrito
+
+Los fragmentos se copian del cuerpo de la petición al archivo final en bloques, sin
+pasar por los upload handlers de Django, así que la memoria usada no depende del tamaño
+del archivo. El SHA-256 se va calculando fragmento a fragmento; el estado del hash vive
+en memoria del proceso y, si se perdió (reinicio, otro worker), se reconstruye leyendo
+una vez lo ya escrito.
+"""
+import hashlib
+import os
+import threading
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils import timezone
+
+from .integridad import TAMANO_BUFFER_HASH
+from .models import CargaFragmentada, Documento
+
+TAMANO_BLOQUE = 1024 * 1024
+
+# {token: (bytes_hasheados, sha256)}
+_hashes = {}
+_lock = threading.Lock()
+
+
+class ConflictoOffset(Exception):
+    """El fragmento no empieza donde terminó el anterior (el cliente debe consultar `recibido`)."""
+
+
+def iniciar_carga(carga):
+    """Reserva la ruta final del archivo (documentos/%Y/%m/) y lo crea vacío."""
+    ruta = Documento._meta.get_field('archivo').generate_filename(None, carga.nombre_archivo)
+    ruta = default_storage.get_available_name(ruta)
+    ruta_absoluta = default_storage.path(ruta)
+
+    os.makedirs(os.path.dirname(ruta_absoluta), exist_ok=True)
+    # 'x': si otra carga tomó el mismo nombre entre get_available_name y aquí, falla en vez de pisarlo
+    with open(ruta_absoluta, 'xb'):
+        pass
+
+    carga.ruta = ruta
+    carga.save()
+    return carga
+
+
+def _hash_hasta(carga, ruta_absoluta):
+    """
+    SHA-256 de los primeros `carga.recibido` bytes del archivo (desde memoria si es posible).
+    Devuelve siempre un objeto propio: el de `_hashes` solo se reemplaza tras confirmar un fragmento.
+    """
+    token = str(carga.token)
+    with _lock:
+        guardado = _hashes.get(token)
+    if guardado and guardado[0] == carga.recibido:
+        return guardado[1].copy()
+
+    sha256 = hashlib.sha256()
+    buffer = bytearray(TAMANO_BUFFER_HASH)
+    vista = memoryview(buffer)
+    restante = carga.recibido
+    with open(ruta_absoluta, 'rb') as f:
+        while restante:
+            leidos = f.readinto(vista[:min(len(buffer), restante)])
+            if not leidos:
+                break
+            sha256.update(vista[:leidos])
+            restante -= leidos
+    return sha256
+
+
+def escribir_fragmento(carga, offset, flujo, largo):
+    """
+    Copia `largo` bytes de `flujo` (el cuerpo de la petición) al archivo desde `offset`.
+    Si la conexión se corta a mitad, se conserva lo que alcanzó a llegar.
+    Devuelve el nuevo total recibido.
+    """
+    if offset + largo > carga.tamano:
+        raise ValueError("El fragmento excede el tamaño declarado del archivo.")
+
+    ruta_absoluta = default_storage.path(carga.ruta)
+    token = str(carga.token)
+
+    try:
+        with transaction.atomic():
+            # La fila bloqueada serializa los PUT de la misma carga (p. ej. un reintento del
+            # cliente mientras el primer envío sigue escribiendo): nunca truncan ni escriben a la vez
+            bloqueada = CargaFragmentada.objects.select_for_update().get(pk=carga.pk)
+            if bloqueada.estado != 'en_curso' or offset != bloqueada.recibido:
+                raise ConflictoOffset()
+
+            sha256 = _hash_hasta(bloqueada, ruta_absoluta)
+            escritos = 0
+            with open(ruta_absoluta, 'r+b') as f:
+                # Descarta restos de un fragmento anterior que se cortó antes de registrarse
+                f.truncate(offset)
+                f.seek(offset)
+                while escritos < largo:
+                    bloque = flujo.read(min(TAMANO_BLOQUE, largo - escritos))
+                    if not bloque:
+                        break
+                    f.write(bloque)
+                    sha256.update(bloque)
+                    escritos += len(bloque)
+
+            # Condicional igual, por si la base de datos no soporta select_for_update
+            # update() no aplica auto_now: actualizado_en se fija a mano (limpiar_cargas mide la inactividad con él)
+            avanzado = CargaFragmentada.objects.filter(pk=carga.pk, recibido=offset, estado='en_curso').update(
+                recibido=offset + escritos, actualizado_en=timezone.now()
+            )
+            if not avanzado:
+                raise ConflictoOffset()
+    except BaseException:
+        # El hash en memoria podría no corresponder a lo que quedó en disco: se reconstruye al seguir
+        with _lock:
+            _hashes.pop(token, None)
+        raise
+
+    with _lock:
+        _hashes[token] = (offset + escritos, sha256)
+
+    carga.recibido = offset + escritos
+    return carga.recibido
+
+
+def finalizar_carga(carga):
+    """Crea el Documento con el archivo ya escrito. Devuelve el Documento."""
+    ruta_absoluta = default_storage.path(carga.ruta)
+    sha256 = _hash_hasta(carga, ruta_absoluta)
+
+    with transaction.atomic():
+        # El mismo archivo no debe terminar en dos documentos si se finaliza dos veces a la vez
+        carga = CargaFragmentada.objects.select_for_update().get(pk=carga.pk)
+        if carga.estado != 'en_curso':
+            return carga.documento
+
+        documento = Documento(
+            causa_id=carga.causa_id,
+            subido_por=carga.subido_por,
+            nombre=carga.nombre,
+            tipo=carga.tipo,
+            hash_archivo=sha256.hexdigest(),
+        )
+        # El archivo ya está en su ruta final: solo se guarda el nombre
+        documento.archivo.name = carga.ruta
+        documento.save()
+
+        carga.estado = 'completada'
+        carga.documento = documento
+        carga.save(update_fields=['estado', 'documento', 'actualizado_en'])
+
+    documento.guardar_huella()
+    with _lock:
+        _hashes.pop(str(carga.token), None)
+    return documento
+
+
+def cancelar_carga(carga, inactiva_desde=None):
+    """
+    Cancela la carga si sigue en curso y borra su archivo incompleto. Devuelve True si se canceló.
+    Con `inactiva_desde` solo se cancela si no ha recibido fragmentos desde ese momento.
+    """
+    en_curso = CargaFragmentada.objects.filter(pk=carga.pk, estado='en_curso')
+    if inactiva_desde is not None:
+        en_curso = en_curso.filter(actualizado_en__lt=inactiva_desde)
+    # Una carga ya completada comparte la ruta con el archivo de su Documento: nunca se borra
+    if not en_curso.update(estado='cancelada', actualizado_en=timezone.now()):
+        return False
+
+    with _lock:
+        _hashes.pop(str(carga.token), None)
+    if carga.ruta and default_storage.exists(carga.ruta):
+        default_storage.delete(carga.ruta)
+    return True
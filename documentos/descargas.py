@@ -0,0 +1,134 @@
+"""
+Descarga de archivos protegidos (documentos de la causa y PDF del expediente).
+
+MEDIA_ROOT no se publica: cada descarga pasa por una vista que revisa permisos y
+recién entonces entrega el archivo. Con DESCARGAS_SERVIDOR='nginx' (X-Accel-Redirect)
+o 'apache' (X-Sendfile) la vista solo indica qué archivo enviar y el servidor web
+entrega los bytes, sin ocupar un worker de Django. Sin servidor configurado se
+responde con FileResponse, aceptando Range (descargas reanudables, visor de PDF)
+y peticiones condicionales (ETag / Last-Modified).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+TAMANO_BLOQUE = 64 * 1024
+
+# Solo un rango por petición ("bytes=inicio-fin", "bytes=inicio-" o "bytes=-sufijo")
+_RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def puede_descargar(usuario, causa):
+    """Mismas reglas que el PDF del expediente: director y supervisor siempre, el estudiante solo sus causas."""
+    if usuario.rol in ['director', 'supervisor']:
+        return True
+    return usuario.rol == 'estudiante' and causa.responsable_id == usuario.pk
+
+
+def _rango_pedido(request, tamano, etag, ultima_modificacion):
+    """
+    (inicio, fin) del encabezado Range, None si corresponde enviar el archivo completo
+    o False si el rango no se puede satisfacer (416).
+    """
+    encontrado = _RANGO.match(request.META.get('HTTP_RANGE', '').strip())
+    if not encontrado:
+        # Sin Range, o con varios rangos / otra unidad: se ignora y va el archivo completo
+        return None
+
+    # If-Range: si el archivo cambió desde la copia parcial del cliente, va completo
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != ultima_modificacion:
+        return None
+
+    inicio, fin = encontrado.groups()
+    if not inicio:
+        if not fin:
+            return None
+        sufijo = int(fin)
+        if sufijo == 0 or tamano == 0:
+            return False
+        return max(tamano - sufijo, 0), tamano - 1
+
+    inicio = int(inicio)
+    if fin and int(fin) < inicio:
+        return None  # Rango mal formado: se ignora
+    if inicio >= tamano:
+        return False
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    return inicio, fin
+
+
+def _leer_rango(archivo, largo):
+    # El `with` cierra el archivo también si el cliente corta la descarga a mitad
+    with archivo:
+        while largo > 0:
+            bloque = archivo.read(min(TAMANO_BLOQUE, largo))
+            if not bloque:
+                break
+            largo -= len(bloque)
+            yield bloque
+
+
+def _respuesta_archivo(request, ruta, tamano, etag, ultima_modificacion, content_type):
+    rango = _rango_pedido(request, tamano, etag, ultima_modificacion)
+    if rango is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{tamano}'
+        return response
+
+    archivo = open(ruta, 'rb')
+    if rango is None:
+        response = FileResponse(archivo, content_type=content_type)
+    else:
+        inicio, fin = rango
+        archivo.seek(inicio)
+        response = StreamingHttpResponse(_leer_rango(archivo, fin - inicio + 1), status=206, content_type=content_type)
+        response['Content-Length'] = fin - inicio + 1
+        response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def servir_archivo(request, archivo, nombre, adjunto=False, content_type=None):
+    """
+    Respuesta para descargar `archivo` (un FieldFile) como `nombre`. Los permisos
+    ya deben estar revisados: aquí solo se decide quién entrega los bytes.
+    """
+    try:
+        estado = os.stat(archivo.path)
+    except FileNotFoundError:
+        raise Http404("El archivo no se encuentra en el servidor.")
+
+    ultima_modificacion = int(estado.st_mtime)
+    etag = quote_etag(f'{estado.st_size:x}-{estado.st_mtime_ns:x}')
+
+    no_modificado = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if no_modificado is not None:
+        return no_modificado
+
+    content_type = content_type or mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+
+    servidor = settings.DESCARGAS_SERVIDOR
+    if servidor == 'nginx':
+        # El location interno de nginx apunta a MEDIA_ROOT; nginx resuelve Range por su cuenta
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.DESCARGAS_PREFIJO_INTERNO + quote(archivo.name)
+    elif servidor == 'apache':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = archivo.path
+    else:
+        response = _respuesta_archivo(request, archivo.path, estado.st_size, etag, ultima_modificacion, content_type)
+
+    response['Content-Disposition'] = content_disposition_header(adjunto, nombre)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(ultima_modificacion)
+    # Documentos de clientes: ninguna caché compartida los guarda y el navegador revalida cada vez
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -1,5 +1,8 @@
+import os
+
 from django import forms
-from .models import Documento
+from django.conf import settings
+from .models import Documento, CargaFragmentada
 
 class DocumentoForm(forms.ModelForm):
     class Meta:
@@ -17,4 +20,23 @@ class DocumentoForm(forms.ModelForm):
         if archivo:
             if archivo.size > 10 * 1024 * 1024:
                 raise forms.ValidationError("El archivo es demasiado grande (Máx 10MB).")
-        return archivo
\ No newline at end of file
+        return archivo
+
+class CargaFragmentadaForm(forms.ModelForm):
+    """Datos con que se inicia una subida por partes (el archivo llega después, en fragmentos)."""
+    class Meta:
+        model = CargaFragmentada
+        fields = ['nombre', 'tipo', 'nombre_archivo', 'tamano']
+
+    def clean_nombre_archivo(self):
+        # Solo el nombre, sin rutas que vengan del cliente
+        return os.path.basename(self.cleaned_data['nombre_archivo'].replace('\\', '/'))
+
+    def clean_tamano(self):
+        tamano = self.cleaned_data['tamano']
+        maximo = settings.CARGA_TAMANO_MAXIMO
+        if tamano <= 0:
+            raise forms.ValidationError("El archivo está vacío.")
+        if tamano > maximo:
+            raise forms.ValidationError(f"El archivo es demasiado grande (Máx {maximo // (1024 ** 3)}GB).")
+        return tamano
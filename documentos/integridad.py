@@ -0,0 +1,186 @@
+"""
+Verificación de integridad de documentos en segundo plano.
+
+La vista de detalle de la causa solo lee el último resultado guardado en cada
+Documento (estado_integridad). El SHA-256 se vuelve a calcular en un pool de
+hilos, y solo cuando cambia la huella del archivo (tamaño / mtime) o cuando
+venció el intervalo de re-verificación configurado.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+# Bloques grandes: en volúmenes de red o discos lentos reduce el número de lecturas
+TAMANO_BUFFER_HASH = 8 * 1024 * 1024
+
+_executor = None
+_en_curso = set()
+_lock = threading.Lock()
+
+
+def _obtener_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'INTEGRIDAD_WORKERS', 2),
+                thread_name_prefix='integridad',
+            )
+    return _executor
+
+
+def _stat_archivo(doc):
+    try:
+        return os.stat(doc.archivo.path)
+    except FileNotFoundError:
+        return None
+
+
+def hashear_archivo(ruta, tamano_buffer=TAMANO_BUFFER_HASH):
+    """
+    Calcula el SHA-256 de un archivo reutilizando un único buffer grande.
+    Devuelve (hash, (tamaño, mtime_ns, inode)); lanza FileNotFoundError si no existe.
+    Es una función de módulo para poder ejecutarla en un ProcessPoolExecutor.
+    """
+    sha256 = hashlib.sha256()
+    buffer = bytearray(tamano_buffer)
+    vista = memoryview(buffer)
+
+    with open(ruta, 'rb', buffering=0) as f:
+        st = os.fstat(f.fileno())
+        while True:
+            leidos = f.readinto(buffer)
+            if not leidos:
+                break
+            sha256.update(vista[:leidos])
+
+    return sha256.hexdigest(), (st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def requiere_verificacion(doc, stat_actual):
+    """
+    Indica si hay que volver a calcular el hash del documento.
+    Se re-verifica si nunca se verificó, si la huella del archivo cambió
+    o si pasó el intervalo de re-verificación.
+    """
+    if doc.fecha_verificacion is None:
+        return True
+
+    if stat_actual is None:
+        # Si ya lo marcamos como perdido no hay nada nuevo que registrar
+        return doc.estado_integridad != 'perdido'
+
+    huella = (stat_actual.st_size, stat_actual.st_mtime_ns)
+    if huella != (doc.verificado_tamano, doc.verificado_mtime_ns):
+        return True
+
+    return intervalo_vencido(doc)
+
+
+def intervalo_vencido(doc):
+    if doc.fecha_verificacion is None:
+        return False
+    intervalo = timedelta(seconds=getattr(settings, 'INTEGRIDAD_INTERVALO_REVERIFICACION', 60 * 60 * 24))
+    return timezone.now() - doc.fecha_verificacion >= intervalo
+
+
+def verificar_documento(doc, usuario=None, forzar=False):
+    """
+    Verifica un documento y guarda el resultado en el modelo.
+    Devuelve el estado de integridad resultante.
+    """
+    from .models import Documento
+    from casos import bitacora
+
+    if not doc.archivo or not doc.hash_archivo:
+        return doc.estado_integridad
+
+    stat_actual = _stat_archivo(doc)
+    if not forzar and not requiere_verificacion(doc, stat_actual):
+        return doc.estado_integridad
+
+    # Si solo venció el intervalo, la huella no cambió: forzamos el hash completo
+    # para detectar cambios que no alteran tamaño ni mtime.
+    estricto = forzar or intervalo_vencido(doc)
+
+    # Desempaquetamos la tupla (Estado, Hash Actual)
+    es_valido, hash_actual = doc.verificar_integridad(estricto=estricto)
+
+    campos = {
+        'fecha_verificacion': timezone.now(),
+        'verificado_hash': hash_actual,
+        'verificado_tamano': stat_actual.st_size if stat_actual else None,
+        'verificado_mtime_ns': stat_actual.st_mtime_ns if stat_actual else None,
+    }
+
+    if es_valido is True:
+        campos['estado_integridad'] = 'integro'
+        # Autocuración: el archivo volvió a ser el original, limpiamos la bandera de error
+        if doc.hash_fallido:
+            campos['hash_fallido'] = None
+        # El contenido coincide: esta huella sirve para el camino rápido de verificar_integridad
+        if stat_actual and doc.huella_de(stat_actual) != (doc.huella_tamano, doc.huella_mtime_ns, doc.huella_inode):
+            campos['huella_tamano'], campos['huella_mtime_ns'], campos['huella_inode'] = doc.huella_de(stat_actual)
+
+    elif es_valido is None: # Archivo borrado físicamente
+        campos['estado_integridad'] = 'perdido'
+
+    else: # Hash no coincide (Modificado) o error de lectura
+        campos['estado_integridad'] = 'modificado'
+
+        # Lógica Anti-Spam de Bitácora
+        # Solo registramos si es una modificación NUEVA (hash distinto al último error)
+        if hash_actual != doc.hash_fallido:
+            bitacora.registrar(
+                causa=doc.causa_id,
+                usuario=usuario,
+                accion='nota',
+                detalle=f"ALERTA SEGURIDAD CRÍTICA: Hash inconsistente en documento ID {doc.id}. (Nuevo hash detectado)"
+            )
+            campos['hash_fallido'] = hash_actual
+
+    Documento.objects.filter(pk=doc.pk).update(**campos)
+    for campo, valor in campos.items():
+        setattr(doc, campo, valor)
+
+    return doc.estado_integridad
+
+
+def _tarea_verificacion(doc, usuario):
+    close_old_connections()
+    try:
+        verificar_documento(doc, usuario)
+    except Exception as e:
+        print(f"Error verificando integridad del documento {doc.pk}: {e}")
+    finally:
+        with _lock:
+            _en_curso.discard(doc.pk)
+        # Cada hilo del pool tiene su propia conexión, la liberamos al terminar
+        connections.close_all()
+
+
+def programar_verificacion(documentos, usuario=None):
+    """
+    Encola la verificación de los documentos en el pool de hilos.
+    Los documentos que ya tienen una verificación en curso se omiten.
+    """
+    documentos = [doc for doc in documentos if doc.archivo and doc.hash_archivo]
+
+    if getattr(settings, 'INTEGRIDAD_VERIFICACION_SINCRONA', False):
+        for doc in documentos:
+            verificar_documento(doc, usuario)
+        return
+
+    executor = _obtener_executor()
+    for doc in documentos:
+        with _lock:
+            if doc.pk in _en_curso:
+                continue
+            _en_curso.add(doc.pk)
+        executor.submit(_tarea_verificacion, doc, usuario)
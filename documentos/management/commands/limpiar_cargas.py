@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from documentos.cargas import cancelar_carga
+from documentos.models import CargaFragmentada
+
+
+class Command(BaseCommand):
+    help = 'Cancela las subidas por partes abandonadas y borra sus archivos incompletos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=48,
+                            help='Horas sin recibir fragmentos para considerar abandonada una subida.')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(hours=options['horas'])
+        abandonadas = CargaFragmentada.objects.filter(estado='en_curso', actualizado_en__lt=limite)
+
+        total = 0
+        for carga in abandonadas.iterator():
+            # Se vuelve a exigir la inactividad al cancelar: pudo llegar un fragmento o finalizarse entre medio
+            if cancelar_carga(carga, inactiva_desde=limite):
+                total += 1
+
+        self.stdout.write(self.style.SUCCESS(f'¡Limpieza finalizada! {total} subidas abandonadas canceladas.'))
@@ -1,8 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from casos.models import Causa
 import os
 import hashlib
+import uuid
 
 class Documento(models.Model):
     TIPOS_DOCUMENTO = (
@@ -43,6 +44,24 @@ class Documento(models.Model):
     hash_archivo = models.CharField(max_length=64, blank=True, null=True)
     hash_fallido = models.CharField(max_length=64, blank=True, null=True, editable=False)
 
+    # Resultado de la última verificación de integridad (ver documentos/integridad.py)
+    ESTADOS_INTEGRIDAD = (
+        ('pendiente', 'Pendiente de Verificación'),
+        ('integro', 'Íntegro'),
+        ('modificado', 'Modificado Externamente'),
+        ('perdido', 'Archivo No Encontrado'),
+    )
+    estado_integridad = models.CharField(max_length=20, choices=ESTADOS_INTEGRIDAD, default='pendiente', editable=False)
+    verificado_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
+    verificado_tamano = models.BigIntegerField(null=True, blank=True, editable=False)
+    verificado_mtime_ns = models.BigIntegerField(null=True, blank=True, editable=False)
+    fecha_verificacion = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # Huella (tamaño, mtime, inode) del archivo tomada cuando su contenido coincidía con hash_archivo
+    huella_tamano = models.BigIntegerField(null=True, blank=True, editable=False)
+    huella_mtime_ns = models.BigIntegerField(null=True, blank=True, editable=False)
+    huella_inode = models.BigIntegerField(null=True, blank=True, editable=False)
+
 
     def __str__(self):
         return f"Documento N° {self.causa_id} | Doc {self.orden_expediente} - {self.nombre}"
@@ -51,32 +70,75 @@ class Documento(models.Model):
     class Meta:
         ordering = ['causa', 'orden_expediente']
         unique_together = ('causa', 'orden_expediente')
+        indexes = [
+            # Documentos recientes (panel de inicio) y documentos de una causa por fecha
+            models.Index(fields=['causa', 'fecha_subida'], name='documento_causa_fecha_idx'),
+        ]
     def save(self, *args, **kwargs):
 
-        # 1 Numeracion automatica del documento dentro del caso
-        if not self.orden_expediente:
-            ultimo = Documento.objects.filter(causa=self.causa).order_by('-orden_expediente').first()
-            self.orden_expediente = ultimo.orden_expediente + 1 if ultimo else 1
-        
-        # 2. Hash SHA-256
+        # 1. Hash SHA-256
+        hash_nuevo = False
         if self.archivo and not self.hash_archivo:
-            sha256 = hashlib.sha256()
-            for chunk in self.archivo.chunks():
-                sha256.update(chunk)
-            self.hash_archivo = sha256.hexdigest()
+            # Si el archivo llegó por documentos/uploadhandlers.py el hash se calculó durante la subida
+            hash_subida = getattr(getattr(self.archivo, '_file', None), 'sha256', None)
+            if hash_subida:
+                self.hash_archivo = hash_subida
+            else:
+                sha256 = hashlib.sha256()
+                for chunk in self.archivo.chunks():
+                    sha256.update(chunk)
+                self.hash_archivo = sha256.hexdigest()
+            hash_nuevo = True
 
-        # 3. Auto-aprobación si quien sube es Director o Supervisor
+        # 2. Auto-aprobación si quien sube es Director o Supervisor
         if self.subido_por and self.subido_por.rol in ['director', 'supervisor']:
             if self.estado == 'pendiente':
                 self.estado = 'aprobado'
 
-        super().save(*args, **kwargs)
-    
-    def verificar_integridad(self):
+        # 3. Numeracion automatica del documento dentro del caso
+        # El número se reserva en la misma transacción que el INSERT: si la subida falla no quedan saltos
+        with transaction.atomic():
+            if not self.orden_expediente:
+                self.orden_expediente = Causa.siguiente_orden_documento(self.causa_id)
+            super().save(*args, **kwargs)
+
+        # 4. Huella del archivo ya escrito en disco (para verificar sin re-hashear)
+        if hash_nuevo:
+            self.guardar_huella()
+
+    @staticmethod
+    def huella_de(st):
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def guardar_huella(self, st=None):
+        """Registra la huella actual del archivo como la huella 'conocida como buena'."""
+        try:
+            st = st or os.stat(self.archivo.path)
+        except (FileNotFoundError, NotImplementedError):
+            return
+        self.huella_tamano, self.huella_mtime_ns, self.huella_inode = self.huella_de(st)
+        Documento.objects.filter(pk=self.pk).update(
+            huella_tamano=self.huella_tamano,
+            huella_mtime_ns=self.huella_mtime_ns,
+            huella_inode=self.huella_inode,
+        )
+
+    def verificar_integridad(self, estricto=False):
+        """
+        Devuelve la tupla (es_valido, hash_actual).
+        Si la huella (tamaño, mtime, inode) del archivo sigue siendo la tomada al
+        calcular el hash, se considera íntegro con un solo stat(). Con estricto=True
+        siempre se lee el archivo completo.
+        """
         if not self.archivo or not self.hash_archivo:
             return True, None
 
         try:
+            if not estricto and self.huella_tamano is not None:
+                huella_guardada = (self.huella_tamano, self.huella_mtime_ns, self.huella_inode)
+                if self.huella_de(os.stat(self.archivo.path)) == huella_guardada:
+                    return True, self.hash_archivo
+
             sha256 = hashlib.sha256()
             with open(self.archivo.path, 'rb') as f:
                 for chunk in f:
@@ -97,4 +159,40 @@ class Documento(models.Model):
         if self.archivo:
             if os.path.isfile(self.archivo.path):
                 os.remove(self.archivo.path)
-        super().delete(*args, **kwargs)
\ No newline at end of file
+        super().delete(*args, **kwargs)
+
+class CargaFragmentada(models.Model):
+    """
+    Subida por partes (reanudable) de un archivo grande. Los fragmentos se escriben
+    directamente en la ruta final del archivo y, al terminar, se crea el Documento
+    apuntando a ese mismo archivo (ver documentos/cargas.py).
+    """
+    ESTADOS = (
+        ('en_curso', 'En Curso'),
+        ('completada', 'Completada'),
+        ('cancelada', 'Cancelada'),
+    )
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    causa = models.ForeignKey(Causa, on_delete=models.CASCADE, related_name='cargas_fragmentadas')
+    subido_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+
+    nombre = models.CharField(max_length=255, verbose_name="Nombre / Carátula del Escrito")
+    tipo = models.CharField(max_length=20, choices=Documento.TIPOS_DOCUMENTO, default='prueba')
+    nombre_archivo = models.CharField(max_length=255)
+    tamano = models.BigIntegerField(help_text="Tamaño total del archivo en bytes")
+
+    ruta = models.CharField(max_length=255, editable=False) # relativa a MEDIA_ROOT
+    recibido = models.BigIntegerField(default=0, editable=False) # bytes escritos (siguiente offset esperado)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='en_curso')
+    documento = models.OneToOneField(Documento, on_delete=models.SET_NULL, null=True, blank=True, related_name='carga')
+
+    creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Carga {self.nombre_archivo} ({self.recibido}/{self.tamano} bytes)"
+
+    @property
+    def completa(self):
+        return self.recibido >= self.tamano
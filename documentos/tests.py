@@ -1,3 +1,322 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.test import TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.urls import reverse
+from django.utils import timezone
+
+from casos.models import Causa
+from personas.models import Persona, Usuario
+from . import cargas, integridad
+from .models import CargaFragmentada, Documento
 
 # Create your tests here.
+
+def crear_causa(rol_rit='C-900-2025'):
+    cliente = Persona.objects.create(rut=f'{rol_rit}-K', nombres='Ana', apellidos='Rivas')
+    return Causa.objects.create(rol_rit=rol_rit, caratula='Rivas con Inmobiliaria', cliente=cliente)
+
+
+class OrdenExpedienteTests(TestCase):
+
+    def test_numeracion_continua_desde_documentos_existentes(self):
+        causa = crear_causa()
+        Documento.objects.create(causa=causa, nombre='Anterior al contador', orden_expediente=7)
+
+        nuevo = Documento.objects.create(causa=causa, nombre='Demanda')
+        self.assertEqual(nuevo.orden_expediente, 8)
+
+        # Un save() de la causa con datos viejos no devuelve el contador a un valor anterior
+        causa.caratula = 'Rivas con Inmobiliaria SpA'
+        causa.save()
+        self.assertEqual(Documento.objects.create(causa=causa, nombre='Contestación').orden_expediente, 9)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class OrdenExpedienteConcurrenciaTests(TransactionTestCase):
+    """Subidas simultáneas a la misma causa reciben números distintos y consecutivos."""
+
+    SUBIDAS = 20
+
+    def test_subidas_paralelas_sin_conflictos(self):
+        causa = crear_causa()
+        subidor = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        errores = []
+        barrera = threading.Barrier(self.SUBIDAS)
+
+        def subir(i):
+            try:
+                barrera.wait()
+                Documento.objects.create(causa_id=causa.pk, subido_por=subidor, nombre=f'Escrito {i}')
+            except Exception as e:
+                errores.append(e)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=subir, args=(i,)) for i in range(self.SUBIDAS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(errores, [])
+        ordenes = sorted(Documento.objects.filter(causa=causa).values_list('orden_expediente', flat=True))
+        self.assertEqual(ordenes, list(range(1, self.SUBIDAS + 1)))
+
+
+class DescargaDocumentoTests(TestCase):
+    """Los documentos se descargan con permisos, por rangos y con revalidación condicional."""
+
+    CONTENIDO = bytes(range(256)) * 40
+
+    @classmethod
+    def setUpClass(cls):
+        # Antes de super(): setUpTestData ya escribe el archivo en MEDIA_ROOT
+        cls.media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media, DESCARGAS_SERVIDOR=''))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cls.otro = Usuario.objects.create_user(
+            username='otro', password='clave-segura-123', rut='87654321-4',
+            email='otro@clinica.cl', rol='estudiante'
+        )
+        causa = crear_causa()
+        causa.responsable = cls.estudiante
+        causa.save()
+        cls.doc = Documento.objects.create(
+            causa=causa, subido_por=cls.estudiante, nombre='Demanda',
+            archivo=SimpleUploadedFile('demanda.pdf', cls.CONTENIDO, content_type='application/pdf')
+        )
+        cls.url = reverse('documentos:descargar', kwargs={'pk': cls.doc.pk})
+
+    def test_estudiante_de_otra_causa_no_descarga(self):
+        self.client.force_login(self.otro)
+        response = self.client.get(self.url)
+        self.assertRedirects(response, reverse('casos:detalle', kwargs={'pk': self.doc.causa_id}),
+                             fetch_redirect_response=False)
+
+    def test_rango_y_peticion_condicional(self):
+        self.client.force_login(self.estudiante)
+
+        completo = self.client.get(self.url)
+        self.assertEqual(completo.status_code, 200)
+        self.assertEqual(b''.join(completo.streaming_content), self.CONTENIDO)
+        self.assertEqual(completo['Accept-Ranges'], 'bytes')
+
+        parcial = self.client.get(self.url, headers={'Range': 'bytes=100-199'})
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(parcial['Content-Range'], f'bytes 100-199/{len(self.CONTENIDO)}')
+        self.assertEqual(b''.join(parcial.streaming_content), self.CONTENIDO[100:200])
+
+        sufijo = self.client.get(self.url, headers={'Range': 'bytes=-10'})
+        self.assertEqual(b''.join(sufijo.streaming_content), self.CONTENIDO[-10:])
+
+        fuera = self.client.get(self.url, headers={'Range': f'bytes={len(self.CONTENIDO)}-'})
+        self.assertEqual(fuera.status_code, 416)
+
+        no_modificado = self.client.get(self.url, headers={'If-None-Match': completo['ETag']})
+        self.assertEqual(no_modificado.status_code, 304)
+
+    @override_settings(DESCARGAS_SERVIDOR='nginx', DESCARGAS_PREFIJO_INTERNO='/media-protegida/')
+    def test_nginx_recibe_la_ruta_interna(self):
+        self.client.force_login(self.estudiante)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/media-protegida/{self.doc.archivo.name}')
+        self.assertEqual(response.content, b'')
+
+
+class CargaFragmentadaTests(TestCase):
+    """Subida por partes: reintentos y offsets equivocados no alteran el archivo ni su hash."""
+
+    CONTENIDO = bytes(range(256)) * 64
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cls.causa = crear_causa()
+
+    def enviar(self, url, offset, datos):
+        return self.client.put(f'{url}?offset={offset}', data=datos, content_type='application/octet-stream')
+
+    def test_reintento_y_offset_equivocado(self):
+        self.client.force_login(self.estudiante)
+        inicio = self.client.post(reverse('documentos:iniciar_carga', kwargs={'caso_id': self.causa.pk}), {
+            'nombre': 'Peritaje', 'tipo': 'otro', 'nombre_archivo': 'peritaje.pdf', 'tamano': len(self.CONTENIDO),
+        })
+        self.assertEqual(inicio.status_code, 201)
+        url = inicio.json()['url']
+        mitad = len(self.CONTENIDO) // 2
+
+        primero = self.enviar(url, 0, self.CONTENIDO[:mitad])
+        self.assertEqual(primero.json()['recibido'], mitad)
+
+        # El cliente no recibió la respuesta y reenvía el mismo fragmento
+        reintento = self.enviar(url, 0, self.CONTENIDO[:mitad])
+        self.assertEqual(reintento.status_code, 409)
+        self.assertEqual(reintento.json()['recibido'], mitad)
+
+        equivocado = self.enviar(url, mitad + 10, self.CONTENIDO[mitad + 10:])
+        self.assertEqual(equivocado.status_code, 409)
+
+        # Otro worker continúa sin el hash en memoria: se reconstruye desde el archivo
+        cargas._hashes.clear()
+        ultimo = self.enviar(url, mitad, self.CONTENIDO[mitad:])
+        self.assertEqual(ultimo.json()['recibido'], len(self.CONTENIDO))
+
+        final = self.client.post(reverse('documentos:finalizar_carga', kwargs={'token': inicio.json()['token']}))
+        documento = Documento.objects.get(pk=final.json()['documento'])
+        with documento.archivo.open('rb') as f:
+            en_disco = f.read()
+        self.assertEqual(en_disco, self.CONTENIDO)
+        self.assertEqual(documento.hash_archivo, hashlib.sha256(en_disco).hexdigest())
+        self.assertEqual(CargaFragmentada.objects.get().estado, 'completada')
+
+        # Cancelar una carga ya finalizada no puede borrar el archivo del Documento
+        cancelar = self.client.delete(url)
+        self.assertEqual(cancelar.status_code, 409)
+        self.assertEqual(cancelar.json()['estado'], 'completada')
+        self.assertTrue(os.path.exists(documento.archivo.path))
+
+    def test_limpieza_solo_cancela_cargas_inactivas(self):
+        self.client.force_login(self.estudiante)
+        inicio = self.client.post(reverse('documentos:iniciar_carga', kwargs={'caso_id': self.causa.pk}), {
+            'nombre': 'Peritaje', 'tipo': 'otro', 'nombre_archivo': 'peritaje.pdf', 'tamano': len(self.CONTENIDO),
+        })
+        carga = CargaFragmentada.objects.get(token=inicio.json()['token'])
+        hace_tres_dias = timezone.now() - timedelta(days=3)
+
+        # Iniciada hace días pero sigue recibiendo fragmentos: no está abandonada
+        CargaFragmentada.objects.filter(pk=carga.pk).update(actualizado_en=hace_tres_dias)
+        self.enviar(inicio.json()['url'], 0, self.CONTENIDO[:1024])
+        call_command('limpiar_cargas', horas=48, stdout=io.StringIO())
+        carga.refresh_from_db()
+        self.assertEqual(carga.estado, 'en_curso')
+
+        CargaFragmentada.objects.filter(pk=carga.pk).update(actualizado_en=hace_tres_dias)
+        call_command('limpiar_cargas', horas=48, stdout=io.StringIO())
+        carga.refresh_from_db()
+        self.assertEqual(carga.estado, 'cancelada')
+        self.assertFalse(os.path.exists(os.path.join(self.media, carga.ruta)))
+
+
+@override_settings(INTEGRIDAD_VERIFICACION_SINCRONA=True)
+class VerificacionIntegridadTests(TestCase):
+    """El resultado queda guardado en el documento y solo se vuelve a hashear si el archivo cambió."""
+
+    CONTENIDO = b'%PDF-1.4 demanda original' * 100
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+        super().setUpClass()
+
+    def setUp(self):
+        self.doc = Documento.objects.create(
+            causa=crear_causa(), nombre='Demanda',
+            archivo=SimpleUploadedFile('demanda.pdf', self.CONTENIDO, content_type='application/pdf')
+        )
+
+    def test_integro_modificado_y_perdido(self):
+        integridad.programar_verificacion([self.doc])
+        self.assertEqual(Documento.objects.get(pk=self.doc.pk).estado_integridad, 'integro')
+
+        # Sin cambios en el archivo no se vuelve a leer
+        with mock.patch.object(Documento, 'verificar_integridad') as verificar:
+            integridad.programar_verificacion([self.doc])
+        verificar.assert_not_called()
+
+        with open(self.doc.archivo.path, 'ab') as f:
+            f.write(b'agregado')
+        integridad.programar_verificacion([self.doc])
+        modificado = Documento.objects.get(pk=self.doc.pk)
+        self.assertEqual(modificado.estado_integridad, 'modificado')
+        self.assertEqual(modificado.hash_fallido, hashlib.sha256(self.CONTENIDO + b'agregado').hexdigest())
+
+        os.remove(self.doc.archivo.path)
+        integridad.programar_verificacion([self.doc])
+        self.assertEqual(Documento.objects.get(pk=self.doc.pk).estado_integridad, 'perdido')
+
+    def test_huella_evita_releer_y_estricto_lee_igual(self):
+        self.assertEqual(self.doc.huella_de(os.stat(self.doc.archivo.path)),
+                         (self.doc.huella_tamano, self.doc.huella_mtime_ns, self.doc.huella_inode))
+
+        # Mismo tamaño y mtime restaurado: la huella no lo detecta, la lectura completa sí
+        st = os.stat(self.doc.archivo.path)
+        with open(self.doc.archivo.path, 'r+b') as f:
+            f.write(b'X')
+        os.utime(self.doc.archivo.path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+        with mock.patch('builtins.open', side_effect=AssertionError('no debía leer el archivo')):
+            self.assertEqual(self.doc.verificar_integridad(), (True, self.doc.hash_archivo))
+        es_valido, hash_actual = self.doc.verificar_integridad(estricto=True)
+        self.assertFalse(es_valido)
+        self.assertEqual(hash_actual, hashlib.sha256(b'X' + self.CONTENIDO[1:]).hexdigest())
+
+
+class HashSubidaTests(TestCase):
+    """El SHA-256 se calcula mientras llega el archivo: Documento.save no vuelve a leerlo."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media, ignore_errors=True)
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media))
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.estudiante = Usuario.objects.create_user(
+            username='estudiante', password='clave-segura-123', rut='12345678-5',
+            email='estudiante@clinica.cl', rol='estudiante'
+        )
+        cls.causa = crear_causa()
+
+    # Con 1 KB en memoria, el archivo grande pasa por el handler de archivo temporal
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_hash_en_memoria_y_en_temporal(self):
+        self.client.force_login(self.estudiante)
+        url = reverse('documentos:subir', kwargs={'caso_id': self.causa.pk})
+
+        for nombre, contenido in [('chico.pdf', b'a' * 100), ('grande.pdf', bytes(range(256)) * 100)]:
+            with mock.patch('documentos.models.hashlib') as hashlib_modelo:
+                response = self.client.post(url, {
+                    'nombre': nombre, 'tipo': 'escrito',
+                    'archivo': SimpleUploadedFile(nombre, contenido, content_type='application/pdf'),
+                })
+            self.assertEqual(response.status_code, 302)
+            hashlib_modelo.sha256.assert_not_called()
+            documento = Documento.objects.get(nombre=nombre)
+            self.assertEqual(documento.hash_archivo, hashlib.sha256(contenido).hexdigest())
+            with documento.archivo.open('rb') as f:
+                self.assertEqual(f.read(), contenido)
@@ -0,0 +1,41 @@
+"""
+Upload handlers que calculan el SHA-256 mientras los bytes llegan.
+
+Reemplazan a los handlers por defecto de Django (ver FILE_UPLOAD_HANDLERS en
+settings.py). El archivo subido queda con el atributo `sha256`, que
+Documento.save usa en lugar de volver a leer el archivo completo.
+"""
+import hashlib
+
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+
+class HashSHA256Mixin:
+    def new_file(self, *args, **kwargs):
+        # Antes de super(): el handler en memoria lanza StopFutureHandlers dentro de new_file
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        resto = super().receive_data_chunk(raw_data, start)
+        # Si el handler devuelve los datos es porque no los guardó (los pasa al siguiente)
+        if resto is None:
+            self.sha256.update(raw_data)
+        return resto
+
+    def file_complete(self, file_size):
+        archivo = super().file_complete(file_size)
+        if archivo is not None:
+            archivo.sha256 = self.sha256.hexdigest()
+        return archivo
+
+
+class HashMemoryFileUploadHandler(HashSHA256Mixin, MemoryFileUploadHandler):
+    """Archivos pequeños (hasta FILE_UPLOAD_MAX_MEMORY_SIZE), igual que el handler de Django."""
+
+
+class HashTemporaryFileUploadHandler(HashSHA256Mixin, TemporaryFileUploadHandler):
+    """
+    Archivos grandes: se escriben a un temporal mientras se hashean. FileSystemStorage
+    luego mueve (rename) el temporal a MEDIA_ROOT, por lo que el contenido no se vuelve a leer.
+    """
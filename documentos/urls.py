@@ -8,5 +8,9 @@ urlpatterns = [
     # path('subir/', views.subir_documento_general, name='subir_general'), # /documentos/subir/
     # path('subir/caso/<int:caso_id>/', views.subir_documento_caso, name='subir'),
     path('subir/<int:caso_id>/', views.SubirDocumentoView.as_view(), name='subir'),
+    path('subir/<int:caso_id>/cargas/', views.IniciarCargaView.as_view(), name='iniciar_carga'),
+    path('cargas/<uuid:token>/', views.CargaFragmentadaView.as_view(), name='carga'),
+    path('cargas/<uuid:token>/finalizar/', views.FinalizarCargaView.as_view(), name='finalizar_carga'),
+    path('<int:pk>/archivo/', views.DescargarDocumentoView.as_view(), name='descargar'),
     path('estado/<int:pk>/<str:accion>/', views.CambiarEstadoDocumentoView.as_view(), name='cambiar_estado'),
 ]
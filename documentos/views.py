@@ -1,3 +1,5 @@
+import os
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import CreateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin
@@ -5,9 +7,15 @@ from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
 
-from .models import Documento
-from .forms import DocumentoForm
-from casos.models import Causa, Bitacora
+from django.conf import settings
+from django.http import JsonResponse
+
+from .models import Documento, CargaFragmentada
+from .forms import DocumentoForm, CargaFragmentadaForm
+from .cargas import ConflictoOffset, iniciar_carga, escribir_fragmento, finalizar_carga, cancelar_carga
+from .descargas import puede_descargar, servir_archivo
+from casos.models import Causa
+from casos import bitacora
 from personas.mixins import RolRequiredMixin
 
 class SubirDocumentoView(RolRequiredMixin, LoginRequiredMixin, CreateView):
@@ -23,6 +31,8 @@ class SubirDocumentoView(RolRequiredMixin, LoginRequiredMixin, CreateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['caso'] = self.causa
+        # Archivos más grandes que un fragmento se suben por partes (documentos/cargas.py)
+        context['tamano_fragmento'] = settings.CARGA_FRAGMENTO_TAMANO
         return context
 
     def form_valid(self, form):
@@ -31,7 +41,7 @@ class SubirDocumentoView(RolRequiredMixin, LoginRequiredMixin, CreateView):
         documento.subido_por = self.request.user
         documento.save()
 
-        Bitacora.objects.create(
+        bitacora.registrar(
             causa=self.causa,
             usuario=self.request.user,
             accion='archivo',
@@ -71,7 +81,7 @@ class CambiarEstadoDocumentoView(RolRequiredMixin, LoginRequiredMixin, View):
         doc.save()
 
         # Registro en Bitácora
-        Bitacora.objects.create(
+        bitacora.registrar(
             causa=doc.causa,
             usuario=request.user,
             accion='actualizacion', # O 'nota'
@@ -80,3 +90,112 @@ class CambiarEstadoDocumentoView(RolRequiredMixin, LoginRequiredMixin, View):
 
         messages.success(request, msg)
         return redirect('casos:detalle', pk=doc.causa.pk)
+
+
+# -------- Subidas por partes (archivos grandes, reanudables)
+
+def _registrar_subida(documento, usuario):
+    bitacora.registrar(
+        causa=documento.causa_id,
+        usuario=usuario,
+        accion='archivo',
+        detalle=f"Se subió documento: {documento.nombre} (Documento N° {documento.orden_expediente}) - Estado: {documento.get_estado_display()}"
+    )
+
+def _estado_carga(carga):
+    return {
+        'token': str(carga.token),
+        'recibido': carga.recibido,
+        'tamano': carga.tamano,
+        'estado': carga.estado,
+        'tamano_fragmento': settings.CARGA_FRAGMENTO_TAMANO,
+        'url': reverse('documentos:carga', kwargs={'token': carga.token}),
+    }
+
+class IniciarCargaView(RolRequiredMixin, LoginRequiredMixin, View):
+    roles_permitidos = ['director', 'supervisor', 'estudiante']
+
+    def post(self, request, caso_id):
+        causa = get_object_or_404(Causa, pk=caso_id)
+        form = CargaFragmentadaForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errores': form.errors}, status=400)
+
+        carga = form.save(commit=False)
+        carga.causa = causa
+        carga.subido_por = request.user
+        iniciar_carga(carga)
+        return JsonResponse(_estado_carga(carga), status=201)
+
+class CargaFragmentadaView(LoginRequiredMixin, View):
+    """GET: estado para reanudar. PUT ?offset=N: escribe un fragmento. DELETE: cancela."""
+
+    def obtener_carga(self, token):
+        # Solo quien inició la carga puede continuarla
+        return get_object_or_404(CargaFragmentada, token=token, subido_por=self.request.user)
+
+    def get(self, request, token):
+        return JsonResponse(_estado_carga(self.obtener_carga(token)))
+
+    def put(self, request, token):
+        carga = self.obtener_carga(token)
+        if carga.estado != 'en_curso':
+            return JsonResponse(_estado_carga(carga), status=409)
+
+        try:
+            offset = int(request.GET.get('offset', ''))
+            largo = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Offset o largo inválido.'}, status=400)
+
+        if largo > settings.CARGA_FRAGMENTO_MAXIMO:
+            return JsonResponse({'error': 'Fragmento demasiado grande.'}, status=413)
+
+        try:
+            escribir_fragmento(carga, offset, request, largo)
+        except ConflictoOffset:
+            carga.refresh_from_db()
+            return JsonResponse(_estado_carga(carga), status=409)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        return JsonResponse(_estado_carga(carga))
+
+    def delete(self, request, token):
+        carga = self.obtener_carga(token)
+        cancelado = carga.estado == 'en_curso' and cancelar_carga(carga)
+        carga.refresh_from_db()
+        return JsonResponse(_estado_carga(carga), status=200 if cancelado else 409)
+
+class FinalizarCargaView(LoginRequiredMixin, View):
+    def post(self, request, token):
+        carga = get_object_or_404(CargaFragmentada, token=token, subido_por=request.user)
+
+        if carga.estado == 'cancelada' or not carga.completa:
+            return JsonResponse(_estado_carga(carga), status=409)
+
+        ya_finalizada = carga.estado == 'completada'
+        documento = finalizar_carga(carga)
+        if not ya_finalizada:
+            _registrar_subida(documento, request.user)
+            messages.success(request, "Documento subido. Queda pendiente de revisión por el Supervisor.")
+
+        return JsonResponse({
+            'documento': documento.pk,
+            'url': reverse('casos:detalle', kwargs={'pk': documento.causa_id}),
+        })
+
+
+# -------- Descarga con permisos
+
+class DescargarDocumentoView(LoginRequiredMixin, View):
+    """Entrega el archivo del documento (en línea, o como adjunto con ?descargar=1)."""
+    def get(self, request, pk):
+        doc = get_object_or_404(Documento.objects.select_related('causa'), pk=pk)
+
+        if not puede_descargar(request.user, doc.causa):
+            messages.error(request, "No tienes permiso para descargar este documento.")
+            return redirect('casos:detalle', pk=doc.causa_id)
+
+        return servir_archivo(request, doc.archivo, os.path.basename(doc.archivo.name),
+                              adjunto='descargar' in request.GET)
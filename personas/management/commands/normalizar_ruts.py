@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from personas.models import Persona, normalizar_rut
+
+
+class Command(BaseCommand):
+    help = 'Calcula rut_normalizado de las personas registradas antes de que existiera la columna.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Personas por bulk_update.')
+
+    def handle(self, *args, **options):
+        pendientes = []
+        actualizadas = 0
+
+        for persona in Persona.objects.only('id', 'rut', 'rut_normalizado').iterator(chunk_size=options['lote']):
+            normalizado = normalizar_rut(persona.rut)
+            if persona.rut_normalizado != normalizado:
+                persona.rut_normalizado = normalizado
+                pendientes.append(persona)
+
+            if len(pendientes) >= options['lote']:
+                Persona.objects.bulk_update(pendientes, ['rut_normalizado'])
+                actualizadas += len(pendientes)
+                pendientes = []
+
+        Persona.objects.bulk_update(pendientes, ['rut_normalizado'])
+        actualizadas += len(pendientes)
+
+        self.stdout.write(self.style.SUCCESS(f'RUT normalizado en {actualizadas} personas.'))
@@ -1,3 +1,5 @@
+import re
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from .validators import solo_numeros
@@ -21,8 +23,14 @@ class Usuario(AbstractUser):
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.get_rol_display()})"
 
+def normalizar_rut(rut):
+    """Llave de búsqueda del RUT: solo cuerpo y dígito verificador ('12.345.678-k' -> '12345678K')."""
+    return re.sub(r'[^0-9K]', '', (rut or '').upper())
+
 class Persona(models.Model):
     rut = models.CharField(max_length=12, unique=True, verbose_name='RUT')
+    # Se calcula en save(): permite buscar el RUT como lo escriba el usuario (con o sin puntos ni guion)
+    rut_normalizado = models.CharField(max_length=12, db_index=True, editable=False, default='')
     nombres = models.CharField(max_length=100)
     apellidos = models.CharField(max_length=100)
     email = models.EmailField(blank=True, null=True, unique=True)
@@ -31,5 +39,21 @@ class Persona(models.Model):
     fecha_registro = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True, verbose_name="Activo")
     
+    class Meta:
+        indexes = [
+            # Listado de personas paginado por cursor (PersonaListView)
+            models.Index(fields=['fecha_registro', 'id'], name='persona_registro_id_idx'),
+            # Búsqueda por prefijo del nombre
+            models.Index(fields=['apellidos', 'nombres'], name='persona_apellidos_idx'),
+            models.Index(fields=['nombres'], name='persona_nombres_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.rut_normalizado = normalizar_rut(self.rut)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'rut' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'rut_normalizado'}
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"{self.nombres} {self.apellidos} ({self.rut})"
\ No newline at end of file
+        return f"{self.nombres} {self.apellidos} ({self.rut})"
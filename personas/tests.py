@@ -1,3 +1,43 @@
 from django.test import TestCase
+from django.urls import reverse
+
+from .models import Persona, Usuario
 
 # Create your tests here.
+
+class DirectorioPersonasTests(TestCase):
+    """El directorio se busca por RUT (en cualquier formato) o por comienzo del nombre, y se pagina."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.secretaria = Usuario.objects.create_user(
+            username='secretaria', password='clave-segura-123', rut='11111111-1',
+            email='secretaria@clinica.cl', rol='secretaria'
+        )
+        Persona.objects.create(rut='12.345.678-K', nombres='Juana', apellidos='Pérez Soto')
+        Persona.objects.create(rut='9.876.543-2', nombres='Pedro', apellidos='González')
+        for i in range(30):
+            Persona.objects.create(rut=f'20.000.{i:03d}-1', nombres=f'Cliente {i}', apellidos='Prueba')
+
+    def setUp(self):
+        self.client.force_login(self.secretaria)
+        self.url = reverse('personas:lista_clientes')
+
+    def buscar(self, q):
+        return [p.apellidos for p in self.client.get(self.url, {'q': q}).context['personas']]
+
+    def test_busqueda_por_rut_y_nombre(self):
+        self.assertEqual(Persona.objects.get(rut='12.345.678-K').rut_normalizado, '12345678K')
+        self.assertEqual(self.buscar('12345678-k'), ['Pérez Soto'])
+        self.assertEqual(self.buscar('12.345'), ['Pérez Soto'])
+        self.assertEqual(self.buscar('gonz'), ['González'])
+        self.assertEqual(self.buscar('juana pér'), ['Pérez Soto'])
+        self.assertEqual(self.buscar('soto'), [])
+
+    def test_paginacion_por_cursor(self):
+        primera = self.client.get(self.url)
+        self.assertEqual(len(primera.context['personas']), 25)
+
+        segunda = self.client.get(self.url, {'despues': primera.context['cursor_siguiente']})
+        self.assertEqual(len(segunda.context['personas']), 7)
+        self.assertIsNone(segunda.context['cursor_siguiente'])
@@ -1,16 +1,34 @@
 # ejemplos MUY básicos, solo para probar que las urls funcionan
 
 # personas/views.py
+import re
+
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.urls import reverse_lazy
 from django.views.generic import ListView, CreateView, UpdateView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from .models import Usuario, Persona
+from django.db.models import Q
+from casos.utils import paginar_por_cursor
+from .models import Usuario, Persona, normalizar_rut
 from .forms import PersonaForm, UsuarioForm
 from django.views import View
 from .mixins import SoloDirectorMixin, SoloStaffMixin, RolRequiredMixin
 
+def filtro_busqueda_persona(q):
+    """
+    Búsqueda por prefijo (usa índices, sin LIKE '%...%'): si lo escrito parece un RUT
+    se compara con rut_normalizado; si no, cada palabra debe ser el comienzo del
+    nombre o del apellido.
+    """
+    if re.fullmatch(r'[\d.\-\s]+[kK]?', q):
+        return Q(rut_normalizado__startswith=normalizar_rut(q))
+
+    filtro = Q()
+    for palabra in q.split():
+        filtro &= Q(apellidos__istartswith=palabra) | Q(nombres__istartswith=palabra)
+    return filtro
+
 # --- Vistas para USUARIOS (Staff/Estudiantes) ---
 class UsuarioListView(SoloDirectorMixin, LoginRequiredMixin, ListView):
     model = Usuario
@@ -94,14 +112,34 @@ class PersonaListView(LoginRequiredMixin, ListView):
     model = Persona
     template_name = 'personas/lista_clientes.html'
     context_object_name = 'personas'
-    ordering = ['-fecha_registro']
+    paginar_de = 25
     
     def get_queryset(self):
         queryset = super().get_queryset()
         if self.request.user.rol == 'estudiante':
             queryset = queryset.filter(is_active=True)
+
+        q = self.request.GET.get('q', '').strip()
+        if q:
+            queryset = queryset.filter(filtro_busqueda_persona(q))
         return queryset
 
+    def get_context_data(self, **kwargs):
+        # Paginación por cursor sobre (fecha_registro, id): las páginas profundas no usan OFFSET
+        personas, cursor_siguiente = paginar_por_cursor(
+            self.object_list, self.request.GET.get('despues'), 'fecha_registro', self.paginar_de
+        )
+        kwargs['object_list'] = personas
+        context = super().get_context_data(**kwargs)
+        context['cursor_siguiente'] = cursor_siguiente
+        context['es_primera_pagina'] = not self.request.GET.get('despues')
+
+        # Filtros actuales para conservarlos al cambiar de página
+        filtros = self.request.GET.copy()
+        filtros.pop('despues', None)
+        context['filtros_query'] = filtros.urlencode()
+        return context
+
 class PersonaCreateView(RolRequiredMixin, LoginRequiredMixin, CreateView):
     roles_permitidos = ['director', 'secretaria', 'admin']
     model = Persona